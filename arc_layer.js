@@ -0,0 +1,427 @@
+// Batched canvas renderer for the geographic map's trade arcs
+// Arc geometry is sampled once per link, then every visible arc is drawn in a
+// single WebGL call (or one Canvas 2D stroke per colour and width when WebGL is
+// unavailable). Hover and animation go to a separate overlay canvas, so they
+// never redraw the arcs, and hit-testing uses a uniform grid over the arcs'
+// segments instead of per-arc DOM events.
+
+// Points sampled along each arc
+const ARC_SEGMENTS = 16;
+
+// Radius of the arcs relative to the distance between their endpoints
+const ARC_RADIUS_SCALE = 1.5;
+
+// Side of a hit-test grid cell, in map pixels
+const ARC_GRID_CELL = 24;
+
+// How close the pointer must be to an arc to hover it, in screen pixels
+const ARC_HIT_TOLERANCE = 3;
+
+// Opacity of the arcs (the hovered arc is drawn opaque)
+const ARC_OPACITY = 0.6;
+
+// Largest arcs that get animated flow markers
+const MAX_ANIMATED_ARCS = 300;
+
+const ARC_VERTEX_SHADER = `
+attribute vec2 a_position;
+attribute vec2 a_offset;
+attribute vec4 a_color;
+uniform vec3 u_transform;
+uniform vec2 u_resolution;
+varying vec4 v_color;
+void main() {
+    vec2 screen = a_position * u_transform.z + u_transform.xy + a_offset;
+    vec2 clip = screen / u_resolution * 2.0 - 1.0;
+    gl_Position = vec4(clip.x, -clip.y, 0.0, 1.0);
+    v_color = a_color;
+}`;
+
+const ARC_FRAGMENT_SHADER = `
+precision mediump float;
+uniform float u_opacity;
+varying vec4 v_color;
+void main() {
+    gl_FragColor = vec4(v_color.rgb, v_color.a * u_opacity);
+}`;
+
+// Points along the SVG arc `M s A r,r 0 0,1 t` with r = ARC_RADIUS_SCALE * |t - s|,
+// as a flat [x0, y0, x1, y1, ...] array of ARC_SEGMENTS + 1 points
+function sampleArc(source, target) {
+    const points = new Float32Array((ARC_SEGMENTS + 1) * 2);
+    const halfX = (source[0] - target[0]) / 2;
+    const halfY = (source[1] - target[1]) / 2;
+    const halfSquared = halfX * halfX + halfY * halfY;
+    if (halfSquared === 0) {
+        for (let i = 0; i <= ARC_SEGMENTS; i++) {
+            points[2 * i] = source[0];
+            points[2 * i + 1] = source[1];
+        }
+        return points;
+    }
+
+    // Center of the circle (SVG arc implementation notes, large-arc 0 and sweep 1)
+    const radius = ARC_RADIUS_SCALE * 2 * Math.sqrt(halfSquared);
+    const coefficient = Math.sqrt(Math.max(0, radius * radius - halfSquared) / halfSquared);
+    const centerX = coefficient * halfY + (source[0] + target[0]) / 2;
+    const centerY = -coefficient * halfX + (source[1] + target[1]) / 2;
+
+    const start = Math.atan2(source[1] - centerY, source[0] - centerX);
+    let sweep = Math.atan2(target[1] - centerY, target[0] - centerX) - start;
+    if (sweep < 0) sweep += 2 * Math.PI;
+    for (let i = 0; i <= ARC_SEGMENTS; i++) {
+        const angle = start + sweep * i / ARC_SEGMENTS;
+        points[2 * i] = centerX + radius * Math.cos(angle);
+        points[2 * i + 1] = centerY + radius * Math.sin(angle);
+    }
+    return points;
+}
+
+// Distance from (x, y) to the segment (ax, ay)-(bx, by)
+function segmentDistance(x, y, ax, ay, bx, by) {
+    const dx = bx - ax;
+    const dy = by - ay;
+    const lengthSquared = dx * dx + dy * dy;
+    const t = lengthSquared ? Math.max(0, Math.min(1, ((x - ax) * dx + (y - ay) * dy) / lengthSquared)) : 0;
+    const px = ax + t * dx - x;
+    const py = ay + t * dy - y;
+    return Math.sqrt(px * px + py * py);
+}
+
+class ArcLayer {
+    // Canvases sized to `width` x `height` over the top-left of `container`.
+    // `renderer` is 'webgl' (falls back to 'canvas' when unavailable) or 'canvas'.
+    constructor(container, width, height, renderer) {
+        this.width = width;
+        this.height = height;
+        this.pixelRatio = window.devicePixelRatio || 1;
+        this.transform = {x: 0, y: 0, k: 1};
+        this.arcs = [];
+        this.visible = [];
+        this.hovered = -1;
+        this.animated = false;
+        this.frame = null;
+
+        this.canvas = this.createCanvas(container);
+        this.overlay = this.createCanvas(container);
+        this.gl = renderer === 'webgl' ? this.initWebGL() : null;
+        this.renderer = this.gl ? 'webgl' : 'canvas';
+        this.context = this.gl ? null : this.canvas.getContext('2d');
+        this.overlayContext = this.overlay.getContext('2d');
+    }
+
+    createCanvas(container) {
+        const canvas = document.createElement('canvas');
+        canvas.width = Math.round(this.width * this.pixelRatio);
+        canvas.height = Math.round(this.height * this.pixelRatio);
+        canvas.style.position = 'absolute';
+        canvas.style.left = '0';
+        canvas.style.top = '0';
+        canvas.style.width = this.width + 'px';
+        canvas.style.height = this.height + 'px';
+        canvas.style.pointerEvents = 'none';
+        container.appendChild(canvas);
+        return canvas;
+    }
+
+    initWebGL() {
+        const gl = this.canvas.getContext('webgl', {premultipliedAlpha: false, antialias: true});
+        if (!gl || !gl.getExtension('OES_element_index_uint')) {
+            return null;
+        }
+        const compile = (type, source) => {
+            const shader = gl.createShader(type);
+            gl.shaderSource(shader, source);
+            gl.compileShader(shader);
+            return shader;
+        };
+        const program = gl.createProgram();
+        gl.attachShader(program, compile(gl.VERTEX_SHADER, ARC_VERTEX_SHADER));
+        gl.attachShader(program, compile(gl.FRAGMENT_SHADER, ARC_FRAGMENT_SHADER));
+        gl.linkProgram(program);
+        if (!gl.getProgramParameter(program, gl.LINK_STATUS)) {
+            console.warn("WebGL arc shaders failed to link:", gl.getProgramInfoLog(program));
+            return null;
+        }
+        this.program = program;
+        this.locations = {
+            position: gl.getAttribLocation(program, 'a_position'),
+            offset: gl.getAttribLocation(program, 'a_offset'),
+            color: gl.getAttribLocation(program, 'a_color'),
+            transform: gl.getUniformLocation(program, 'u_transform'),
+            resolution: gl.getUniformLocation(program, 'u_resolution'),
+            opacity: gl.getUniformLocation(program, 'u_opacity')
+        };
+        this.vertexBuffer = gl.createBuffer();
+        this.colorBuffer = gl.createBuffer();
+        this.indexBuffer = gl.createBuffer();
+        return gl;
+    }
+
+    // Precompute the geometry of every arc. Each arc is {source: [x, y],
+    // target: [x, y], color: '#rrggbb', width, hoverWidth, datum}, in map pixels.
+    setArcs(arcs) {
+        this.arcs = arcs.map(arc => Object.assign({points: sampleArc(arc.source, arc.target)}, arc));
+        this.maxWidth = d3.max(this.arcs, arc => arc.width) || 0;
+        if (this.gl) {
+            this.uploadGeometry();
+        }
+        this.show(this.arcs.map((_, i) => i));
+    }
+
+    // Two vertices per sampled point, offset either side of the arc by half its width
+    uploadGeometry() {
+        const gl = this.gl;
+        const pointsPerArc = ARC_SEGMENTS + 1;
+        const vertices = new Float32Array(this.arcs.length * pointsPerArc * 2 * 4);
+        const colors = new Uint8Array(this.arcs.length * pointsPerArc * 2 * 4);
+        this.arcs.forEach((arc, a) => {
+            const rgb = d3.rgb(arc.color);
+            const points = arc.points;
+            for (let i = 0; i < pointsPerArc; i++) {
+                // Direction along the arc at this point, from its neighbours
+                const previous = Math.max(0, i - 1);
+                const next = Math.min(ARC_SEGMENTS, i + 1);
+                const dx = points[2 * next] - points[2 * previous];
+                const dy = points[2 * next + 1] - points[2 * previous + 1];
+                const length = Math.sqrt(dx * dx + dy * dy) || 1;
+                const nx = -dy / length * arc.width / 2;
+                const ny = dx / length * arc.width / 2;
+                for (let s = 0; s < 2; s++) {
+                    const side = s ? -1 : 1;
+                    const v = ((a * pointsPerArc + i) * 2 + s) * 4;
+                    vertices[v] = points[2 * i];
+                    vertices[v + 1] = points[2 * i + 1];
+                    vertices[v + 2] = nx * side;
+                    vertices[v + 3] = ny * side;
+                    colors[v] = rgb.r;
+                    colors[v + 1] = rgb.g;
+                    colors[v + 2] = rgb.b;
+                    colors[v + 3] = 255;
+                }
+            }
+        });
+        gl.bindBuffer(gl.ARRAY_BUFFER, this.vertexBuffer);
+        gl.bufferData(gl.ARRAY_BUFFER, vertices, gl.STATIC_DRAW);
+        gl.bindBuffer(gl.ARRAY_BUFFER, this.colorBuffer);
+        gl.bufferData(gl.ARRAY_BUFFER, colors, gl.STATIC_DRAW);
+    }
+
+    // Show only the arcs at the given indices, rebuilding the draw batches and the hit-test grid
+    show(indices) {
+        this.visible = indices;
+        this.hovered = -1;
+        if (this.gl) {
+            // Two triangles per segment of each visible arc
+            const pointsPerArc = ARC_SEGMENTS + 1;
+            const elements = new Uint32Array(indices.length * ARC_SEGMENTS * 6);
+            let e = 0;
+            indices.forEach(a => {
+                for (let i = 0; i < ARC_SEGMENTS; i++) {
+                    const v = (a * pointsPerArc + i) * 2;
+                    elements.set([v, v + 1, v + 2, v + 1, v + 3, v + 2], e);
+                    e += 6;
+                }
+            });
+            this.elementCount = elements.length;
+            this.gl.bindBuffer(this.gl.ELEMENT_ARRAY_BUFFER, this.indexBuffer);
+            this.gl.bufferData(this.gl.ELEMENT_ARRAY_BUFFER, elements, this.gl.STATIC_DRAW);
+        } else {
+            // Arcs sharing a colour and width are stroked as one path
+            this.batches = d3.groups(indices, a => this.arcs[a].color, a => this.arcs[a].width);
+        }
+        this.buildGrid();
+        this.draw();
+        this.drawOverlay();
+    }
+
+    // Grid of the visible arcs' segments, as arc * ARC_SEGMENTS + segment ids per cell
+    buildGrid() {
+        this.columns = Math.ceil(this.width / ARC_GRID_CELL);
+        this.rows = Math.ceil(this.height / ARC_GRID_CELL);
+        this.grid = new Map();
+        const cell = value => Math.floor(value / ARC_GRID_CELL);
+        this.visible.forEach(a => {
+            const points = this.arcs[a].points;
+            for (let i = 0; i < ARC_SEGMENTS; i++) {
+                const x0 = Math.max(0, cell(Math.min(points[2 * i], points[2 * i + 2])));
+                const x1 = Math.min(this.columns - 1, cell(Math.max(points[2 * i], points[2 * i + 2])));
+                const y0 = Math.max(0, cell(Math.min(points[2 * i + 1], points[2 * i + 3])));
+                const y1 = Math.min(this.rows - 1, cell(Math.max(points[2 * i + 1], points[2 * i + 3])));
+                for (let cy = y0; cy <= y1; cy++) {
+                    for (let cx = x0; cx <= x1; cx++) {
+                        const key = cy * this.columns + cx;
+                        let segments = this.grid.get(key);
+                        if (!segments) {
+                            segments = [];
+                            this.grid.set(key, segments);
+                        }
+                        segments.push(a * ARC_SEGMENTS + i);
+                    }
+                }
+            }
+        });
+    }
+
+    // Index of the visible arc under screen point (x, y), or -1
+    hitTest(x, y) {
+        const {x: tx, y: ty, k} = this.transform;
+        const mapX = (x - tx) / k;
+        const mapY = (y - ty) / k;
+        const reach = (ARC_HIT_TOLERANCE + this.maxWidth / 2) / k;
+        const cell = value => Math.floor(value / ARC_GRID_CELL);
+
+        let best = -1;
+        let bestDistance = Infinity;
+        for (let cy = Math.max(0, cell(mapY - reach)); cy <= Math.min(this.rows - 1, cell(mapY + reach)); cy++) {
+            for (let cx = Math.max(0, cell(mapX - reach)); cx <= Math.min(this.columns - 1, cell(mapX + reach)); cx++) {
+                const segments = this.grid.get(cy * this.columns + cx);
+                if (!segments) continue;
+                for (let s = 0; s < segments.length; s++) {
+                    const a = Math.floor(segments[s] / ARC_SEGMENTS);
+                    const p = (segments[s] % ARC_SEGMENTS) * 2;
+                    const points = this.arcs[a].points;
+                    const distance = segmentDistance(mapX, mapY, points[p], points[p + 1],
+                                                     points[p + 2], points[p + 3]) * k;
+                    if (distance <= this.arcs[a].width / 2 + ARC_HIT_TOLERANCE && distance < bestDistance) {
+                        best = a;
+                        bestDistance = distance;
+                    }
+                }
+            }
+        }
+        return best;
+    }
+
+    // Pan and zoom, as a d3.zoom transform {x, y, k}; line widths stay constant on screen
+    setTransform(transform) {
+        this.transform = {x: transform.x, y: transform.y, k: transform.k};
+        this.draw();
+        this.drawOverlay();
+    }
+
+    draw() {
+        const {x, y, k} = this.transform;
+        if (this.gl) {
+            const gl = this.gl;
+            gl.viewport(0, 0, this.canvas.width, this.canvas.height);
+            gl.clearColor(0, 0, 0, 0);
+            gl.clear(gl.COLOR_BUFFER_BIT);
+            if (!this.elementCount) return;
+            gl.useProgram(this.program);
+            gl.enable(gl.BLEND);
+            gl.blendFunc(gl.SRC_ALPHA, gl.ONE_MINUS_SRC_ALPHA);
+            gl.bindBuffer(gl.ARRAY_BUFFER, this.vertexBuffer);
+            gl.enableVertexAttribArray(this.locations.position);
+            gl.vertexAttribPointer(this.locations.position, 2, gl.FLOAT, false, 16, 0);
+            gl.enableVertexAttribArray(this.locations.offset);
+            gl.vertexAttribPointer(this.locations.offset, 2, gl.FLOAT, false, 16, 8);
+            gl.bindBuffer(gl.ARRAY_BUFFER, this.colorBuffer);
+            gl.enableVertexAttribArray(this.locations.color);
+            gl.vertexAttribPointer(this.locations.color, 4, gl.UNSIGNED_BYTE, true, 4, 0);
+            gl.uniform3f(this.locations.transform, x, y, k);
+            gl.uniform2f(this.locations.resolution, this.width, this.height);
+            gl.uniform1f(this.locations.opacity, ARC_OPACITY);
+            gl.bindBuffer(gl.ELEMENT_ARRAY_BUFFER, this.indexBuffer);
+            gl.drawElements(gl.TRIANGLES, this.elementCount, gl.UNSIGNED_INT, 0);
+            return;
+        }
+
+        const context = this.context;
+        context.setTransform(1, 0, 0, 1, 0, 0);
+        context.clearRect(0, 0, this.canvas.width, this.canvas.height);
+        context.setTransform(this.pixelRatio * k, 0, 0, this.pixelRatio * k, this.pixelRatio * x, this.pixelRatio * y);
+        context.globalAlpha = ARC_OPACITY;
+        context.lineCap = 'round';
+        this.batches.forEach(([color, widths]) => {
+            context.strokeStyle = color;
+            widths.forEach(([width, indices]) => {
+                context.lineWidth = width / k;
+                context.beginPath();
+                indices.forEach(a => this.tracePath(context, this.arcs[a].points));
+                context.stroke();
+            });
+        });
+    }
+
+    tracePath(context, points) {
+        context.moveTo(points[0], points[1]);
+        for (let i = 1; i <= ARC_SEGMENTS; i++) {
+            context.lineTo(points[2 * i], points[2 * i + 1]);
+        }
+    }
+
+    // Highlight one arc (or none with -1)
+    highlight(index) {
+        this.hovered = index;
+        this.drawOverlay();
+    }
+
+    // Animate markers along the largest visible arcs; `dots(arc)` gives each arc's marker count
+    animate(enabled, dots) {
+        this.animated = enabled;
+        this.dots = dots;
+        if (enabled && this.frame === null) {
+            const tick = () => {
+                this.drawOverlay();
+                this.frame = this.animated ? requestAnimationFrame(tick) : null;
+            };
+            this.frame = requestAnimationFrame(tick);
+        } else if (!enabled) {
+            this.drawOverlay();
+        }
+    }
+
+    drawOverlay() {
+        const context = this.overlayContext;
+        const {x, y, k} = this.transform;
+        context.setTransform(1, 0, 0, 1, 0, 0);
+        context.clearRect(0, 0, this.overlay.width, this.overlay.height);
+        context.setTransform(this.pixelRatio * k, 0, 0, this.pixelRatio * k, this.pixelRatio * x, this.pixelRatio * y);
+
+        if (this.animated) {
+            // Markers loop along each arc every 2 seconds, eased like the SVG animation
+            const phase = performance.now() / 2000;
+            context.globalCompositeOperation = 'screen';
+            this.visible.slice(0, MAX_ANIMATED_ARCS).forEach(a => {
+                const arc = this.arcs[a];
+                const count = this.dots(arc);
+                context.fillStyle = arc.color;
+                context.beginPath();
+                for (let d = 0; d < count; d++) {
+                    const t = d3.easeCubicInOut((phase + d / count) % 1) * ARC_SEGMENTS;
+                    const i = Math.min(ARC_SEGMENTS - 1, Math.floor(t));
+                    const f = t - i;
+                    const px = arc.points[2 * i] + (arc.points[2 * i + 2] - arc.points[2 * i]) * f;
+                    const py = arc.points[2 * i + 1] + (arc.points[2 * i + 3] - arc.points[2 * i + 1]) * f;
+                    context.moveTo(px + 3 / k, py);
+                    context.arc(px, py, 3 / k, 0, 2 * Math.PI);
+                }
+                context.fill();
+            });
+            context.globalCompositeOperation = 'source-over';
+        }
+
+        if (this.hovered >= 0) {
+            const arc = this.arcs[this.hovered];
+            context.globalAlpha = 1;
+            context.strokeStyle = arc.color;
+            context.lineWidth = arc.hoverWidth / k;
+            context.lineCap = 'round';
+            context.beginPath();
+            this.tracePath(context, arc.points);
+            context.stroke();
+        }
+    }
+
+    // Stop the animation and remove the canvases
+    destroy() {
+        this.animated = false;
+        if (this.frame !== null) {
+            cancelAnimationFrame(this.frame);
+            this.frame = null;
+        }
+        this.canvas.remove();
+        this.overlay.remove();
+    }
+}
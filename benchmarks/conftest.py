@@ -0,0 +1,24 @@
+"""
+Shared fixtures for the pipeline benchmarks, run with pytest-benchmark:
+
+    python -m pytest benchmarks
+
+Every scenario runs against local stubs or synthetic data, so no network
+access is needed. See the README for saving and comparing runs.
+"""
+
+import os
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def workdir(tmp_path_factory):
+    """A temporary directory used as the working directory for a whole module."""
+    path = tmp_path_factory.mktemp('bench')
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(cwd)
@@ -0,0 +1,34 @@
+"""Concurrent fetch engine against the in-process stub API, for several pool sizes."""
+
+import pytest
+
+from comtrade_stub import StubComtradeAPI
+from databank_search import fetch_partition
+from fetch_engine import TokenBucket, run_fetches
+
+YEARS = 5
+REPORTERS = 15
+PARTNERS = 50
+LATENCY = 0.02       # simulated seconds per call
+FAILURE_RATE = 0.05  # share of calls failing transiently
+RATE = 100.0         # token bucket calls per second
+
+TASKS = [(str(year), str(country), flow)
+         for year in range(2015, 2015 + YEARS)
+         for country in range(100, 100 + REPORTERS)
+         for flow in ('M', 'X')]
+
+
+@pytest.mark.parametrize('workers', [1, 2, 4, 8])
+def test_fetch(benchmark, workers):
+    def fetch():
+        api = StubComtradeAPI(latency=LATENCY, failure_rate=FAILURE_RATE, partners=PARTNERS)
+        limiter = TokenBucket(rate=RATE, capacity=workers)
+        return run_fetches(TASKS, lambda task: fetch_partition(api, *task), workers=workers,
+                           limiter=limiter, base_delay=0.01, max_delay=0.1)
+
+    outcomes, stats = benchmark.pedantic(fetch, rounds=1)
+    benchmark.extra_info.update(calls=stats['calls'], calls_per_second=stats['calls_per_second'])
+    assert [outcome['task'] for outcome in outcomes] == TASKS
+    assert stats['failed'] == 0
+    assert all(len(outcome['data']) == PARTNERS for outcome in outcomes)
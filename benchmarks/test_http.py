@@ -0,0 +1,68 @@
+"""
+The full fetch through the cached HTTP transport against the local Comtrade
+stub: with an empty response cache, within the TTL, and with every cached
+response expired (revalidated with ETags).
+"""
+
+import shutil
+
+import pytest
+
+from comtrade_api import ComtradeAPI
+from comtrade_stub import stub_comtrade_server
+from databank_search import fetch_trade_data
+from fetch_engine import TokenBucket
+from http_transport import DEFAULT_TTL, HttpTransport
+
+WORKERS = 4
+PARTNERS = 50   # partners per stub response
+LATENCY = 0.02  # stub seconds per request
+RATE = 100.0    # token bucket network requests per second
+
+
+@pytest.fixture(scope='module')
+def stub_server(workdir):
+    server, base_url = stub_comtrade_server(latency=LATENCY, partners=PARTNERS)
+    try:
+        yield server, base_url
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def fetch_all(base_url, cache_dir, ttl):
+    """Run fetch_trade_data against the stub; returns the transport's request counts."""
+    limiter = TokenBucket(rate=RATE, capacity=WORKERS)
+    with HttpTransport(cache_dir=cache_dir, ttl=ttl, limiter=limiter) as transport:
+        fetch_trade_data(workers=WORKERS, api=ComtradeAPI(transport, base_url=base_url), force=True)
+    return transport.stats
+
+
+def test_cold_cache(benchmark, stub_server, tmp_path):
+    server, base_url = stub_server
+    cache_dir = tmp_path / 'http_cache'
+    stats = benchmark.pedantic(fetch_all, (base_url, cache_dir, DEFAULT_TTL), rounds=3,
+                               setup=lambda: shutil.rmtree(cache_dir, ignore_errors=True))
+    # Reference lists fetched more than once in a run come from the cache after the first
+    assert stats['revalidated'] == 0
+    assert stats['downloaded'] == stats['network'] == stats['requests'] - stats['coalesced'] - stats['cache_hits']
+
+
+def test_warm_cache(benchmark, stub_server, tmp_path):
+    server, base_url = stub_server
+    cache_dir = tmp_path / 'http_cache'
+    fetch_all(base_url, cache_dir, DEFAULT_TTL)
+    requests = server.requests
+    stats = benchmark.pedantic(fetch_all, (base_url, cache_dir, DEFAULT_TTL), rounds=3)
+    assert server.requests == requests
+    assert stats['cache_hits'] == stats['requests'] - stats['coalesced']
+
+
+def test_expired_cache(benchmark, stub_server, tmp_path):
+    server, base_url = stub_server
+    cache_dir = tmp_path / 'http_cache'
+    fetch_all(base_url, cache_dir, DEFAULT_TTL)
+    stats = benchmark.pedantic(fetch_all, (base_url, cache_dir, 0), rounds=3)
+    # Reference lists keep their own week-long TTL and stay cached
+    assert stats['downloaded'] == 0
+    assert stats['revalidated'] == stats['network'] == stats['requests'] - stats['coalesced'] - stats['cache_hits']
@@ -0,0 +1,75 @@
+"""The nested-dict chord/link builders the pipeline used to have, against TradeMatrix."""
+
+import numpy as np
+import pytest
+
+from trade_matrix import TradeMatrix
+
+COUNTRIES = 250
+FLOWS = 100000
+
+rng = np.random.default_rng(0)
+CODES = np.arange(1, COUNTRIES + 1)
+COUNTRY_MAPPING = {int(code): {'name': f"Country {code:04d}"} for code in CODES}
+EXPORTERS = rng.choice(CODES, FLOWS)
+IMPORTERS = rng.choice(CODES, FLOWS)
+VALUES = rng.uniform(1e6, 1e10, FLOWS)
+NAMES = sorted(c['name'] for c in COUNTRY_MAPPING.values())
+
+
+def legacy_chord_matrix(trade_matrix, country_mapping, countries):
+    """The original chord builder: a linear name scan of the mapping per cell."""
+    matrix = []
+    for source_name in countries:
+        row = []
+        source_code = next(code for code, c in country_mapping.items() if c['name'] == source_name)
+        for target_name in countries:
+            target_code = next(code for code, c in country_mapping.items() if c['name'] == target_name)
+            if source_code == target_code:
+                row.append(0)
+            elif source_code in trade_matrix and target_code in trade_matrix[source_code]:
+                row.append(trade_matrix[source_code][target_code])
+            else:
+                row.append(0)
+        matrix.append(row)
+    return matrix
+
+
+def legacy():
+    trade_matrix = {}
+    for exporter, importer, value in zip(EXPORTERS.tolist(), IMPORTERS.tolist(), VALUES.tolist()):
+        row = trade_matrix.setdefault(exporter, {})
+        row[importer] = row.get(importer, 0.0) + value
+    links = [(e, i, trade_matrix[e][i]) for e in COUNTRY_MAPPING for i in COUNTRY_MAPPING
+             if e != i and i in trade_matrix.get(e, {}) and trade_matrix[e][i] > 0]
+    return links, legacy_chord_matrix(trade_matrix, COUNTRY_MAPPING, NAMES)
+
+
+def indexed(sparse):
+    matrix = TradeMatrix.from_flows(EXPORTERS, IMPORTERS, VALUES, sparse=sparse)
+    name_codes = {c['name']: code for code, c in COUNTRY_MAPPING.items()}
+    links = matrix.links(list(COUNTRY_MAPPING))
+    chord = matrix.subset([name_codes[name] for name in NAMES])
+    np.fill_diagonal(chord, 0)
+    return links, chord.tolist()
+
+
+BUILDERS = {
+    'nested dict + name scans': legacy,
+    'TradeMatrix (dense)': lambda: indexed(False),
+    'TradeMatrix (sparse)': lambda: indexed(True),
+}
+
+
+@pytest.fixture(scope='module')
+def expected():
+    return legacy()
+
+
+@pytest.mark.parametrize('builder', list(BUILDERS))
+def test_build(benchmark, expected, builder):
+    links, chord = benchmark.pedantic(BUILDERS[builder], rounds=3)
+    expected_links, expected_chord = expected
+    assert [link[:2] for link in links] == [link[:2] for link in expected_links]
+    np.testing.assert_allclose([link[2] for link in links], [link[2] for link in expected_links], rtol=1e-12)
+    np.testing.assert_allclose(chord, expected_chord, rtol=1e-12)
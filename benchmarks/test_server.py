@@ -0,0 +1,64 @@
+"""Load test of the query API with concurrent keep-alive clients, with and without the response cache."""
+
+import http.client
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from query_server import make_server
+from synthetic_comtrade import REPO_DIR
+
+REQUESTS = 2000
+CLIENTS = 8
+
+PATHS = ['/api/years', '/api/sectors', '/api/yearly?country=842', '/api/summary']
+PATHS += [f'/api/flows?year=latest&reporter={code}' for code in (36, 156, 276, 392, 842)]
+PATHS += [f'/api/top-partners?reporter={code}&n=10' for code in (36, 156, 276, 392, 842)]
+PATHS += [f'/api/sector-graph?sector={sector}&min_value=1e9'
+          for sector in ('agriculture', 'energy', 'machinery', 'automotive')]
+
+
+@pytest.fixture(params=[0, 256], ids=['uncached', 'LRU cache'])
+def server_port(request):
+    server = make_server(port=0, processed_dir=os.path.join(REPO_DIR, 'data', 'processed'),
+                         cache_size=request.param, quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield server.server_address[1]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def load(port):
+    """REQUESTS random API requests from CLIENTS keep-alive clients; returns (latencies, statuses)."""
+    def client(seed):
+        rng = random.Random(seed)
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        results = []
+        for _ in range(REQUESTS // CLIENTS):
+            start = time.perf_counter()
+            connection.request('GET', rng.choice(PATHS), headers={'Accept-Encoding': 'gzip'})
+            response = connection.getresponse()
+            response.read()
+            results.append((time.perf_counter() - start, response.status))
+        connection.close()
+        return results
+
+    with ThreadPoolExecutor(max_workers=CLIENTS) as pool:
+        results = [result for client_results in pool.map(client, range(CLIENTS)) for result in client_results]
+    latencies, statuses = zip(*results)
+    return np.array(latencies), set(statuses)
+
+
+def test_query_server(benchmark, server_port):
+    latencies, statuses = benchmark.pedantic(load, (server_port,), rounds=3)
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    benchmark.extra_info.update(requests=len(latencies), p50_ms=p50, p99_ms=p99)
+    assert statuses == {200}
+    assert len(latencies) == REQUESTS
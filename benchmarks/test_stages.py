@@ -0,0 +1,152 @@
+"""
+Each processing stage on a synthetic Comtrade dataset: JSON load, raw store
+load, aggregation, chord matrix, network build, commodity rollup, sector
+data and output writes. Save runs with --benchmark-autosave and compare
+against them with --benchmark-compare (see the README).
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from commodity_index import load_commodity_index
+from country_index import load_country_index
+from graph_layout import add_network_layout
+from graph_pruning import add_link_levels
+from process_trade_data import RAW_COLUMNS, aggregate_year, commodity_flows_frame, create_sector_data, new_totals
+from raw_store import RAW_STORE_DIR, load_raw
+from synthetic_comtrade import REPO_DIR, copy_data_sources, write_preview_files, write_raw_store
+from trade_matrix import TradeMatrix
+
+YEARS = list(range(2015, 2025))
+REPORTERS = 15
+PARTNERS = 100
+HS_DEPTH = 2      # commodity breakdown depth of the synthetic records
+COMMODITIES = 10  # codes at the deepest HS level
+ROUNDS = 3
+
+
+@pytest.fixture(scope='module')
+def dataset(workdir):
+    """Write the synthetic records as preview files and a raw store; returns (preview paths, record count)."""
+    with open(os.path.join(REPO_DIR, 'data_sources', 'country_mapping.json'), 'r') as f:
+        country_mapping = json.load(f)
+    codes = sorted(int(code) for code in country_mapping)
+    options = dict(years=YEARS, reporters=codes[:REPORTERS], partners=codes[:PARTNERS],
+                   hs_depth=HS_DEPTH, commodities=COMMODITIES, country_mapping=country_mapping)
+    os.makedirs('data/processed')
+    copy_data_sources('.')
+    preview_paths = write_preview_files('previews', **options)
+    return preview_paths, write_raw_store(RAW_STORE_DIR, **options)
+
+
+def aggregate():
+    totals = new_totals()
+    recent_exports = None
+    with open(os.devnull, 'w') as flows_file:
+        for year in YEARS:
+            count, exports, _, _ = aggregate_year(year, totals, flows_file)
+            if count:
+                recent_exports = exports
+    return totals, recent_exports
+
+
+def chord_matrix(pairs, reporters, country_index):
+    matrix = TradeMatrix.from_flows(pairs['reporter_code'], pairs['partner_code'], pairs['exports'])
+    names = sorted((country_index.name(code), code) for code in reporters)
+    chord = matrix.subset([code for _, code in names])
+    np.fill_diagonal(chord, 0)
+    return matrix, {'countries': [name for name, _ in names], 'matrix': chord.tolist()}
+
+
+def network(trade_matrix, reporters, country_index):
+    links = [{'source': str(exporter), 'target': str(importer), 'value': value}
+             for exporter, importer, value in trade_matrix.links(reporters)]
+    trade_network = {'nodes': [{'id': str(code), 'name': country_index.name(code),
+                                'code': country_index.iso3_of(code)} for code in reporters],
+                     'links': links}
+    add_link_levels(trade_network)
+    return add_network_layout(trade_network)
+
+
+@pytest.fixture(scope='module')
+def pipeline(dataset):
+    """Every stage's result, computed once, as input to the stages after it."""
+    totals, recent_exports = aggregate()
+    country_index = load_country_index()
+    summary = totals['summary'].to_frame()
+    reporters = summary['reporter_code'][country_index.is_reporter(summary['reporter_code'])].tolist()
+    trade_matrix, matrix_json = chord_matrix(totals['matrix'].to_frame(), reporters, country_index)
+    return {'totals': totals, 'recent_exports': recent_exports, 'country_index': country_index,
+            'summary': summary, 'reporters': reporters, 'trade_matrix': trade_matrix,
+            'matrix_json': matrix_json, 'trade_network': network(trade_matrix, reporters, country_index),
+            'commodity_flows': commodity_flows_frame(totals['commodities'], load_commodity_index())}
+
+
+def test_json_load(benchmark, dataset):
+    preview_paths, record_count = dataset
+
+    def load_json():
+        records = []
+        for path in preview_paths:
+            with open(path, 'r') as f:
+                records.extend(json.load(f))
+        return pd.DataFrame.from_records(records, columns=RAW_COLUMNS)
+
+    assert len(benchmark.pedantic(load_json, rounds=ROUNDS)) == record_count
+
+
+def test_raw_store_load(benchmark, dataset):
+    assert len(benchmark.pedantic(load_raw, kwargs={'columns': RAW_COLUMNS}, rounds=ROUNDS)) == dataset[1]
+
+
+def test_aggregation(benchmark, dataset):
+    totals, recent_exports = benchmark.pedantic(aggregate, rounds=ROUNDS)
+    assert sorted(totals['yearly'].to_frame()['year'].unique()) == YEARS
+    assert len(totals['summary'].to_frame()) == REPORTERS
+    assert (recent_exports['year'] == YEARS[-1]).all()
+
+
+def test_chord_matrix(benchmark, pipeline):
+    _, matrix_json = benchmark.pedantic(chord_matrix, (pipeline['totals']['matrix'].to_frame(),
+                                                       pipeline['reporters'], pipeline['country_index']),
+                                        rounds=ROUNDS)
+    assert matrix_json == pipeline['matrix_json']
+    assert np.shape(matrix_json['matrix']) == (len(pipeline['reporters']),) * 2
+
+
+def test_network_build(benchmark, pipeline):
+    trade_network = benchmark.pedantic(network, (pipeline['trade_matrix'], pipeline['reporters'],
+                                                 pipeline['country_index']), rounds=ROUNDS)
+    assert len(trade_network['nodes']) == len(pipeline['reporters'])
+    assert all('layout_x' in node and 'layout_y' in node for node in trade_network['nodes'])
+
+
+def test_commodity_rollup(benchmark, pipeline):
+    commodity_flows = benchmark.pedantic(commodity_flows_frame, (pipeline['totals']['commodities'],
+                                                                 load_commodity_index()), rounds=ROUNDS)
+    assert commodity_flows.equals(pipeline['commodity_flows'])
+
+
+def test_sector_data(benchmark, pipeline):
+    benchmark.pedantic(create_sector_data, kwargs={'recent_flows': pipeline['recent_exports'],
+                                                   'commodity_flows': pipeline['commodity_flows']},
+                       rounds=ROUNDS)
+    assert os.path.getsize('data/processed/sector_trade_flows.csv')
+
+
+def test_writes(benchmark, pipeline):
+    def write_outputs():
+        pipeline['summary'].to_csv('data/processed/trade_summary.csv', index=False)
+        pipeline['totals']['yearly'].to_frame().to_csv('data/processed/yearly_trade_summary.csv', index=False)
+        with open('data/processed/trade_network.json', 'w') as f:
+            json.dump(pipeline['trade_network'], f)
+        with open('data/processed/trade_matrix.json', 'w') as f:
+            json.dump(pipeline['matrix_json'], f)
+
+    benchmark.pedantic(write_outputs, rounds=ROUNDS)
+    assert pd.read_csv('data/processed/trade_summary.csv')['reporter_code'].tolist() == \
+        pipeline['summary']['reporter_code'].tolist()
@@ -0,0 +1,69 @@
+"""Disk size and load time of indented JSON year files against the Parquet raw store."""
+
+import json
+import os
+
+import pytest
+
+from process_trade_data import RAW_COLUMNS
+from raw_store import load_raw, write_partition
+from synthetic_comtrade import iter_partitions
+
+YEARS = list(range(2015, 2025))
+REPORTERS = list(range(1, 16))
+PARTNERS = range(1, 201)
+
+
+def directory_size(path):
+    """Total size in bytes of all files under `path`."""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames)
+    return total
+
+
+@pytest.fixture(scope='module')
+def stores(tmp_path_factory):
+    """The same synthetic records as JSON year files and as Parquet partitions; returns both dirs and counts."""
+    json_dir = tmp_path_factory.mktemp('json')
+    parquet_dir = tmp_path_factory.mktemp('parquet')
+    years = {year: [] for year in YEARS}
+    for (year, reporter, flow), records in iter_partitions(YEARS, REPORTERS, PARTNERS):
+        years[year].extend(records)
+        write_partition(year, reporter, flow, records, root=str(parquet_dir))
+    for year, records in years.items():
+        with open(json_dir / f'trade_data_{year}.json', 'w') as f:
+            json.dump(records, f, indent=2)
+    counts = {'all': sum(len(records) for records in years.values()),
+              'reporter': sum(record['reporterCode'] == REPORTERS[0]
+                              for records in years.values() for record in records)}
+    return json_dir, str(parquet_dir), counts
+
+
+def load_json(json_dir):
+    records = []
+    for year in YEARS:
+        with open(json_dir / f'trade_data_{year}.json', 'r') as f:
+            records.extend(json.load(f))
+    return records
+
+
+def test_disk_size(stores):
+    json_dir, parquet_dir, _ = stores
+    assert directory_size(parquet_dir) < directory_size(json_dir)
+
+
+LOADS = {
+    'json, all columns': (lambda stores: load_json(stores[0]), 'all'),
+    'parquet, all columns': (lambda stores: load_raw(root=stores[1]), 'all'),
+    'parquet, pipeline columns': (lambda stores: load_raw(columns=RAW_COLUMNS, root=stores[1]), 'all'),
+    'parquet, one reporter': (lambda stores: load_raw(reporters=REPORTERS[:1], columns=RAW_COLUMNS,
+                                                      root=stores[1]), 'reporter'),
+}
+
+
+@pytest.mark.parametrize('load', list(LOADS))
+def test_load(benchmark, stores, load):
+    func, expected = LOADS[load]
+    benchmark.extra_info['disk_bytes'] = directory_size(stores[0] if load.startswith('json') else stores[1])
+    assert len(benchmark.pedantic(func, (stores,), rounds=3)) == stores[2][expected]
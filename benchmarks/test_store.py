@@ -0,0 +1,55 @@
+"""Slices of trade_flows_raw.csv by full scan against indexed lookups in the SQLite trade store."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from process_trade_data import TRADE_FLOW_COLUMNS
+from trade_store import TradeStore, build_store
+
+YEARS = np.arange(2015, 2025)
+REPORTERS = 50
+PARTNERS = 200
+LATEST = int(YEARS[-1])
+
+QUERIES = {
+    'reporter-year': (lambda f: f[(f['year'] == LATEST) & (f['reporter_code'] == 1)],
+                      lambda store: store.flows(year=LATEST, reporter=1)),
+    'partner-year': (lambda f: f[(f['year'] == LATEST) & (f['partner_code'] == 1)],
+                     lambda store: store.flows(year=LATEST, partner=1)),
+    'top 10 partners': (lambda f: f[(f['year'] == LATEST) & (f['reporter_code'] == 1)
+                                    & (f['flow'] == 'export')].nlargest(10, 'value'),
+                        lambda store: store.top_partners(1, LATEST)),
+}
+
+
+@pytest.fixture(scope='module')
+def flows_store(tmp_path_factory):
+    """A synthetic trade_flows_raw.csv, the trade store built from it, and the flows in memory."""
+    rng = np.random.default_rng(0)
+    year, reporter, partner, flow = (axis.ravel() for axis in np.meshgrid(
+        YEARS, np.arange(1, REPORTERS + 1), np.arange(1, PARTNERS + 1), ['export', 'import'], indexing='ij'))
+    flows = pd.DataFrame({'year': year, 'reporter_code': reporter, 'reporter': [f"Country {code}" for code in reporter],
+                          'partner_code': partner, 'partner': [f"Country {code}" for code in partner],
+                          'flow': flow, 'value': rng.uniform(1e6, 1e11, len(year))}, columns=TRADE_FLOW_COLUMNS)
+    tmp = tmp_path_factory.mktemp('store')
+    csv_path, store_path = str(tmp / 'trade_flows_raw.csv'), str(tmp / 'trade_flows.sqlite')
+    flows.to_csv(csv_path, index=False)
+    build_store(csv_path, None, store_path)
+    with TradeStore(store_path) as store:
+        yield csv_path, store, pd.read_csv(csv_path, float_precision='round_trip')
+
+
+@pytest.mark.parametrize('method', ['read+scan', 'in-memory scan', 'store'])
+@pytest.mark.parametrize('query', list(QUERIES))
+def test_lookup(benchmark, flows_store, query, method):
+    csv_path, store, frame = flows_store
+    scan, lookup = QUERIES[query]
+    if method == 'read+scan':
+        result = benchmark(lambda: scan(pd.read_csv(csv_path, float_precision='round_trip')))
+    elif method == 'in-memory scan':
+        result = benchmark(scan, frame)
+    else:
+        result = benchmark(lookup, store)
+    assert result['value'].tolist() == scan(frame)['value'].tolist()
+    assert len(result)
@@ -0,0 +1,76 @@
+"""
+Time to interactive of the page over a large synthetic dataset in headless
+Chromium, with and without the data worker. Needs Playwright
+(pip install playwright && playwright install chromium); skipped without it.
+"""
+
+import statistics
+import threading
+
+import pytest
+
+from query_server import make_server
+from synthetic_comtrade import synthetic_site
+
+sync_api = pytest.importorskip('playwright.sync_api')
+
+YEARS = 10
+REPORTERS = 60
+PARTNERS = 200
+WORKERS = 4  # pipeline worker processes building the site
+ROUNDS = 3
+
+
+# Collects the duration of every main-thread task over 50 ms, from page start
+LONG_TASK_OBSERVER = """
+window.__longTasks = [];
+new PerformanceObserver(list => list.getEntries().forEach(entry => window.__longTasks.push(entry.duration)))
+    .observe({type: 'longtask', buffered: true});
+"""
+
+
+def measure_page(browser, url, settle_ms=2000):
+    """
+    One page load: time of the 'trade-interactive' mark, total blocking time
+    (long-task time over 50 ms) and the longest main-thread task, in ms.
+    """
+    page = browser.new_page()
+    page.add_init_script(LONG_TASK_OBSERVER)
+    page.goto(url)
+    page.wait_for_function("performance.getEntriesByName('trade-interactive').length > 0", timeout=120000)
+    # Let deferred work (the idle-time charts) land in the long-task list
+    page.wait_for_timeout(settle_ms)
+    interactive, long_tasks = page.evaluate(
+        "[performance.getEntriesByName('trade-interactive')[0].startTime, window.__longTasks]")
+    page.close()
+    return interactive, sum(max(0.0, task - 50) for task in long_tasks), max(long_tasks, default=0.0)
+
+
+@pytest.fixture(scope='module')
+def site_url(tmp_path_factory):
+    site = str(tmp_path_factory.mktemp('site'))
+    synthetic_site(site, YEARS, REPORTERS, PARTNERS, WORKERS)
+    server = make_server(port=0, processed_dir=f'{site}/data/processed', directory=site, quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/index.html"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(scope='module')
+def browser():
+    with sync_api.sync_playwright() as playwright:
+        browser = playwright.chromium.launch()
+        yield browser
+        browser.close()
+
+
+@pytest.mark.parametrize('query', ['?worker=0', ''], ids=['main thread', 'data worker'])
+def test_time_to_interactive(benchmark, site_url, browser, query):
+    samples = []
+    benchmark.pedantic(lambda: samples.append(measure_page(browser, site_url + query)), rounds=ROUNDS)
+    interactive, blocking, longest = (statistics.median(values) for values in zip(*samples))
+    benchmark.extra_info.update(interactive_ms=interactive, total_blocking_ms=blocking, longest_task_ms=longest)
+    assert interactive > 0
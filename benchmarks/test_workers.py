@@ -0,0 +1,43 @@
+"""process_yearly_data across worker processes on a synthetic raw store."""
+
+import json
+import os
+
+import pytest
+
+from process_trade_data import process_yearly_data
+from raw_store import RAW_STORE_DIR
+from synthetic_comtrade import copy_data_sources, write_raw_store
+
+YEARS = range(2015, 2025)
+REPORTERS = range(1, 51)
+PARTNERS = range(1, 201)
+
+OUTPUTS = ['trade_summary.csv', 'yearly_trade_summary.csv', 'trade_flows_raw.csv', 'trade_matrix.json']
+
+
+def read_outputs():
+    outputs = {}
+    for name in OUTPUTS:
+        with open(os.path.join('data', 'processed', name), 'rb') as f:
+            outputs[name] = f.read()
+    return outputs
+
+
+@pytest.fixture(scope='module')
+def serial_outputs(workdir):
+    """Write the synthetic raw store into the working directory; returns the outputs of a serial run."""
+    copy_data_sources('.', ['sector_rules.json', 'commodity_reference.json'])
+    with open('data_sources/country_mapping.json', 'w') as f:
+        json.dump({str(code): {'name': f"Country {code}", 'iso2': '', 'iso3': ''} for code in PARTNERS}, f)
+    os.makedirs('data/processed', exist_ok=True)
+    write_raw_store(RAW_STORE_DIR, YEARS, REPORTERS, PARTNERS)
+    process_yearly_data()
+    return read_outputs()
+
+
+@pytest.mark.parametrize('workers', [1, 2, 4, 8])
+def test_process_yearly_data(benchmark, serial_outputs, workers):
+    benchmark.extra_info['cpus'] = os.cpu_count()
+    benchmark.pedantic(process_yearly_data, kwargs={'workers': workers}, rounds=1)
+    assert read_outputs() == serial_outputs
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Content-addressed build cache for processed artifacts.
+Each build stage is keyed on the hashes of its input files, the source of
+the code that builds it and its parameters; a stage is skipped while its key
+and its recorded outputs are unchanged.
+"""
+
+import hashlib
+import json
+import os
+import sys
+
+CACHE_DIR = 'data/processed/.cache'
+CACHE_MANIFEST = os.path.join(CACHE_DIR, 'manifest.json')
+
+# File digests computed in this process, keyed by (path, size, mtime)
+_digests = {}
+
+
+def file_digest(path):
+    """SHA-256 of a file's contents, memoized on (path, size, mtime)."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _digests:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _digests[memo_key] = digest.hexdigest()
+    return _digests[memo_key]
+
+
+def code_version(*module_names):
+    """Hash of the source files of the given (already imported) modules."""
+    digest = hashlib.sha256()
+    for name in module_names:
+        digest.update(file_digest(sys.modules[name].__file__).encode('ascii'))
+    return digest.hexdigest()
+
+
+def stage_key(inputs=(), code=None, params=None, upstream=()):
+    """Key for a stage from its input files, code version, parameters and upstream keys."""
+    payload = {
+        'inputs': {path: file_digest(path) for path in sorted(inputs)},
+        'code': code,
+        'params': params,
+        'upstream': list(upstream),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class BuildCache:
+    """Records the key and output digests of each stage in a JSON manifest."""
+
+    def __init__(self, path=CACHE_MANIFEST):
+        self.path = path
+        self.stages = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.stages = json.load(f)
+
+    def is_fresh(self, stage, key):
+        """True if `stage` was last built with `key` and its outputs are untouched."""
+        entry = self.stages.get(stage)
+        if entry is None or entry['key'] != key:
+            return False
+        return all(os.path.exists(path) and file_digest(path) == digest
+                   for path, digest in entry['outputs'].items())
+
+    def record(self, stage, key, outputs):
+        """Record that `stage` was built with `key`, producing the `outputs` files."""
+        self.stages[stage] = {
+            'key': key,
+            'outputs': {path: file_digest(path) for path in outputs},
+        }
+        self.save()
+
+    def save(self):
+        """Write the manifest atomically."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.stages, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
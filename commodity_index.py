@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+HS commodity hierarchy for commodity-level trade data.
+Compiles commodity_reference.json into a rollup index: each HS2, HS4 and HS6
+code gets a position, the positions of its ancestors at every HS level, and
+the sector bucket of its chapter (from the `chapters` of sector_rules.json).
+Records are then rolled up with array lookups instead of string handling.
+"""
+
+import argparse
+import json
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+COMMODITY_REFERENCE_PATH = 'data_sources/commodity_reference.json'
+SECTOR_RULES_PATH = 'data_sources/sector_rules.json'
+
+# Digits of the HS levels, coarsest first
+HS_LEVELS = (2, 4, 6)
+
+
+class CommodityIndex:
+    """
+    HS codes with their rollup arrays. `ancestors[i, j]` is the position of
+    the HS_LEVELS[j]-digit ancestor of code i (i itself at its own level, -1
+    below it); `sectors[i]` indexes `sector_names`, or is -1 for chapters
+    outside every sector.
+    """
+
+    def __init__(self, codes, descriptions, sector_names, chapter_sectors):
+        self.codes = np.asarray(codes, dtype=object)
+        self.descriptions = np.asarray(descriptions, dtype=object)
+        self.levels = np.array([len(code) for code in codes], dtype=np.int8)
+        self.sector_names = list(sector_names)
+        self._lookup = pd.Index(self.codes)
+
+        self.ancestors = np.full((len(codes), len(HS_LEVELS)), -1, dtype=np.int64)
+        for j, digits in enumerate(HS_LEVELS):
+            prefixes = [code[:digits] if len(code) >= digits else '' for code in codes]
+            self.ancestors[:, j] = self._lookup.get_indexer(prefixes)
+        chapters = self.ancestors[:, 0]
+        chapter_sector = np.array([chapter_sectors.get(code, -1) for code in self.codes.tolist()],
+                                  dtype=np.int64)
+        self.sectors = np.where(chapters >= 0, chapter_sector[chapters], -1)
+
+    @classmethod
+    def from_reference(cls, path=COMMODITY_REFERENCE_PATH, rules_path=SECTOR_RULES_PATH):
+        """Build the index from the Comtrade commodity reference and the sector rules."""
+        reference = pd.read_json(path, dtype={'id': str})
+        reference = reference[reference['aggrLevel'].isin(HS_LEVELS)].sort_values('id')
+        with open(rules_path, 'r') as f:
+            rules = json.load(f)
+        chapter_sectors = {chapter: s for s, sector in enumerate(rules['sectors'])
+                           for chapter in sector.get('chapters', [])}
+        # Reference texts read "010110 - Horses: ..."; keep just the description
+        descriptions = [text.split(' - ', 1)[-1].lstrip('- ') for text in reference['text']]
+        return cls(reference['id'].tolist(), descriptions,
+                   [sector['name'] for sector in rules['sectors']], chapter_sectors)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def positions(self, codes):
+        """Positions of `codes` (-1 for TOTAL and codes outside HS2-HS6)."""
+        return self._lookup.get_indexer(pd.Index(codes).astype(str))
+
+    def parents(self, positions):
+        """Position of each code's parent one level up (-1 for chapters)."""
+        level = self.levels[positions] // 2 - 1
+        return np.where(level > 0, self.ancestors[positions, np.maximum(level - 1, 0)], -1)
+
+
+@lru_cache(maxsize=None)
+def load_commodity_index(path=COMMODITY_REFERENCE_PATH, rules_path=SECTOR_RULES_PATH):
+    """The commodity index, built once per process."""
+    return CommodityIndex.from_reference(path, rules_path)
+
+
+def rollup_levels(index, direct, keys, values):
+    """
+    Complete commodity totals at every HS level. `direct` has a `position`
+    column, the group `keys` and the `values` columns, holding values as
+    reported (at any mix of levels). A code that was reported keeps its own
+    value; any other code gets the sum of its children, filled one level at
+    a time from HS6 up, so nothing is counted twice when records at several
+    levels overlap.
+    """
+    group = ['position'] + keys
+    levels = [direct[index.levels[direct['position'].to_numpy()] == digits] for digits in HS_LEVELS]
+    for j in range(len(HS_LEVELS) - 1, 0, -1):
+        children = levels[j]
+        if children.empty:
+            continue
+        rolled = children.assign(position=index.parents(children['position'].to_numpy()))
+        rolled = rolled.groupby(group, sort=False, as_index=False)[values].sum()
+        # Keep only the parents that were not reported themselves
+        rolled = rolled.merge(levels[j - 1][group], on=group, how='left', indicator=True)
+        rolled = rolled[rolled['_merge'] == 'left_only'].drop(columns='_merge')
+        levels[j - 1] = pd.concat([levels[j - 1], rolled], ignore_index=True)
+    return pd.concat(levels, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the HS rollup index and its sector buckets.")
+    parser.add_argument('--code', action='append', default=[], help="show the ancestors and sector of a code")
+    args = parser.parse_args()
+
+    index = load_commodity_index()
+    for digits in HS_LEVELS:
+        print(f"HS{digits}: {(index.levels == digits).sum()} codes")
+    for s, name in enumerate(index.sector_names):
+        chapters = index.codes[(index.sectors == s) & (index.levels == 2)]
+        print(f"{name}: {len(chapters)} chapters, {(index.sectors == s).sum()} codes")
+    for code in args.code:
+        position = index.positions([code])[0]
+        if position < 0:
+            print(f"{code}: not an HS2-HS6 code")
+            continue
+        lineage = [index.codes[a] for a in index.ancestors[position] if a >= 0]
+        sector = index.sector_names[index.sectors[position]] if index.sectors[position] >= 0 else 'none'
+        print(f"{code}: {' > '.join(lineage)} ({index.descriptions[position]}), sector {sector}")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+UN Comtrade endpoints over the shared HTTP transport.
+ComtradeAPI implements the part of the comtradeapicall interface the fetch
+scripts use (previewFinalData, getReference, convertCountryIso3ToCode) with
+requests made through http_transport, so calls share keep-alive connections
+and repeated calls are answered from the response cache.
+"""
+
+import argparse
+import json
+
+import pandas as pd
+
+from http_transport import HttpTransport
+
+COMTRADE_BASE_URL = 'https://comtradeapi.un.org'
+PREVIEW_PATH = '/public/v1/preview/{typeCode}/{freqCode}/{clCode}'
+REFERENCE_LIST_PATH = '/files/v1/app/reference/ListofReferences.json'
+
+# Reference lists change rarely; serve them from the cache for a week before revalidating
+REFERENCE_TTL = 7 * 24 * 3600
+
+
+def without_error(body):
+    """Whether a preview response holds data rather than an error reported with status 200."""
+    try:
+        return not json.loads(body).get('error')
+    except (ValueError, AttributeError):
+        return False
+
+
+class ComtradeAPI:
+    """
+    Drop-in for the comtradeapicall module in databank_search. `base_url`
+    points it at another server, e.g. a local stub.
+    """
+
+    def __init__(self, transport=None, base_url=COMTRADE_BASE_URL):
+        self.transport = transport or HttpTransport()
+        self.base_url = base_url.rstrip('/')
+
+    def previewFinalData(self, typeCode, freqCode, clCode, period, reporterCode, cmdCode, flowCode,
+                         partnerCode, partner2Code, customsCode, motCode, maxRecords=None, format_output='JSON',
+                         aggregateBy=None, breakdownMode=None, countOnly=None, includeDesc=None):
+        """Final data from the keyless preview endpoint, as a DataFrame of records."""
+        url = self.base_url + PREVIEW_PATH.format(typeCode=typeCode, freqCode=freqCode, clCode=clCode)
+        payload = self.transport.get(url, {
+            'reporterCode': reporterCode, 'period': period, 'partnerCode': partnerCode,
+            'partner2Code': partner2Code, 'cmdCode': cmdCode, 'flowCode': flowCode,
+            'customsCode': customsCode, 'motCode': motCode, 'maxRecords': maxRecords,
+            'format': format_output, 'aggregateBy': aggregateBy, 'breakdownMode': breakdownMode,
+            'countOnly': countOnly, 'includeDesc': includeDesc,
+        }, cacheable=without_error).json()
+        if payload.get('error'):
+            raise ValueError(f"Comtrade error for reporter {reporterCode} in {period}: {payload['error']}")
+        return pd.DataFrame(payload.get('data') or [])
+
+    def reference_files(self):
+        """{category: file URL} of the reference lists."""
+        listing = self.transport.get(self.base_url + REFERENCE_LIST_PATH, ttl=REFERENCE_TTL).json()
+        return {entry['category']: entry['fileuri'] for entry in listing['results']}
+
+    def getReference(self, category):
+        """A reference list (e.g. 'reporter', 'partner') as a DataFrame."""
+        files = self.reference_files()
+        if category not in files:
+            raise ValueError(f"Unknown reference category {category!r}")
+        return pd.DataFrame(self.transport.get(files[category], ttl=REFERENCE_TTL).json()['results'])
+
+    def convertCountryIso3ToCode(self, iso3_codes):
+        """Comma-separated reporter codes of comma-separated ISO3 codes, preferring current entries."""
+        reporters = self.getReference('reporter')
+        current = reporters.sort_values('entryExpiredDate', na_position='first', kind='stable')
+        codes = current.drop_duplicates('reporterCodeIsoAlpha3').set_index('reporterCodeIsoAlpha3')['reporterCode']
+        return ','.join(str(codes[iso3.strip()]) for iso3 in iso3_codes.split(','))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch a Comtrade reference list through the response cache.")
+    parser.add_argument('category', nargs='?', default='reporter')
+    args = parser.parse_args()
+
+    api = ComtradeAPI()
+    reference = api.getReference(args.category)
+    print(f"{len(reference)} {args.category} entries")
+    print(api.transport.summary())
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for UN Comtrade used by the tests and benchmarks.
+StubComtradeAPI replaces the comtradeapicall module in-process with
+simulated latency and failures; stub_comtrade_server answers the preview
+and reference endpoints over HTTP from synthetic records, so the whole
+fetch path runs without network access.
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from synthetic_comtrade import synthetic_records
+
+
+class StubFrame:
+    """Minimal stand-in for the DataFrames returned by comtradeapicall."""
+
+    def __init__(self, records):
+        self.records = records
+        self.empty = not records
+
+    def __len__(self):
+        return len(self.records)
+
+    def to_dict(self, orient='records'):
+        return list(self.records)
+
+
+class StubComtradeAPI:
+    """Local stub of the comtradeapicall interface with simulated latency and failures."""
+
+    def __init__(self, latency=0.05, failure_rate=0.0, partners=50, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.partners = partners
+        self.rng = random.Random(seed)
+
+    def convertCountryIso3ToCode(self, iso3_codes):
+        return ','.join(str(100 + i) for i, _ in enumerate(iso3_codes.split(',')))
+
+    def previewFinalData(self, period, reporterCode, flowCode, **kwargs):
+        time.sleep(self.latency)
+        if self.rng.random() < self.failure_rate:
+            raise ConnectionError("stubbed transient failure")
+        return StubFrame([
+            {
+                'period': period,
+                'reporterCode': int(reporterCode),
+                'partnerCode': partner,
+                'flowCode': flowCode,
+                'cmdCode': 'TOTAL',
+                'primaryValue': self.rng.uniform(1e6, 1e10),
+            }
+            for partner in range(1, self.partners + 1)
+        ])
+
+    def getReference(self, category):
+        time.sleep(self.latency)
+        return StubFrame([])
+
+
+class StubComtradeHandler(BaseHTTPRequestHandler):
+    """
+    Local HTTP stub of the Comtrade preview and reference endpoints, with
+    keep-alive, ETags and 304 responses. Counts requests and connections
+    on the server (`server.requests`, `server.connections`). While
+    `server.preview_errors` is above zero, each preview request is answered
+    with an error payload and status 200, as Comtrade reports throttling.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(self.server.latency)
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        if url.path == '/files/v1/app/reference/ListofReferences.json':
+            payload = {'results': [{'category': category, 'fileuri': f"{base}/files/v1/app/reference/{name}"}
+                                   for category, name in (('reporter', 'Reporters.json'),
+                                                          ('partner', 'partnerAreas.json'))]}
+        elif url.path in ('/files/v1/app/reference/Reporters.json', '/files/v1/app/reference/partnerAreas.json'):
+            name = 'reporters.json' if url.path.endswith('Reporters.json') else 'partners.json'
+            with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_sources', name), 'r') as f:
+                payload = {'results': json.load(f)}
+        elif url.path.startswith('/public/v1/preview/'):
+            records = synthetic_records([int(params['period'])], [int(params['reporterCode'])],
+                                        range(1, self.server.partners + 1))
+            payload = {'error': '', 'data': [r for r in records if r['flowCode'] == params['flowCode']]}
+            with self.server.lock:
+                if self.server.preview_errors > 0:
+                    self.server.preview_errors -= 1
+                    payload = {'error': 'Too many requests', 'data': None}
+        else:
+            self.send_error(404)
+            return
+
+        body = json.dumps(payload).encode('utf-8')
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def stub_comtrade_server(latency=0.0, partners=50):
+    """Start a StubComtradeHandler server on a free local port; returns the server and its base URL."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubComtradeHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.latency = latency
+    server.partners = partners
+    server.requests = server.connections = server.preview_errors = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
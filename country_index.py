@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Compiled country reference index.
+Merges country_mapping.json, reporters.json and partners.json (plus the
+region groups of country_regions.json) into one table of Comtrade code,
+ISO2, ISO3, name and region, versioned by the hashes of its sources. Every
+lookup between codes, ISO codes and names is a dict or array access, the
+compiled arrays load from an .npz instead of reparsing the JSON, and a
+columnar JSON copy ships to the frontend.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from build_cache import BuildCache, code_version, file_digest, stage_key
+
+COUNTRY_MAPPING_PATH = 'data_sources/country_mapping.json'
+REPORTERS_PATH = 'data_sources/reporters.json'
+PARTNERS_PATH = 'data_sources/partners.json'
+REGIONS_PATH = 'data_sources/country_regions.json'
+SOURCE_PATHS = [COUNTRY_MAPPING_PATH, REPORTERS_PATH, PARTNERS_PATH, REGIONS_PATH]
+
+PROCESSED_DIR = 'data/processed'
+INDEX_PATH = os.path.join(PROCESSED_DIR, 'country_index.npz')
+INDEX_JSON_PATH = os.path.join(PROCESSED_DIR, 'country_index.json')
+
+# Bumped when the compiled layout changes
+INDEX_FORMAT = 1
+
+# Region of countries outside every group of country_regions.json
+OTHER_REGION = 'Other'
+
+COLUMNS = ['code', 'iso2', 'iso3', 'name', 'region', 'reporter', 'group']
+
+
+def source_version(paths=SOURCE_PATHS):
+    """Version of an index built from `paths`: the format and the hashes of the sources that exist."""
+    digest = hashlib.sha256(str(INDEX_FORMAT).encode('ascii'))
+    for path in paths:
+        digest.update((file_digest(path) if os.path.exists(path) else '-').encode('ascii'))
+    return f'{INDEX_FORMAT}-{digest.hexdigest()[:12]}'
+
+
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class CountryIndex:
+    """
+    Country reference arrays, one row per Comtrade code. Rows are in lookup
+    preference order: reporters first, then current entries before expired
+    ones (e.g. 842 "USA" before 841 "USA and Puerto Rico (...1980)"), so an
+    ISO code or name shared by several codes resolves to the first.
+    """
+
+    def __init__(self, codes, iso2, iso3, names, regions, region_names, reporter, group, version):
+        self.codes = np.asarray(codes, dtype=np.int64)
+        self.iso2 = np.asarray(iso2, dtype=object)
+        self.iso3 = np.asarray(iso3, dtype=object)
+        self.names = np.asarray(names, dtype=object)
+        self.regions = np.asarray(regions, dtype=np.int8)
+        self.region_names = list(region_names)
+        self.reporter = np.asarray(reporter, dtype=bool)
+        self.group = np.asarray(group, dtype=bool)
+        self.version = version
+
+        self._lookup = pd.Index(self.codes)
+        self._positions = {code: i for i, code in enumerate(self.codes.tolist())}
+        self._keys = {}
+        for values in (self.iso3, self.iso2, self.names):
+            for i, key in enumerate(values.tolist()):
+                if key:
+                    self._keys.setdefault(key, i)
+
+    @classmethod
+    def from_sources(cls, mapping_path=COUNTRY_MAPPING_PATH, reporters_path=REPORTERS_PATH,
+                     partners_path=PARTNERS_PATH, regions_path=REGIONS_PATH):
+        """
+        Compile the index from the reference files. Names and ISO codes come
+        from the country mapping where it has the code, then from the
+        reporter and partner references; every file but the mapping is optional.
+        """
+        rows = {}
+
+        def add(code, name, iso2, iso3, reporter, group=False, effective=None, expired=None):
+            # Missing ISO codes appear as null or NaN in the references
+            row = rows.setdefault(int(code), {'name': name, 'iso2': iso2.strip() if isinstance(iso2, str) else '',
+                                              'iso3': iso3.strip() if isinstance(iso3, str) else '',
+                                              'reporter': False,
+                                              'group': False, 'effective': '', 'expired': ''})
+            row['reporter'] |= reporter
+            row['group'] |= bool(group)
+            row['effective'] = row['effective'] or effective or ''
+            row['expired'] = row['expired'] or expired or ''
+
+        with open(mapping_path, 'r') as f:
+            for code, country in json.load(f).items():
+                add(code, country['name'], country.get('iso2'), country.get('iso3'), True)
+        for entry in read_json(reporters_path, []):
+            add(entry['reporterCode'], entry['reporterDesc'], entry.get('reporterCodeIsoAlpha2'),
+                entry.get('reporterCodeIsoAlpha3'), True, entry.get('isGroup'),
+                entry.get('entryEffectiveDate'), entry.get('entryExpiredDate'))
+        for entry in read_json(partners_path, []):
+            add(entry['PartnerCode'], entry['PartnerDesc'], entry.get('PartnerCodeIsoAlpha2'),
+                entry.get('PartnerCodeIsoAlpha3'), False, entry.get('isGroup'),
+                entry.get('entryEffectiveDate'), entry.get('entryExpiredDate'))
+
+        groups = read_json(regions_path, {})
+        region_names = list(groups) + [OTHER_REGION]
+        country_regions = {iso3: r for r, members in enumerate(groups.values()) for iso3 in members}
+
+        # Reporters, then current entries, then the most recently effective, then by code
+        order = sorted(rows)
+        order.sort(key=lambda code: rows[code]['effective'], reverse=True)
+        order.sort(key=lambda code: (not rows[code]['reporter'], bool(rows[code]['expired'])))
+        table = [rows[code] for code in order]
+        return cls(order, [row['iso2'] for row in table], [row['iso3'] for row in table],
+                   [row['name'] for row in table],
+                   [country_regions.get(row['iso3'], len(region_names) - 1) for row in table],
+                   region_names, [row['reporter'] for row in table], [row['group'] for row in table],
+                   source_version([mapping_path, reporters_path, partners_path, regions_path]))
+
+    def save(self, path=INDEX_PATH):
+        """Save the compiled arrays (strings as fixed-width unicode, no pickles)."""
+        np.savez(path, version=np.array(self.version), codes=self.codes, iso2=self.iso2.astype(str),
+                 iso3=self.iso3.astype(str), names=self.names.astype(str), regions=self.regions,
+                 region_names=np.array(self.region_names, dtype=str), reporter=self.reporter, group=self.group)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        """Load an index saved with `save`."""
+        with np.load(path) as archive:
+            return cls(archive['codes'], archive['iso2'].astype(object), archive['iso3'].astype(object),
+                       archive['names'].astype(object), archive['regions'], archive['region_names'].tolist(),
+                       archive['reporter'], archive['group'], str(archive['version']))
+
+    def to_json(self):
+        """The columnar JSON form shipped to the frontend (regions as indices into `regions`)."""
+        return {'version': self.version, 'regions': self.region_names, 'code': self.codes.tolist(),
+                'iso2': self.iso2.tolist(), 'iso3': self.iso3.tolist(), 'name': self.names.tolist(),
+                'region': self.regions.tolist(), 'reporter': self.reporter.astype(int).tolist(),
+                'group': self.group.astype(int).tolist()}
+
+    def to_frame(self):
+        """One row per code, regions as names."""
+        return pd.DataFrame({'code': self.codes, 'iso2': self.iso2, 'iso3': self.iso3, 'name': self.names,
+                             'region': np.array(self.region_names, dtype=object)[self.regions],
+                             'reporter': self.reporter, 'group': self.group}, columns=COLUMNS)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self._positions
+
+    def positions(self, codes):
+        """Row positions of an array of codes (-1 for unknown codes)."""
+        return self._lookup.get_indexer(pd.Index(codes).astype(np.int64))
+
+    def position(self, key):
+        """Row of a code, ISO2 or ISO3 code, or name (-1 if unknown)."""
+        if isinstance(key, str):
+            return self._keys.get(key, -1)
+        return self._positions.get(int(key), -1)
+
+    def code(self, key):
+        """Comtrade code of an ISO2 or ISO3 code or name (None if unknown)."""
+        i = self.position(key)
+        return int(self.codes[i]) if i >= 0 else None
+
+    def name(self, key):
+        i = self.position(key)
+        return self.names[i] if i >= 0 else None
+
+    def iso3_of(self, key):
+        i = self.position(key)
+        return self.iso3[i] if i >= 0 else None
+
+    def region(self, key):
+        i = self.position(key)
+        return self.region_names[self.regions[i]] if i >= 0 else None
+
+    def names_of(self, codes):
+        """Names of an array of codes (None for unknown codes)."""
+        positions = self.positions(codes)
+        return np.where(positions >= 0, self.names[positions], None)
+
+    def is_reporter(self, codes):
+        """Whether each of an array of codes is a reporter."""
+        positions = self.positions(codes)
+        return (positions >= 0) & self.reporter[positions]
+
+    def reporter_codes(self):
+        return self.codes[self.reporter]
+
+
+def write_country_index(processed_dir=PROCESSED_DIR, use_cache=False):
+    """
+    Compile the index from the reference files and write the .npz and the
+    frontend JSON. With `use_cache` nothing is rebuilt while the sources are unchanged.
+    """
+    outputs = [os.path.join(processed_dir, os.path.basename(INDEX_PATH)),
+               os.path.join(processed_dir, os.path.basename(INDEX_JSON_PATH))]
+    if use_cache:
+        cache = BuildCache()
+        index_key = stage_key([path for path in SOURCE_PATHS if os.path.exists(path)], code_version(__name__))
+        if cache.is_fresh('country_index', index_key):
+            print("Country index is up to date")
+            return outputs
+
+    os.makedirs(processed_dir, exist_ok=True)
+    index = CountryIndex.from_sources()
+    index.save(outputs[0])
+    with open(outputs[1], 'w') as f:
+        json.dump(index.to_json(), f, separators=(',', ':'))
+    print(f"Created country index {index.version} with {len(index)} codes "
+          f"({index.reporter.sum()} reporters, {len(index.region_names)} regions)")
+
+    if use_cache:
+        cache.record('country_index', index_key, outputs)
+    return outputs
+
+
+@lru_cache(maxsize=None)
+def load_country_index(path=INDEX_PATH):
+    """
+    The country index, built once per process: the compiled arrays when they
+    match the current sources, otherwise compiled from the sources.
+    """
+    if os.path.exists(path):
+        index = CountryIndex.load(path)
+        if index.version == source_version():
+            return index
+    return CountryIndex.from_sources()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the country reference index.")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="recompile even if the reference files are unchanged")
+    parser.add_argument('--lookup', action='append', default=[],
+                        help="show the entry of a code, ISO2 or ISO3 code, or name")
+    args = parser.parse_args()
+
+    if not args.lookup:
+        write_country_index(use_cache=not args.no_cache)
+    index = load_country_index()
+    for key in args.lookup:
+        i = index.position(int(key) if key.isdigit() else key)
+        if i < 0:
+            print(f"{key}: not in the index")
+            continue
+        print(f"{key}: {index.codes[i]} {index.iso2[i] or '-'} {index.iso3[i] or '-'} {index.names[i]} "
+              f"({index.region_names[index.regions[i]]}{', reporter' if index.reporter[i] else ''}"
+              f"{', group' if index.group[i] else ''})")
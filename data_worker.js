@@ -0,0 +1,27 @@
+// Web Worker behind TradeDataWorker (see trade_bundle.js)
+// Fetches, inflates and aggregates the data bundle off the main thread, then
+// transfers the bundle and aggregate buffers to the page without copying.
+
+importScripts('trade_bundle.js');
+
+self.onmessage = async function(event) {
+    const {id, type, url} = event.data;
+    try {
+        if (type === 'bundle') {
+            const buffer = await fetchTradeBundle(url);
+            const aggregates = bundleAggregates(decodeTradeBundle(buffer));
+            self.postMessage({id: id, buffer: buffer, aggregates: aggregates},
+                             [buffer, ...aggregateBuffers(aggregates)]);
+        } else if (type === 'json') {
+            const response = await fetch(url);
+            if (!response.ok) {
+                throw new Error(`Failed to load ${url}: ${response.status} ${response.statusText}`);
+            }
+            self.postMessage({id: id, data: await response.json()});
+        } else {
+            throw new Error(`Unknown request type ${type}`);
+        }
+    } catch (error) {
+        self.postMessage({id: id, error: error.message});
+    }
+};
@@ -1,23 +1,81 @@
 #!/usr/bin/env python3
 """
 Script to fetch global trade data using the UN Comtrade API.
-Uses the comtradeapicall library to access free API endpoints.
+Calls the free API endpoints through ComtradeAPI (comtrade_api.py), which
+mirrors the comtradeapicall interface over a pooled, cached HTTP transport.
 """
 
-import comtradeapicall
+import argparse
 import json
 import os
 import pandas as pd
+import threading
 from datetime import date, timedelta
 
+from comtrade_api import ComtradeAPI
+from fetch_engine import DEFAULT_WORKERS, TokenBucket, call_with_retry, run_fetches
+from http_transport import DEFAULT_TTL, HTTP_CACHE_DIR, HttpTransport
+from instrumentation import RunReport, add_report_arguments, current_stage, stage, staged
+from manifest import (DEFAULT_MAX_AGE_DAYS, load_manifest, make_entry, needs_fetch,
+                      partition_key, save_manifest)
+from raw_store import partition_path, remove_partition, write_partition
+
+# Flows fetched per reporter (M=Imports, X=Exports). Fetching one direction
+# halves the calls; processing mirrors the other from partners' reports.
+FLOW_CHOICES = {'both': ('M', 'X'), 'M': ('M',), 'X': ('X',)}
+
 # Create directory for data sources if it doesn't exist
 os.makedirs('data_sources', exist_ok=True)
 
-def fetch_trade_data():
+def fetch_partition(api, year, country, flow):
+    """Fetch total trade for one (year, reporter, flow) partition."""
+    return api.previewFinalData(
+        typeCode='C',          # Commodities
+        freqCode='A',          # Annual
+        clCode='HS',           # Harmonized System
+        period=year,           # Year
+        reporterCode=country,  # Country
+        cmdCode='TOTAL',       # Total trade
+        flowCode=flow,         # Imports/Exports
+        partnerCode=None,      # All partners
+        partner2Code=None,
+        customsCode=None,
+        motCode=None,
+        maxRecords=500,
+        format_output='JSON',
+        aggregateBy=None,
+        breakdownMode='classic',
+        countOnly=None,
+        includeDesc=True
+    )
+
+@staged('fetch_trade_data')
+def fetch_trade_data(workers=DEFAULT_WORKERS, api=None, limiter=None,
+                     max_age_days=DEFAULT_MAX_AGE_DAYS, force=False, flows=FLOW_CHOICES['both']):
     """
     Fetch global trade data using the UN Comtrade API.
     Focuses on free API calls that don't require a subscription key.
+    
+    Partitions are fetched on a pool of `workers` threads, throttled by
+    `limiter` (defaults to Comtrade's published quota) and retried with
+    backoff on transient errors. `api` defaults to ComtradeAPI over a cached
+    HttpTransport and can be swapped for a stub of the comtradeapicall interface.
+    
+    Progress is recorded per partition in the ingestion manifest, so reruns
+    only fetch partitions that are missing, failed or older than
+    `max_age_days` (recent years only) unless `force` is set.
+    
+    `flows` selects the directions fetched per reporter. With a single one
+    (mirror-statistics mode) processing derives the other from the partners'
+    reports, for about half the API calls.
     """
+    limiter = limiter or TokenBucket()
+    if api is None:
+        api = ComtradeAPI(HttpTransport(limiter=limiter))
+    # A transport takes a token per network request itself, so responses
+    # served from its cache cost no quota
+    call_limiter = None if isinstance(api, ComtradeAPI) else limiter
+    
     # Get current date and last week's date
     today = date.today()
     lastweek = today - timedelta(days=7)
@@ -33,92 +91,131 @@ def fetch_trade_data():
     ]
     
     # Convert ISO3 codes to Comtrade codes
-    country_codes = comtradeapicall.convertCountryIso3ToCode(','.join(countries))
+    country_codes = api.convertCountryIso3ToCode(','.join(countries))
     country_list = country_codes.split(',')
     
     # Trade flows to fetch (M=Imports, X=Exports)
-    flows = ['M', 'X']
+    flows = list(flows)
     flow_names = {'M': 'imports', 'X': 'exports'}
     
     # Create a directory for yearly data
     os.makedirs('data_sources/yearly', exist_ok=True)
     
-    # Fetch data for each year, country, and flow
-    for year in years:
-        print(f"\nFetching data for {year}...")
-        yearly_data = []
-        
-        for country in country_list:
-            for flow in flows:
-                print(f"Fetching {flow_names[flow]} for country code {country}...")
-                try:
-                    # Get preview data
-                    df = comtradeapicall.previewFinalData(
-                        typeCode='C',          # Commodities
-                        freqCode='A',          # Annual
-                        clCode='HS',           # Harmonized System
-                        period=year,           # Year
-                        reporterCode=country,  # Country
-                        cmdCode='TOTAL',       # Total trade
-                        flowCode=flow,         # Imports/Exports
-                        partnerCode=None,      # All partners
-                        partner2Code=None,
-                        customsCode=None,
-                        motCode=None,
-                        maxRecords=500,
-                        format_output='JSON',
-                        aggregateBy=None,
-                        breakdownMode='classic',
-                        countOnly=None,
-                        includeDesc=True
-                    )
-                    
-                    if not df.empty:
-                        # Add to yearly data
-                        yearly_data.extend(df.to_dict('records'))
-                        print(f"Found {len(df)} records")
-                    else:
-                        print("No data found")
-                        
-                except Exception as e:
-                    print(f"Error fetching data: {str(e)}")
+    # One task per (year, country, flow); skip partitions the manifest says are current
+    manifest = load_manifest()
+    all_tasks = [(year, country, flow) for year in years for country in country_list for flow in flows]
+    if force:
+        tasks = all_tasks
+    else:
+        tasks = [task for task in all_tasks
+                 if needs_fetch(manifest.get(partition_key(*task)), task[0],
+                                max_age_days, latest_year=years[-1])]
+    manifest_lock = threading.Lock()
+    metrics = current_stage()
+    metrics.rows_out = 0
+    
+    def record(outcome):
+        # Runs on the worker thread: persist each partition as soon as it lands
+        year, country, flow = outcome['task']
+        key = partition_key(year, country, flow)
+        label = f"{flow_names[flow]} for country code {country} in {year}"
+        if outcome['error'] is not None:
+            print(f"Error fetching {label}: {str(outcome['error'])}")
+            entry = make_entry('failed', error=outcome['error'])
+        elif outcome['data'] is None or outcome['data'].empty:
+            print(f"No data found for {label}")
+            entry = make_entry('empty')
+        else:
+            records = outcome['data'].to_dict('records')
+            print(f"Found {len(records)} records for {label}")
+            entry = make_entry('ok', records, path=partition_path(year, country, flow))
         
-        # Save yearly data
-        if yearly_data:
-            with open(f'data_sources/yearly/trade_data_{year}.json', 'w') as f:
-                json.dump(yearly_data, f, indent=2)
-            print(f"Saved {len(yearly_data)} records for {year}")
+        with manifest_lock:
+            if entry['status'] == 'ok':
+                metrics.rows_out += len(records)
+            previous = manifest.get(key)
+            if previous is not None and outcome['error'] is not None and previous.get('status') == 'ok':
+                # Keep the last good copy; it will be retried on the next run
+                previous['status'] = 'failed'
+                previous['error'] = entry['error']
+                entry = previous
+            elif entry['status'] == 'ok':
+                # Rewrite changed records, and restore a file deleted since the last run
+                if (previous is None or previous.get('hash') != entry['hash'] or previous.get('status') != 'ok'
+                        or not os.path.exists(entry['path'])):
+                    write_partition(year, country, flow, records)
+            elif entry['status'] == 'empty':
+                # The partition no longer has data; processing must stop reading the old copy
+                remove_partition(year, country, flow)
+            manifest[key] = entry
+            save_manifest(manifest)
+    
+    print(f"\n{len(all_tasks) - len(tasks)} of {len(all_tasks)} partitions are up to date; "
+          f"fetching {len(tasks)} with {workers} workers...")
+    with stage('partitions'):
+        _, stats = run_fetches(tasks, lambda task: fetch_partition(api, *task),
+                               workers=workers, limiter=call_limiter, on_result=record)
+    print(f"Made {stats['calls']} calls in {stats['elapsed']:.1f}s "
+          f"({stats['calls_per_second']:.2f} calls/s), {stats['failed']} failed")
+    metrics.set(flows=''.join(flows), partitions=len(all_tasks), fetched=len(tasks),
+                calls=stats['calls'], failed=stats['failed'])
     
     # Fetch and save reference data
     print("\nFetching reference data...")
-    try:
-        # Get list of reporters (countries)
-        reporters_df = comtradeapicall.getReference('reporter')
-        print(f"Found {len(reporters_df)} reporters")
-        
-        # Get list of partners (countries)
-        partners_df = comtradeapicall.getReference('partner')
-        print(f"Found {len(partners_df)} partners")
-        
-        # Save reference data
-        reporters_df.to_json('data_sources/reporters.json', orient='records', indent=2)
-        partners_df.to_json('data_sources/partners.json', orient='records', indent=2)
-        
-        # Create a mapping of country codes to names
-        country_mapping = {
-            row['reporterCode']: {
-                'name': row['reporterDesc'],
-                'iso2': row['reporterCodeIsoAlpha2'],
-                'iso3': row['reporterCodeIsoAlpha3']
+    with stage('reference'):
+        try:
+            # Get list of reporters (countries)
+            reporters_df, _ = call_with_retry(lambda: api.getReference('reporter'), call_limiter)
+            print(f"Found {len(reporters_df)} reporters")
+            
+            # Get list of partners (countries)
+            partners_df, _ = call_with_retry(lambda: api.getReference('partner'), call_limiter)
+            print(f"Found {len(partners_df)} partners")
+            
+            # Save reference data
+            reporters_df.to_json('data_sources/reporters.json', orient='records', indent=2)
+            partners_df.to_json('data_sources/partners.json', orient='records', indent=2)
+            
+            # Create a mapping of country codes to names
+            country_mapping = {
+                row['reporterCode']: {
+                    'name': row['reporterDesc'],
+                    'iso2': row['reporterCodeIsoAlpha2'],
+                    'iso3': row['reporterCodeIsoAlpha3']
+                }
+                for _, row in reporters_df.iterrows()
             }
-            for _, row in reporters_df.iterrows()
-        }
-        
-        with open('data_sources/country_mapping.json', 'w') as f:
-            json.dump(country_mapping, f, indent=2)
             
-    except Exception as e:
-        print(f"Error fetching reference data: {str(e)}")
+            with open('data_sources/country_mapping.json', 'w') as f:
+                json.dump(country_mapping, f, indent=2)
+            
+        except Exception as e:
+            print(f"Error fetching reference data: {str(e)}")
+    
+    if isinstance(api, ComtradeAPI):
+        print(api.transport.summary())
+        metrics.set(**{f'http_{name}': value for name, value in api.transport.stats.items()})
 
 if __name__ == "__main__":
-    fetch_trade_data()
+    parser = argparse.ArgumentParser(description="Fetch UN Comtrade data for the visualization.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="number of concurrent API calls (default: %(default)s)")
+    parser.add_argument('--max-age', type=float, default=DEFAULT_MAX_AGE_DAYS,
+                        help="days before recent-year partitions are refetched (default: %(default)s)")
+    parser.add_argument('--force', action='store_true',
+                        help="refetch every partition regardless of the manifest")
+    parser.add_argument('--flows', choices=list(FLOW_CHOICES), default='both',
+                        help="flows fetched per reporter; with M or X the other is mirrored "
+                             "from partners' reports during processing (default: %(default)s)")
+    parser.add_argument('--http-ttl', type=float, default=DEFAULT_TTL / 3600,
+                        help="hours cached API responses are reused before being revalidated; "
+                             "0 revalidates every one (default: %(default)s)")
+    parser.add_argument('--no-http-cache', action='store_true',
+                        help=f"neither read nor write the response cache in {HTTP_CACHE_DIR}")
+    add_report_arguments(parser)
+    args = parser.parse_args()
+    with HttpTransport(cache_dir=None if args.no_http_cache else HTTP_CACHE_DIR, ttl=args.http_ttl * 3600,
+                       limiter=TokenBucket()) as transport:
+        with RunReport('fetch', profile=args.profile, path=args.report):
+            fetch_trade_data(workers=args.workers, api=ComtradeAPI(transport),
+                             max_age_days=args.max_age, force=args.force, flows=FLOW_CHOICES[args.flows])
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Concurrent, rate-limited fetch engine for UN Comtrade API calls.
+Runs API calls on a bounded thread pool, throttled by a token bucket and
+retried with exponential backoff and jitter.
+"""
+
+import http.client
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from http_transport import HttpError
+
+# Published UN Comtrade quotas for the free (keyless) preview endpoints:
+# one call per second, 500 records per call.
+COMTRADE_CALLS_PER_SECOND = 1.0
+COMTRADE_BURST = 1
+
+# Default pool size; calls spend most of their time waiting on the network
+DEFAULT_WORKERS = 4
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting how often calls may start."""
+
+    def __init__(self, rate=COMTRADE_CALLS_PER_SECOND, capacity=COMTRADE_BURST,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` tokens are available, then take them."""
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=60.0, rng=random):
+    """Exponential backoff with full jitter for the given (0-based) retry attempt."""
+    return rng.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def is_transient(error):
+    """Whether a failed call may succeed if repeated; bad requests and bad parameters never will."""
+    if isinstance(error, HttpError):
+        # Throttled or a server error
+        return error.status == 429 or error.status >= 500
+    # Dropped, refused or timed-out connections
+    return isinstance(error, (ConnectionError, TimeoutError, http.client.HTTPException))
+
+
+def call_with_retry(func, limiter=None, retries=4, base_delay=1.0, max_delay=60.0,
+                    sleep=time.sleep, rng=random):
+    """
+    Call `func()` after taking a token from `limiter`, retrying transient
+    failures. Returns (result, attempts); re-raises any other error at once,
+    and the last transient one once retries run out.
+    """
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return func(), attempt + 1
+        except Exception as e:
+            if attempt >= retries or not is_transient(e):
+                raise
+            sleep(backoff_delay(attempt, base_delay, max_delay, rng))
+            attempt += 1
+
+
+def run_fetches(tasks, fetch, workers=DEFAULT_WORKERS, limiter=None, retries=4,
+                base_delay=1.0, max_delay=60.0, on_result=None):
+    """
+    Run `fetch(task)` for every task on a bounded thread pool.
+
+    Every call goes through `limiter` (a TokenBucket) and `call_with_retry`.
+    `on_result(outcome)` is called from the worker thread as each task
+    finishes. Returns (outcomes, stats): outcomes are dicts with 'task',
+    'data', 'error' and 'attempts' in task order; stats holds call counts,
+    elapsed time and calls per second.
+    """
+    tasks = list(tasks)
+    counter_lock = threading.Lock()
+    calls = [0]
+
+    def run(task):
+        attempts = [0]
+
+        def attempt():
+            attempts[0] += 1
+            with counter_lock:
+                calls[0] += 1
+            return fetch(task)
+
+        try:
+            data, _ = call_with_retry(attempt, limiter, retries, base_delay, max_delay)
+            outcome = {'task': task, 'data': data, 'error': None, 'attempts': attempts[0]}
+        except Exception as e:
+            outcome = {'task': task, 'data': None, 'error': e, 'attempts': attempts[0]}
+        if on_result is not None:
+            on_result(outcome)
+        return outcome
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        outcomes = list(pool.map(run, tasks))
+    elapsed = time.perf_counter() - start
+
+    stats = {
+        'tasks': len(tasks),
+        'calls': calls[0],
+        'failed': sum(1 for o in outcomes if o['error'] is not None),
+        'elapsed': elapsed,
+        'calls_per_second': calls[0] / elapsed if elapsed > 0 else 0.0,
+    }
+    return outcomes, stats
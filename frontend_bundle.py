@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Compact binary data bundle for the frontend.
+Packs only the aggregates each chart draws into a single file: strings are
+dictionary-encoded into one shared table, and numeric columns are stored as
+little-endian arrays that the browser reads as typed-array views without
+parsing. A gzip copy (and a brotli copy when the brotli package is
+installed) is written next to it.
+
+Layout: b'TRDB' | uint32 version | uint32 header length | JSON header | body.
+The header lists the string table and the dtype, offset and length of every
+column; offsets are relative to the body, which starts 8-byte aligned.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+from build_cache import BuildCache, code_version, stage_key
+from graph_pruning import edge_levels
+from trade_cube import CSV_CHUNK_SIZE, TradeCube
+
+PROCESSED_DIR = 'data/processed'
+BUNDLE_PATH = os.path.join(PROCESSED_DIR, 'trade_bundle.bin')
+BUNDLE_MAGIC = b'TRDB'
+BUNDLE_VERSION = 1
+
+# Typed array views need offsets aligned to their element size
+ALIGNMENT = 8
+
+# Processed outputs the bundle is built from
+BUNDLE_SOURCES = ['trade_flows_raw.csv', 'trade_summary.csv', 'yearly_trade_summary.csv',
+                  'trade_network.json', 'trade_matrix.json', 'sector_trade_flows.csv',
+                  'sector_layout.json', 'trade_cube.npz', 'sector_cube.npz', 'trade_indicators.csv',
+                  'summary_indicators.csv', 'country_index.json']
+
+# Column dtypes of each table; 'str' columns are indices into the string table
+TABLE_COLUMNS = {
+    'summary': {'country_code': 'i4', 'country': 'str', 'imports': 'f8',
+                'exports': 'f8', 'balance': 'f8', 'trade_openness': 'f8', 'export_ratio': 'f8',
+                'trade_balance_ratio': 'f8', 'export_concentration': 'f8', 'import_concentration': 'f8'},
+    'indicators': {'year': 'i2', 'country_code': 'i4', 'country': 'str', 'gdp': 'f8', 'gdp_year': 'f4',
+                   'trade_openness': 'f8', 'export_ratio': 'f8', 'trade_balance_ratio': 'f8',
+                   'export_concentration': 'f8', 'import_concentration': 'f8', 'top_partner_code': 'i4',
+                   'top_partner_share': 'f4', 'top_partners_share': 'f4'},
+    'yearly': {'year': 'i2', 'country_code': 'i4', 'country': 'str', 'imports': 'f8',
+               'exports': 'f8', 'balance': 'f8', 'total_trade': 'f8'},
+    'flows': {'year': 'i2', 'reporter_code': 'i4', 'reporter': 'str', 'partner_code': 'i4',
+              'partner': 'str', 'flow': 'str', 'value': 'f8', 'lod': 'u1'},
+    'sectors': {'sector': 'str', 'reporter': 'str', 'partner': 'str', 'reporter_code': 'i4',
+                'partner_code': 'i4', 'value': 'f8', 'year': 'i2', 'flow': 'str'},
+    'network_nodes': {'id': 'str', 'name': 'str', 'code': 'str', 'layout_x': 'f4', 'layout_y': 'f4'},
+    'network_links': {'source': 'str', 'target': 'str', 'value': 'f8', 'lod': 'u1'},
+    'sector_layout': {'sector': 'str', 'country': 'str', 'layout_x': 'f4', 'layout_y': 'f4'},
+    'countries': {'code': 'i4', 'iso2': 'str', 'iso3': 'str', 'name': 'str', 'region': 'str', 'reporter': 'u1'},
+}
+
+
+class BundleWriter:
+    """Collects tables and arrays, then lays them out as one binary bundle."""
+
+    def __init__(self):
+        self.strings = []
+        self._string_ids = {}
+        self.tables = {}
+        self.arrays = {}
+        self.cubes = {}
+
+    def encode_strings(self, values):
+        """Dictionary-encode `values` into the shared string table."""
+        ids = np.empty(len(values), dtype=np.int64)
+        for i, value in enumerate(values):
+            value = str(value)
+            if value not in self._string_ids:
+                self._string_ids[value] = len(self.strings)
+                self.strings.append(value)
+            ids[i] = self._string_ids[value]
+        return ids
+
+    def _column(self, values, dtype):
+        if dtype == 'str':
+            return 'str', self.encode_strings(list(values))
+        return dtype, np.asarray(values).astype('<' + dtype)
+
+    def add_table(self, name, frame, columns):
+        """Add the `columns` ({name: dtype}) of a DataFrame as a table."""
+        self.tables[name] = (len(frame), [(column, *self._column(frame[column].tolist(), dtype))
+                                          for column, dtype in columns.items()])
+
+    def add_array(self, name, values, dtype):
+        """Add an n-dimensional array (a list of strings when `dtype` is 'str')."""
+        shape = list(np.shape(values))
+        flat = np.asarray(values).ravel().tolist()
+        self.arrays[name] = (shape, *self._column(flat, dtype))
+
+    def add_cube(self, name, cube, dtype='f4'):
+        """
+        Add a TradeCube as arrays: `name` holds the values, `name.axis` the
+        labels of each axis and `name.axis_names` its display names.
+        """
+        self.add_array(name, cube.values, dtype)
+        for axis in cube.axes:
+            labels = cube.labels[axis]
+            self.add_array(f'{name}.{axis}', labels, 'str' if labels.dtype == object else 'i4')
+            if axis in cube.names:
+                self.add_array(f'{name}.{axis}_names', cube.names[axis], 'str')
+        self.cubes[name] = {'axes': cube.axes, 'names': [axis for axis in cube.axes if axis in cube.names]}
+
+    def to_bytes(self):
+        """Serialize everything added so far."""
+        # String indices are as narrow as the table allows
+        string_dtype = 'u2' if len(self.strings) <= 0xFFFF else 'u4'
+        body = bytearray()
+
+        def place(dtype, data):
+            is_string = dtype == 'str'
+            if is_string:
+                dtype = string_dtype
+                data = data.astype('<' + string_dtype)
+            body.extend(b'\0' * (-len(body) % ALIGNMENT))
+            offset = len(body)
+            body.extend(data.tobytes())
+            return {'dtype': dtype, 'offset': offset, 'strings': is_string}
+
+        header = {'strings': self.strings, 'tables': {}, 'arrays': {}, 'cubes': self.cubes}
+        for name, (rows, columns) in self.tables.items():
+            header['tables'][name] = {
+                'rows': rows,
+                'columns': [dict(name=column, **place(dtype, data)) for column, dtype, data in columns],
+            }
+        for name, (shape, dtype, data) in self.arrays.items():
+            header['arrays'][name] = dict(shape=shape, **place(dtype, data))
+
+        header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        # Pad the header with spaces so the body starts aligned
+        header_bytes += b' ' * (-(12 + len(header_bytes)) % ALIGNMENT)
+        return BUNDLE_MAGIC + struct.pack('<II', BUNDLE_VERSION, len(header_bytes)) + header_bytes + bytes(body)
+
+
+def read_csv(path):
+    """Read a processed CSV keeping strings verbatim and floats exact."""
+    return pd.read_csv(path, keep_default_na=False, float_precision='round_trip')
+
+
+def read_latest_year(path, chunk_size=CSV_CHUNK_SIZE):
+    """
+    The rows of a processed CSV in its latest `year`, read in chunks so the
+    rest of the history never sits in memory.
+    """
+    latest, parts = None, []
+    for chunk in pd.read_csv(path, keep_default_na=False, float_precision='round_trip', chunksize=chunk_size):
+        year = chunk['year'].max()
+        if latest is None or year > latest:
+            latest, parts = year, []
+        parts.append(chunk[chunk['year'] == latest])
+    return pd.concat(parts) if parts else read_csv(path)
+
+
+def build_bundle(processed_dir=PROCESSED_DIR):
+    """
+    Build the bundle bytes from the processed outputs.
+    Charts only draw the latest year of trade flows (the map) and of sector
+    flows, so other rows are left out. Map flows carry a level of detail
+    like the network links, and the countries table is the compiled country
+    index (ISO codes, names and regions of every code). Summary rows carry their
+    indicators and come ordered by total trade; the indicators table holds
+    each year's indicators and GDP reference year (NaN where GDP is unknown).
+    """
+    writer = BundleWriter()
+
+    summary = read_csv(os.path.join(processed_dir, 'trade_summary.csv'))
+    summary_indicators = pd.read_csv(os.path.join(processed_dir, 'summary_indicators.csv'),
+                                     float_precision='round_trip')
+    indicator_columns = [column for column in TABLE_COLUMNS['summary'] if column not in summary]
+    summary = summary.merge(summary_indicators[['country_code'] + indicator_columns], on='country_code', how='left')
+    summary = summary.iloc[np.argsort(-(summary['exports'] + summary['imports']).to_numpy(), kind='stable')]
+    writer.add_table('summary', summary, TABLE_COLUMNS['summary'])
+    writer.add_table('indicators', pd.read_csv(os.path.join(processed_dir, 'trade_indicators.csv'),
+                                               keep_default_na=False, na_values=[''], float_precision='round_trip'),
+                     TABLE_COLUMNS['indicators'])
+    writer.add_table('yearly', read_csv(os.path.join(processed_dir, 'yearly_trade_summary.csv')),
+                     TABLE_COLUMNS['yearly'])
+
+    flows = read_latest_year(os.path.join(processed_dir, 'trade_flows_raw.csv'))
+    flows = flows.assign(lod=edge_levels(flows['reporter_code'], flows['partner_code'], flows['value']))
+    writer.add_table('flows', flows, TABLE_COLUMNS['flows'])
+
+    sectors = read_latest_year(os.path.join(processed_dir, 'sector_trade_flows.csv'))
+    writer.add_table('sectors', sectors, TABLE_COLUMNS['sectors'])
+
+    with open(os.path.join(processed_dir, 'trade_network.json'), 'r') as f:
+        network = json.load(f)
+    writer.add_table('network_nodes', pd.DataFrame(network['nodes'], columns=list(TABLE_COLUMNS['network_nodes'])),
+                     TABLE_COLUMNS['network_nodes'])
+    writer.add_table('network_links', pd.DataFrame(network['links'], columns=list(TABLE_COLUMNS['network_links'])),
+                     TABLE_COLUMNS['network_links'])
+
+    with open(os.path.join(processed_dir, 'sector_layout.json'), 'r') as f:
+        sector_layout = json.load(f)
+    writer.add_table('sector_layout', pd.DataFrame(
+        [(sector, country, x, y) for sector, positions in sector_layout.items()
+         for country, (x, y) in positions.items()],
+        columns=list(TABLE_COLUMNS['sector_layout'])), TABLE_COLUMNS['sector_layout'])
+
+    with open(os.path.join(processed_dir, 'trade_matrix.json'), 'r') as f:
+        matrix = json.load(f)
+    writer.add_array('matrix_countries', matrix['countries'], 'str')
+    writer.add_array('matrix', np.array(matrix['matrix'], dtype=float).reshape(-1, len(matrix['countries'])), 'f8')
+
+    # Float32 halves the cubes; the float64 originals stay in the .npz files
+    writer.add_cube('trade_cube', TradeCube.load(os.path.join(processed_dir, 'trade_cube.npz')))
+    writer.add_cube('sector_cube', TradeCube.load(os.path.join(processed_dir, 'sector_cube.npz')))
+
+    # The compiled country index, rows in lookup preference order
+    with open(os.path.join(processed_dir, 'country_index.json'), 'r') as f:
+        countries = json.load(f)
+    countries['region'] = [countries['regions'][region] for region in countries['region']]
+    writer.add_table('countries', pd.DataFrame({column: countries[column] for column in TABLE_COLUMNS['countries']}),
+                     TABLE_COLUMNS['countries'])
+    writer.add_array('country_regions', countries['regions'], 'str')
+    writer.add_array('country_index_version', [countries['version']], 'str')
+
+    return writer.to_bytes()
+
+
+def read_bundle(path=BUNDLE_PATH):
+    """
+    Decode a bundle into {'tables': {name: DataFrame}, 'arrays': {name: ndarray},
+    'cubes': {name: TradeCube}}.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != BUNDLE_MAGIC:
+        raise ValueError(f"{path} is not a trade bundle")
+    version, header_length = struct.unpack_from('<II', data, 4)
+    if version != BUNDLE_VERSION:
+        raise ValueError(f"Unsupported bundle version {version}")
+    header = json.loads(data[12:12 + header_length])
+    body = memoryview(data)[12 + header_length:]
+    strings = np.array(header['strings'], dtype=object)
+
+    def decode(meta, count):
+        values = np.frombuffer(body, dtype='<' + meta['dtype'], count=count, offset=meta['offset'])
+        return strings[values] if meta['strings'] else values
+
+    tables = {name: pd.DataFrame({meta['name']: decode(meta, table['rows']) for meta in table['columns']})
+              for name, table in header['tables'].items()}
+    arrays = {name: decode(meta, int(np.prod(meta['shape']))).reshape(meta['shape'])
+              for name, meta in header['arrays'].items()}
+    cubes = {name: TradeCube(cube['axes'], {axis: arrays[f'{name}.{axis}'] for axis in cube['axes']},
+                             arrays[name], {axis: arrays[f'{name}.{axis}_names'] for axis in cube['names']})
+             for name, cube in header.get('cubes', {}).items()}
+    return {'tables': tables, 'arrays': arrays, 'cubes': cubes}
+
+
+def write_bundle(path=BUNDLE_PATH, processed_dir=PROCESSED_DIR, use_cache=False):
+    """
+    Write the bundle with its compressed copies and return the paths written.
+    With `use_cache` nothing is rebuilt while the processed outputs are unchanged.
+    """
+    outputs = [path, path + '.gz']
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    if brotli is not None:
+        outputs.append(path + '.br')
+
+    if use_cache:
+        cache = BuildCache()
+        bundle_key = stage_key([os.path.join(processed_dir, name) for name in BUNDLE_SOURCES],
+                               code_version(__name__, 'graph_pruning', 'trade_cube'), {'brotli': brotli is not None})
+        if cache.is_fresh('bundle', bundle_key):
+            print("Frontend bundle is up to date")
+            return outputs
+
+    data = build_bundle(processed_dir)
+    with open(path, 'wb') as f:
+        f.write(data)
+    # mtime=0 keeps the gzip copy byte-identical across rebuilds
+    with gzip.GzipFile(path + '.gz', 'wb', compresslevel=9, mtime=0) as f:
+        f.write(data)
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+    if use_cache:
+        cache.record('bundle', bundle_key, outputs)
+
+    sizes = ', '.join(f"{os.path.basename(p)} {os.path.getsize(p) / 1e3:.1f} kB" for p in outputs)
+    print(f"Wrote frontend bundle: {sizes}")
+    return outputs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the binary data bundle loaded by the frontend.")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="rebuild the bundle even if the processed outputs are unchanged")
+    args = parser.parse_args()
+
+    write_bundle(use_cache=not args.no_cache)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Offline force-directed layouts for the trade networks.
+Runs a NumPy-vectorized Fruchterman-Reingold layout for the country network
+and for each sector subgraph, so the frontend can place nodes directly and
+only run a few settling ticks instead of a full force simulation. Sector
+graphs are laid out for the most recent year, the one the page draws.
+Coordinates are normalized to [0, 1] and are stable for the same graph and seed.
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+LAYOUT_ITERATIONS = 300
+LAYOUT_SEED = 0
+
+# Nodes are kept this far from the edges of the unit square
+LAYOUT_MARGIN = 0.05
+
+# Pull toward the center, so disconnected nodes stay in view
+GRAVITY = 0.05
+
+# Node pairs whose repulsion is computed at once; the pairwise arrays are
+# built in blocks of rows this size allows, so memory stays at a few tens
+# of MB however many nodes there are (a single block below 1024 nodes)
+REPULSION_BLOCK_PAIRS = 1 << 20
+
+SECTOR_LAYOUT_PATH = 'data/processed/sector_layout.json'
+
+
+def repulsion(positions, k, block_pairs=REPULSION_BLOCK_PAIRS):
+    """
+    Displacement of every node from the repulsion k^2 / d of all others,
+    computed for blocks of rows with at most `block_pairs` pairs each.
+    """
+    n = len(positions)
+    rows = max(1, block_pairs // n)
+    displacement = np.empty_like(positions)
+    for start in range(0, n, rows):
+        block = positions[start:start + rows]
+        delta = block[:, None, :] - positions[None, :, :]
+        distance = np.maximum(np.sqrt((delta ** 2).sum(axis=-1)), 1e-4)
+        # No node repels itself
+        distance[np.arange(len(block)), np.arange(start, start + len(block))] = np.inf
+        displacement[start:start + rows] = (delta * (k * k / distance ** 2)[..., None]).sum(axis=1)
+    return displacement
+
+
+def force_layout(n, sources, targets, weights=None, iterations=LAYOUT_ITERATIONS, seed=LAYOUT_SEED):
+    """
+    Fruchterman-Reingold layout of `n` nodes joined by `sources[i]` ->
+    `targets[i]` edges, with attraction scaled by `weights` (default 1).
+    Every iteration updates all nodes at once from the pairwise repulsion
+    (see `repulsion`) and per-edge attraction arrays. Returns an (n, 2)
+    array in [0, 1].
+    """
+    if n == 0:
+        return np.zeros((0, 2))
+    if n == 1:
+        return np.full((1, 2), 0.5)
+
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    weights = np.ones(len(sources)) if weights is None else np.asarray(weights, dtype=float)
+
+    rng = np.random.default_rng(seed)
+    positions = rng.random((n, 2))
+    k = np.sqrt(1.0 / n)  # Ideal edge length in the unit square
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+
+    for _ in range(iterations):
+        displacement = repulsion(positions, k)
+
+        # Attraction d^2 / k along each edge
+        edge_delta = positions[sources] - positions[targets]
+        edge_distance = np.sqrt((edge_delta ** 2).sum(axis=-1))
+        force = edge_delta * (edge_distance * weights / k)[:, None]
+        np.add.at(displacement, sources, -force)
+        np.add.at(displacement, targets, force)
+
+        displacement -= GRAVITY * (positions - positions.mean(axis=0)) / k
+
+        # Move each node at most `temperature`
+        length = np.maximum(np.sqrt((displacement ** 2).sum(axis=-1)), 1e-9)
+        positions += displacement * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= cooling
+
+    # Fit into the unit square, keeping the aspect ratio
+    positions -= positions.min(axis=0)
+    positions /= max(positions.max(), 1e-9)
+    positions += (1 - positions.max(axis=0)) / 2
+    return LAYOUT_MARGIN + positions * (1 - 2 * LAYOUT_MARGIN)
+
+
+def edge_weights(values):
+    """Attraction weights from trade values: square-root scaled to (0, 1]."""
+    values = np.asarray(values, dtype=float)
+    if not len(values) or values.max() <= 0:
+        return np.ones(len(values))
+    return np.sqrt(np.maximum(values, 0) / values.max())
+
+
+def layout_graph(node_ids, sources, targets, values, seed=LAYOUT_SEED):
+    """Layout of a graph given by node ids and edge endpoint ids; returns {id: [x, y]}."""
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+    pairs = [(index[s], index[t]) for s, t in zip(sources, targets) if s in index and t in index and s != t]
+    values = [v for s, t, v in zip(sources, targets, values) if s in index and t in index and s != t]
+    positions = force_layout(len(node_ids), [p[0] for p in pairs], [p[1] for p in pairs],
+                             edge_weights(values), seed=seed)
+    return {node_id: [round(x, 4), round(y, 4)] for node_id, (x, y) in zip(node_ids, positions.tolist())}
+
+
+def add_network_layout(trade_network, seed=LAYOUT_SEED):
+    """Add `layout_x`/`layout_y` to every node of a trade network in place."""
+    links = trade_network['links']
+    layout = layout_graph([node['id'] for node in trade_network['nodes']],
+                          [link['source'] for link in links], [link['target'] for link in links],
+                          [link['value'] for link in links], seed)
+    for node in trade_network['nodes']:
+        node['layout_x'], node['layout_y'] = layout[node['id']]
+    return trade_network
+
+
+def sector_layouts(sector_df, seed=LAYOUT_SEED):
+    """
+    Layout of each sector's most recent year, as {sector: {country name: [x, y]}}.
+    Node ids are country names, as in the frontend's sector graph.
+    """
+    layouts = {}
+    if sector_df.empty:
+        return layouts
+    recent = sector_df[sector_df['year'] == sector_df['year'].max()]
+    for sector, frame in recent.groupby('sector', sort=False):
+        names = pd.unique(pd.concat([frame['reporter'], frame['partner']])).tolist()
+        layouts[sector] = layout_graph(names, frame['reporter'].tolist(), frame['partner'].tolist(),
+                                       frame['value'].tolist(), seed)
+    return layouts
+
+
+def write_sector_layouts(sector_df, path=SECTOR_LAYOUT_PATH, seed=LAYOUT_SEED):
+    """Compute and save the sector layouts; return them."""
+    layouts = sector_layouts(sector_df, seed)
+    with open(path, 'w') as f:
+        json.dump(layouts, f)
+    return layouts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute network layouts for existing processed outputs.")
+    parser.add_argument('--seed', type=int, default=LAYOUT_SEED,
+                        help="random seed for the initial positions (default: %(default)s)")
+    args = parser.parse_args()
+
+    network_path = 'data/processed/trade_network.json'
+    with open(network_path, 'r') as f:
+        trade_network = json.load(f)
+    with open(network_path, 'w') as f:
+        json.dump(add_network_layout(trade_network, args.seed), f)
+    print(f"Laid out {len(trade_network['nodes'])} network nodes")
+
+    sector_path = 'data/processed/sector_trade_flows.csv'
+    if os.path.exists(sector_path):
+        sector_df = pd.read_csv(sector_path, keep_default_na=False, float_precision='round_trip')
+        layouts = write_sector_layouts(sector_df, seed=args.seed)
+        print(f"Laid out {len(layouts)} sector graphs")
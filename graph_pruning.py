@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Build-time edge pruning for the trade networks.
+Ranks every edge into nested levels of detail: the disparity-filter
+backbone first, then each country's top partners, then the partners making
+up a growing share of its trade, and finally everything else. Each edge is
+tagged with the first level that includes it, so the frontend can draw the
+largest level that fits its render budget.
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+# (method, parameter) of each level of detail, from sparsest to complete
+LOD_LEVELS = [
+    ('disparity', 0.01),
+    ('top_k', 3),
+    ('share', 0.8),
+    ('share', 0.95),
+    ('all', None),
+]
+
+
+def _group_ranks(groups, values):
+    """
+    Order edges by group, largest value first. Returns the order and each
+    ordered edge's rank within its group.
+    """
+    order = np.lexsort((-values, groups))
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    counts = np.diff(np.r_[starts, len(order)])
+    ranks = np.arange(len(order)) - np.repeat(starts, counts)
+    return order, ranks
+
+
+def top_k(sources, targets, values, k):
+    """Edges among the `k` largest out-edges of their source or in-edges of their target."""
+    keep = np.zeros(len(values), dtype=bool)
+    for groups in (sources, targets):
+        order, ranks = _group_ranks(groups, values)
+        keep[order[ranks < k]] = True
+    return keep
+
+
+def cumulative_share(sources, targets, values, share):
+    """
+    Edges among the largest that together make up `share` of their
+    source's exports or their target's imports (the edge crossing the
+    threshold is kept).
+    """
+    keep = np.zeros(len(values), dtype=bool)
+    for groups in (sources, targets):
+        order, ranks = _group_ranks(groups, values)
+        sorted_values = values[order]
+        totals = np.bincount(groups, weights=values)[groups[order]]
+        # Sum of the larger values in the same group, before each edge
+        before = np.cumsum(sorted_values) - sorted_values
+        before -= before[np.arange(len(order)) - ranks]
+        keep[order[before < share * totals]] = True
+    return keep
+
+
+def disparity_filter(sources, targets, values, alpha):
+    """
+    Disparity-filter backbone (Serrano, Boguna and Vespignani, 2009): edges
+    whose share of their source's out-strength or their target's in-strength
+    is significant at level `alpha` against a uniform null model. Edges of
+    nodes with a single edge are always kept.
+    """
+    keep = np.zeros(len(values), dtype=bool)
+    for groups in (sources, targets):
+        strength = np.bincount(groups, weights=values)[groups]
+        degree = np.bincount(groups)[groups]
+        share = np.divide(values, strength, out=np.zeros(len(values)), where=strength > 0)
+        p_value = (1 - share) ** (degree - 1)
+        keep |= (p_value < alpha) | (degree == 1)
+    return keep
+
+
+PRUNING_METHODS = {
+    'disparity': disparity_filter,
+    'top_k': top_k,
+    'share': cumulative_share,
+    'all': lambda sources, targets, values, param: np.ones(len(values), dtype=bool),
+}
+
+
+def edge_levels(sources, targets, values, levels=LOD_LEVELS):
+    """
+    Level of detail of each edge: the index of the first level in `levels`
+    that keeps it. Levels are nested, so level i shows every edge with lod <= i.
+    Sources and targets may be any hashable ids.
+    """
+    values = np.asarray(values, dtype=float)
+    _, ids = np.unique(np.concatenate([np.asarray(sources), np.asarray(targets)]).astype(str),
+                       return_inverse=True)
+    source_ids, target_ids = ids[:len(values)], ids[len(values):]
+
+    lod = np.full(len(values), len(levels) - 1, dtype=np.int64)
+    assigned = np.zeros(len(values), dtype=bool)
+    for level, (method, param) in enumerate(levels):
+        keep = PRUNING_METHODS[method](source_ids, target_ids, values, param) & ~assigned
+        lod[keep] = level
+        assigned |= keep
+    return lod
+
+
+def level_summary(lod, levels=LOD_LEVELS):
+    """Method, parameter and cumulative edge count of each level."""
+    counts = np.cumsum(np.bincount(lod, minlength=len(levels)))
+    return [{'level': level, 'method': method, 'param': param, 'links': int(count)}
+            for level, ((method, param), count) in enumerate(zip(levels, counts.tolist()))]
+
+
+def add_link_levels(trade_network, levels=LOD_LEVELS):
+    """Tag every link of a trade network with its `lod` and add a `levels` summary, in place."""
+    links = trade_network['links']
+    lod = edge_levels([link['source'] for link in links], [link['target'] for link in links],
+                      [link['value'] for link in links], levels)
+    for link, level in zip(links, lod.tolist()):
+        link['lod'] = level
+    trade_network['levels'] = level_summary(lod, levels)
+    return trade_network
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Tag the links of an existing trade_network.json with levels of detail.")
+    parser.add_argument('--path', default='data/processed/trade_network.json')
+    args = parser.parse_args()
+
+    with open(args.path, 'r') as f:
+        trade_network = json.load(f)
+    add_link_levels(trade_network)
+    with open(args.path, 'w') as f:
+        json.dump(trade_network, f)
+    for level in trade_network['levels']:
+        print(f"Level {level['level']} ({level['method']} {level['param']}): {level['links']} links")
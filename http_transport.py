@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP transport for the fetch scripts.
+GET requests go over pooled keep-alive connections (one pool per host), and
+responses are cached on disk under data_sources/.http_cache. A cached
+response is served without touching the network until its TTL runs out,
+then revalidated with If-None-Match / If-Modified-Since, so an unchanged
+resource costs a 304 rather than a download. Identical requests in flight
+at the same time share a single network call.
+"""
+
+import argparse
+import gzip
+import hashlib
+import http.client
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlencode, urlsplit
+
+HTTP_CACHE_DIR = 'data_sources/.http_cache'
+
+# Seconds a cached response is served before it is revalidated
+DEFAULT_TTL = 24 * 3600
+
+DEFAULT_TIMEOUT = 60
+
+# Idle keep-alive connections kept per host
+MAX_IDLE_CONNECTIONS = 8
+
+USER_AGENT = 'global-trade-visualizer'
+
+# Response headers stored with a cached body
+CACHED_HEADERS = ['content-type', 'etag', 'last-modified']
+
+
+class HttpError(Exception):
+    """A response with a status other than 200 or 304."""
+
+    def __init__(self, url, status, reason=''):
+        super().__init__(f"HTTP {status} {reason} for {url}")
+        self.url = url
+        self.status = status
+
+
+class Response:
+    """
+    A fetched body. `source` is 'network', 'cache' (served without a
+    request) or 'revalidated' (the server answered 304 Not Modified).
+    """
+
+    def __init__(self, url, status, headers, body, source):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.source = source
+
+    @property
+    def text(self):
+        return self.body.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.body)
+
+
+def build_url(url, params=None):
+    """`url` with the non-None `params` appended in sorted order, so equal requests get equal URLs."""
+    query = urlencode(sorted((key, str(value)) for key, value in (params or {}).items() if value is not None))
+    if not query:
+        return url
+    return url + ('&' if urlsplit(url).query else '?') + query
+
+
+def cache_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+class ConnectionPool:
+    """Idle keep-alive connections per (scheme, host, port)."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_idle=MAX_IDLE_CONNECTIONS):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.idle = {}
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, origin):
+        """An idle connection to `origin` if there is one, else a new one; returns (connection, reused)."""
+        with self.lock:
+            idle = self.idle.get(origin)
+            if idle:
+                return idle.pop(), True
+            self.opened += 1
+        scheme, host, port = origin
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return connection_class(host, port, timeout=self.timeout), False
+
+    def release(self, origin, connection):
+        with self.lock:
+            idle = self.idle.setdefault(origin, [])
+            if len(idle) < self.max_idle:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self.lock:
+            connections = [connection for idle in self.idle.values() for connection in idle]
+            self.idle.clear()
+        for connection in connections:
+            connection.close()
+
+
+class HttpTransport:
+    """
+    Cached, pooled GET requests. `cache_dir=None` disables the disk cache and
+    `ttl=0` revalidates every cached response. Network requests (including
+    revalidations) take a token from `limiter` when one is given, so cache
+    hits cost no API quota. Safe to share between threads.
+    """
+
+    def __init__(self, cache_dir=HTTP_CACHE_DIR, ttl=DEFAULT_TTL, timeout=DEFAULT_TIMEOUT, limiter=None,
+                 max_idle=MAX_IDLE_CONNECTIONS, clock=time.time):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.limiter = limiter
+        self.clock = clock
+        self.pool = ConnectionPool(timeout, max_idle)
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'cache_hits': 0, 'revalidated': 0, 'downloaded': 0,
+                      'coalesced': 0, 'network': 0, 'bytes': 0}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def close(self):
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def count(self, **increments):
+        with self.lock:
+            for name, value in increments.items():
+                self.stats[name] += value
+
+    def summary(self):
+        """One line of request counts for the fetch logs."""
+        stats = dict(self.stats, connections=self.pool.opened)
+        return (f"{stats['requests']} HTTP requests: {stats['cache_hits']} from cache, "
+                f"{stats['revalidated']} revalidated, {stats['downloaded']} downloaded "
+                f"({stats['bytes'] / 1e6:.1f} MB), {stats['coalesced']} coalesced; "
+                f"{stats['network']} network requests over {stats['connections']} connections")
+
+    def get(self, url, params=None, ttl=None, cacheable=None):
+        """
+        GET `url` with query `params` and return a Response, from the cache
+        while it is fresh. `ttl` overrides the transport's TTL for this
+        response. A body for which `cacheable(body)` is false, such as an
+        error reported with status 200, is neither stored nor revalidated,
+        and evicts the cached copy. Raises HttpError for statuses other than
+        200 and 304.
+        """
+        url = build_url(url, params)
+        key = cache_key(url)
+        self.count(requests=1)
+
+        # The first caller fetches; identical concurrent calls wait for its result
+        with self.lock:
+            call = self.inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self.inflight[key] = Future()
+            else:
+                self.stats['coalesced'] += 1
+        if not leader:
+            return call.result()
+
+        try:
+            response = self._get(url, key, self.ttl if ttl is None else ttl, cacheable)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(response)
+            return response
+        finally:
+            with self.lock:
+                del self.inflight[key]
+
+    def _get(self, url, key, ttl, cacheable=None):
+        cached = self._read_cache(key)
+        if cached is not None and cacheable is not None and not cacheable(cached[1]):
+            # Stored before the caller said it was uncacheable; fetch it afresh
+            self._evict(key)
+            cached = None
+        headers = {}
+        if cached is not None:
+            meta, body = cached
+            if self.clock() < meta['stored'] + ttl:
+                self.count(cache_hits=1)
+                return Response(url, 200, meta['headers'], body, 'cache')
+            if meta['headers'].get('etag'):
+                headers['If-None-Match'] = meta['headers']['etag']
+            if meta['headers'].get('last-modified'):
+                headers['If-Modified-Since'] = meta['headers']['last-modified']
+
+        status, reason, response_headers, response_body = self._request(url, headers)
+        if status == 304 and cached is not None:
+            meta, body = cached
+            meta['headers'].update({name: response_headers[name] for name in CACHED_HEADERS
+                                    if name in response_headers})
+            meta['stored'] = self.clock()
+            self._write_cache(key, meta)
+            self.count(revalidated=1)
+            return Response(url, 200, meta['headers'], body, 'revalidated')
+        if status != 200:
+            raise HttpError(url, status, reason)
+
+        self.count(downloaded=1, bytes=len(response_body))
+        kept = {name: response_headers[name] for name in CACHED_HEADERS if name in response_headers}
+        if cacheable is not None and not cacheable(response_body):
+            self._evict(key)
+        elif 'no-store' not in response_headers.get('cache-control', ''):
+            self._write_cache(key, {'url': url, 'stored': self.clock(), 'headers': kept}, response_body)
+        return Response(url, status, kept, response_body, 'network')
+
+    def _request(self, url, headers):
+        """One GET over a pooled connection; returns (status, reason, lowercased headers, decoded body)."""
+        if self.limiter is not None:
+            self.limiter.acquire()
+        parts = urlsplit(url)
+        origin = (parts.scheme, parts.hostname, parts.port)
+        target = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        headers = dict(headers, **{'Accept-Encoding': 'gzip', 'User-Agent': USER_AGENT})
+
+        while True:
+            connection, reused = self.pool.acquire(origin)
+            try:
+                self.count(network=1)
+                connection.request('GET', target, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                # The server may have dropped an idle connection; retry once on a fresh one
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            self.pool.release(origin, connection)
+        response_headers = {name.lower(): value for name, value in response.getheaders()}
+        if response_headers.get('content-encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return response.status, response.reason, response_headers, body
+
+    def _cache_paths(self, key):
+        return os.path.join(self.cache_dir, key + '.json'), os.path.join(self.cache_dir, key + '.body')
+
+    def _read_cache(self, key):
+        if not self.cache_dir:
+            return None
+        meta_path, body_path = self._cache_paths(key)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, key, meta, body=None):
+        """Store an entry; the body (when given) lands before the metadata that makes it visible."""
+        if not self.cache_dir:
+            return
+        meta_path, body_path = self._cache_paths(key)
+        if body is not None:
+            with open(body_path + '.tmp', 'wb') as f:
+                f.write(body)
+            os.replace(body_path + '.tmp', body_path)
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def _evict(self, key):
+        """Remove an entry; the metadata goes first, so a reader never sees it without its body."""
+        if not self.cache_dir:
+            return
+        for path in self._cache_paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """Remove every cached response."""
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return 0
+        names = [name for name in os.listdir(self.cache_dir) if name.endswith(('.json', '.body'))]
+        for name in names:
+            os.remove(os.path.join(self.cache_dir, name))
+        return sum(name.endswith('.json') for name in names)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the HTTP response cache.")
+    parser.add_argument('--clear', action='store_true', help="remove every cached response")
+    parser.add_argument('--cache-dir', default=HTTP_CACHE_DIR)
+    args = parser.parse_args()
+
+    transport = HttpTransport(cache_dir=args.cache_dir)
+    if args.clear:
+        print(f"Removed {transport.clear()} cached responses from {args.cache_dir}")
+    else:
+        now = time.time()
+        for name in sorted(os.listdir(args.cache_dir)):
+            if name.endswith('.json'):
+                with open(os.path.join(args.cache_dir, name), 'r') as f:
+                    meta = json.load(f)
+                size = os.path.getsize(os.path.join(args.cache_dir, name[:-5] + '.body'))
+                print(f"{(now - meta['stored']) / 3600:7.1f}h {size / 1e3:9.1f} kB  {meta['url']}")
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Per-stage instrumentation for the data pipeline.
+Stages are timed with `stage(name)` blocks, which record wall and CPU time,
+peak resident memory, bytes read and written, and the rows the stage took
+in and produced. While a RunReport is active its stages are collected and
+saved as a JSON run report, so runs can be compared as data volumes grow.
+
+Stages can also be profiled with cProfile (one .prof file per stage, for
+pstats or snakeviz). Each stage records its pid and start/end timestamps,
+so samples from an external profiler such as `py-spy record --pid` can be
+lined up with the stages.
+
+Memory and I/O figures come from /proc on Linux. Elsewhere the peak RSS is
+the process-wide peak so far, and bytes are not reported.
+"""
+
+import argparse
+import cProfile
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
+
+RUN_REPORT_DIR = 'data/processed/.runs'
+
+# Report collecting the stages of the current run, if any
+_active = None
+
+# Stages currently running, outermost first
+_running = []
+
+
+def _read_proc(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def io_counters():
+    """Bytes this process has read and written so far (None where /proc is unavailable)."""
+    text = _read_proc('/proc/self/io')
+    if text is None:
+        return None
+    fields = dict(line.split(': ') for line in text.splitlines())
+    return int(fields['rchar']), int(fields['wchar'])
+
+
+def peak_rss():
+    """Peak resident memory in bytes since the last reset_peak_rss()."""
+    text = _read_proc('/proc/self/status')
+    if text is not None:
+        for line in text.splitlines():
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def reset_peak_rss():
+    """Start a new peak RSS window; returns False where that is not supported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def cpu_time():
+    """User and system CPU seconds of this process and its finished children."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class StageMetrics:
+    """Measurements of one stage; code inside the stage fills in rows and extra fields."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows_in = None
+        self.rows_out = None
+        self.fields = {}
+        self.started = time.time()
+        self.ended = None
+        self.wall = None
+        self.cpu = None
+        self.peak_rss = None
+        self.bytes_read = None
+        self.bytes_written = None
+        self.child_peak = 0
+
+    def set(self, **fields):
+        """Attach extra fields to the stage's report entry (e.g. cached=True)."""
+        self.fields.update(fields)
+
+    def to_dict(self):
+        entry = {
+            'stage': self.name,
+            'pid': os.getpid(),
+            'started': self.started,
+            'ended': self.ended,
+            'wall_s': round(self.wall, 6),
+            'cpu_s': round(self.cpu, 6),
+            'peak_rss_bytes': self.peak_rss,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+        }
+        entry.update(self.fields)
+        return entry
+
+    def summary(self):
+        parts = [f"{self.wall:.2f}s wall", f"{self.cpu:.2f}s CPU",
+                 f"peak RSS {self.peak_rss / 1e6:.0f} MB"]
+        if self.rows_in is not None:
+            parts.append(f"{self.rows_in} rows in")
+        if self.rows_out is not None:
+            parts.append(f"{self.rows_out} rows out")
+        if self.bytes_read is not None:
+            parts.append(f"{self.bytes_read / 1e6:.1f} MB read, {self.bytes_written / 1e6:.1f} MB written")
+        return f"{self.name}: " + ', '.join(parts)
+
+
+class RunReport:
+    """
+    Collects the stages run while it is active (`with RunReport(...)`) and
+    saves them as JSON to `path` (by default a new file in `report_dir`).
+    `profile` names the stages to run under cProfile ('all' for every
+    stage); their .prof files go to `report_dir`.
+    """
+
+    def __init__(self, name, profile=(), path=None, report_dir=RUN_REPORT_DIR):
+        self.name = name
+        self.profile = set(profile)
+        self.report_dir = report_dir
+        self.run_id = f"{name}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{os.getpid()}"
+        self.stages = []
+        self.path = path or os.path.join(report_dir, f'{self.run_id}.json')
+        self._profiling = False
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        _active = self
+        self.started = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        _active = self._previous
+        self.ended = time.time()
+        self.save()
+        return False
+
+    def should_profile(self, name):
+        return not self._profiling and ('all' in self.profile or name in self.profile)
+
+    def to_dict(self):
+        return {
+            'run': self.name,
+            'run_id': self.run_id,
+            'argv': sys.argv,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'started': self.started,
+            'ended': getattr(self, 'ended', None),
+            'stages': [metrics.to_dict() for metrics in sorted(self.stages, key=lambda m: m.started)],
+        }
+
+    def save(self):
+        """Write the report and return its path."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        print(f"Wrote run report {self.path}")
+        return self.path
+
+
+@contextmanager
+def stage(name):
+    """
+    Measure the block as a pipeline stage. Nested stages are named
+    'outer/inner'. Yields the StageMetrics, so the block can set
+    `rows_in`, `rows_out` and extra fields.
+    """
+    report = _active
+    parent = _running[-1] if _running else None
+    metrics = StageMetrics(f'{parent.name}/{name}' if parent else name)
+
+    # The peak RSS window is shared by nested stages: fold the peak so far
+    # into the enclosing stage before starting a new window
+    if parent is not None:
+        parent.child_peak = max(parent.child_peak, peak_rss())
+    windowed = reset_peak_rss()
+    io_start = io_counters()
+    cpu_start = cpu_time()
+    wall_start = time.perf_counter()
+
+    _running.append(metrics)
+    profiler = None
+    if report is not None:
+        if report.should_profile(metrics.name):
+            profiler = cProfile.Profile()
+            report._profiling = True
+            profiler.enable()
+    try:
+        yield metrics
+    except BaseException as e:
+        metrics.set(error=repr(e))
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            report._profiling = False
+            os.makedirs(report.report_dir, exist_ok=True)
+            profile_path = os.path.join(report.report_dir,
+                                        f"{report.run_id}-{metrics.name.replace('/', '.')}.prof")
+            profiler.dump_stats(profile_path)
+            metrics.set(profile=profile_path)
+
+        metrics.wall = time.perf_counter() - wall_start
+        metrics.cpu = cpu_time() - cpu_start
+        metrics.ended = time.time()
+        metrics.peak_rss = max(peak_rss(), metrics.child_peak)
+        if not windowed:
+            metrics.set(peak_rss_scope='process')
+        io_end = io_counters()
+        if io_start is not None and io_end is not None:
+            metrics.bytes_read = io_end[0] - io_start[0]
+            metrics.bytes_written = io_end[1] - io_start[1]
+        if parent is not None:
+            parent.child_peak = max(parent.child_peak, metrics.peak_rss)
+
+        _running.pop()
+        if report is not None:
+            report.stages.append(metrics)
+            if parent is None:
+                print(metrics.summary())
+
+
+def staged(name):
+    """Decorator running the whole function as `stage(name)`."""
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def current_stage():
+    """Metrics of the innermost running stage (a detached one outside any stage)."""
+    return _running[-1] if _running else StageMetrics('unstaged')
+
+
+def add_report_arguments(parser):
+    """Add the --report and --profile options shared by the pipeline scripts."""
+    parser.add_argument('--report', metavar='PATH',
+                        help=f"write the JSON run report here (default: a new file in {RUN_REPORT_DIR})")
+    parser.add_argument('--profile', action='append', default=[], metavar='STAGE',
+                        help="run STAGE under cProfile, saving a .prof next to the report "
+                             "(repeatable; 'all' profiles every stage)")
+
+
+def compare_reports(paths):
+    """Print each stage's wall time, CPU time and peak RSS across run reports."""
+    reports = []
+    for path in paths:
+        with open(path, 'r') as f:
+            reports.append(json.load(f))
+    names = []
+    for report in reports:
+        for entry in report['stages']:
+            if entry['stage'] not in names:
+                names.append(entry['stage'])
+
+    print(f"{'stage':<40}" + ''.join(f"{report['run_id'][-24:]:>28}" for report in reports))
+    for name in names:
+        cells = []
+        for report in reports:
+            entry = next((entry for entry in report['stages'] if entry['stage'] == name), None)
+            cells.append(f"  {entry['wall_s']:>7.2f}s {entry['cpu_s']:>7.2f}s {entry['peak_rss_bytes'] / 1e6:>6.0f}MB"
+                         if entry else f"{'-':>28}")
+        print(f"{name:<40}" + ''.join(cells))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare pipeline run reports stage by stage.")
+    parser.add_argument('reports', nargs='+', help="run report JSON files, oldest first")
+    args = parser.parse_args()
+
+    compare_reports(args.reports)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Ingestion manifest for UN Comtrade fetches.
+Tracks one entry per (year, reporter, flow) partition so reruns only fetch
+partitions that are missing, failed or stale, and can resume after a crash.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+MANIFEST_PATH = 'data_sources/yearly/manifest.json'
+
+# Comtrade revises recent years, so only these go stale; older years are final
+RECENT_YEARS = 2
+DEFAULT_MAX_AGE_DAYS = 30
+
+
+def partition_key(year, reporter, flow):
+    """Manifest key for one partition."""
+    return f"{year}/{reporter}/{flow}"
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """Load the manifest, or an empty one if no run has been recorded yet."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """Write the manifest atomically so a crash never leaves it half-written."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def content_hash(records):
+    """Stable SHA-256 of a list of records."""
+    payload = json.dumps(records, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+def needs_fetch(entry, year, max_age_days=DEFAULT_MAX_AGE_DAYS, latest_year=None, now=None):
+    """
+    Decide whether a partition must be (re)fetched.
+    Missing and failed partitions always are; successful partitions of the
+    `RECENT_YEARS` most recent years are refetched once older than `max_age_days`.
+    """
+    if entry is None or entry.get('status') == 'failed':
+        return True
+    if entry.get('status') == 'ok' and not os.path.exists(entry.get('path', '')):
+        return True
+    if max_age_days is None or latest_year is None:
+        return False
+    if int(year) <= int(latest_year) - RECENT_YEARS:
+        return False
+    now = now or datetime.now()
+    fetched_at = datetime.fromisoformat(entry['fetched_at'])
+    return now - fetched_at > timedelta(days=max_age_days)
+
+
+def make_entry(status, records=None, path=None, error=None):
+    """Build a manifest entry for a fetch outcome."""
+    records = records or []
+    entry = {
+        'status': status,
+        'rows': len(records),
+        'hash': content_hash(records) if records else None,
+        'fetched_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    if path is not None:
+        entry['path'] = path
+    if error is not None:
+        entry['error'] = str(error)
+    return entry
@@ -3,153 +3,635 @@
 Script to process UN Comtrade data into formats needed for visualization.
 """
 
+import argparse
 import json
 import pandas as pd
 import os
-from collections import defaultdict
+import pickle
+import shutil
+import tempfile
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
-def load_country_mapping():
-    """Load the country code to name mapping."""
-    with open('data_sources/country_mapping.json', 'r') as f:
-        mapping = json.load(f)
-        # Convert string keys to integers
-        return {int(k): v for k, v in mapping.items()}
+from build_cache import CACHE_DIR, BuildCache, code_version, stage_key
+from commodity_index import COMMODITY_REFERENCE_PATH, HS_LEVELS, load_commodity_index, rollup_levels
+from country_index import SOURCE_PATHS as COUNTRY_SOURCE_PATHS, load_country_index, write_country_index
+from frontend_bundle import read_latest_year, write_bundle
+from graph_layout import SECTOR_LAYOUT_PATH, add_network_layout, write_sector_layouts
+from graph_pruning import add_link_levels
+from instrumentation import RunReport, add_report_arguments, current_stage, stage, staged
+from trade_cube import write_cubes
+from trade_indicators import write_indicators
+from trade_store import open_store, write_store
+from raw_store import iter_year_chunks, year_input_files
+from trade_matrix import TradeMatrix
+from world_topology import write_world_topology
 
-def process_yearly_data():
-    """Process yearly trade data into required formats."""
+# Raw record columns needed to build the processed outputs
+RAW_COLUMNS = ['cmdCode', 'reporterCode', 'reporterDesc', 'partnerCode',
+               'partnerDesc', 'flowCode', 'primaryValue']
+
+# Columns written to trade_flows_raw.csv
+TRADE_FLOW_COLUMNS = ['year', 'reporter_code', 'reporter', 'partner_code',
+                      'partner', 'flow', 'value']
+
+YEARS = range(2015, 2026)
+
+# Records per chunk in streaming mode
+STREAM_CHUNK_SIZE = 100000
+
+SECTOR_RULES_PATH = 'data_sources/sector_rules.json'
+SECTOR_SEED = 0
+
+# Cached per-year shard results (partial totals, flow part files)
+SHARD_DIR = os.path.join(CACHE_DIR, 'shards')
+
+PROCESSED_OUTPUTS = [
+    'data/processed/trade_flows_raw.csv',
+    'data/processed/trade_summary.csv',
+    'data/processed/yearly_trade_summary.csv',
+    'data/processed/trade_network.json',
+    'data/processed/trade_matrix.json',
+    'data/processed/commodity_flows.csv',
+    'data/processed/mirror_discrepancies.csv'
+]
+
+COMMODITY_FLOWS_PATH = 'data/processed/commodity_flows.csv'
+
+# Columns written to commodity_flows.csv
+COMMODITY_FLOW_COLUMNS = ['year', 'reporter_code', 'partner_code', 'level', 'cmd_code', 'imports', 'exports']
+
+MIRROR_DISCREPANCIES_PATH = 'data/processed/mirror_discrepancies.csv'
+
+# Columns written to mirror_discrepancies.csv
+MIRROR_DISCREPANCY_COLUMNS = ['year', 'importer_code', 'exporter_code', 'import_value', 'export_value',
+                              'difference', 'ratio']
+
+FLOW_NAMES = {'M': 'import', 'X': 'export'}
+
+# Each flow code and the partner-reported flow it can be mirrored from
+MIRROR_FLOWS = {'M': 'X', 'X': 'M'}
+
+def filter_trade_flows(frame, year):
+    """
+    Reduce one year's raw records to bilateral total-trade flows.
+    Drops non-TOTAL commodities, zero values and the "World" partner (code 0).
+    """
+    if 'primaryValue' in frame:
+        value = pd.to_numeric(frame['primaryValue']).astype(float)
+    else:
+        value = pd.Series(0.0, index=frame.index)
+    partner_code = frame['partnerCode'].astype(int)
+    keep = (frame['cmdCode'] == 'TOTAL') & (value != 0) & (partner_code != 0)
+    
+    flow_code = frame.loc[keep, 'flowCode']
+    return pd.DataFrame({
+        'year': year,
+        'reporter_code': frame.loc[keep, 'reporterCode'].astype(int),
+        'reporter': frame.loc[keep, 'reporterDesc'],
+        'partner_code': partner_code[keep],
+        'partner': frame.loc[keep, 'partnerDesc'],
+        'flow': np.where(flow_code == 'M', 'import', 'export'),
+        'value': value[keep],
+        'flow_code': flow_code
+    })
+
+class PairTotals:
+    """
+    One year's flow values per (reporter, partner, flow), folded in chunk by
+    chunk in first-appearance order, plus the name of every country code
+    seen. Its size is bounded by the number of trading pairs, not by the
+    number of records read, so mirror statistics keep streaming memory flat.
+    """
+    
+    KEYS = ['reporter_code', 'partner_code', 'flow_code']
+    
+    def __init__(self, year):
+        self.year = year
+        self.values = None
+        self.names = {}
+    
+    def update(self, flows):
+        """Fold a chunk of filtered flows (see filter_trade_flows) into the totals."""
+        chunk = flows[self.KEYS + ['value']]
+        if self.values is not None:
+            chunk = pd.concat([self.values, chunk], ignore_index=True)
+        self.values = chunk.groupby(self.KEYS, sort=False, as_index=False)['value'].sum()
+        for code, name in ('reporter_code', 'reporter'), ('partner_code', 'partner'):
+            first = flows.drop_duplicates(code)
+            for key, value in zip(first[code].tolist(), first[name].tolist()):
+                self.names.setdefault(key, value)
+    
+    def name_of(self, codes):
+        return codes.map(self.names)
+
+def mirror_flows(pairs):
+    """
+    Mirror statistics for one year's PairTotals.
+    
+    A reporter with no flows at all in one direction (e.g. when only exports
+    were fetched) gets that direction from its partners' reports of the other:
+    partner P's exports to reporter R become R's imports from P, and vice
+    versa. Only partners that are reporters themselves can be mirrored, and
+    mirrored imports keep the partner's FOB valuation.
+    
+    Where both sides of a pair were reported, the importer's and exporter's
+    values are compared. Returns (derived flows, discrepancies).
+    """
+    year = pairs.year
+    flows = pairs.values
+    reported = flows[['reporter_code', 'flow_code']].drop_duplicates()
+    reporters = reported['reporter_code'].unique()
+    derived = []
+    for flow_code, mirror_code in MIRROR_FLOWS.items():
+        lacking = np.setdiff1d(reporters, reported.loc[reported['flow_code'] == flow_code, 'reporter_code'])
+        if not len(lacking):
+            continue
+        # Swap reporter and partner on the partners' own reports of the other direction
+        source = flows[(flows['flow_code'] == mirror_code) & flows['partner_code'].isin(lacking)]
+        derived.append(pd.DataFrame({
+            'year': year,
+            'reporter_code': source['partner_code'],
+            'reporter': pairs.name_of(source['partner_code']),
+            'partner_code': source['reporter_code'],
+            'partner': pairs.name_of(source['reporter_code']),
+            'flow': FLOW_NAMES[flow_code],
+            'value': source['value'],
+            'flow_code': flow_code
+        }))
+    if derived:
+        derived = pd.concat(derived, ignore_index=True)
+    else:
+        derived = pd.DataFrame(columns=TRADE_FLOW_COLUMNS + ['flow_code'])
+    
+    # Join each importer's report with its partner's report of the same trade
+    pair = ['reporter_code', 'partner_code']
+    imports = flows.loc[flows['flow_code'] == 'M', pair + ['value']]
+    exports = flows.loc[flows['flow_code'] == 'X', pair + ['value']]
+    exports = exports.rename(columns={'reporter_code': 'partner_code', 'partner_code': 'reporter_code'})
+    both = imports.merge(exports, on=pair, suffixes=('_import', '_export')).sort_values(pair, ignore_index=True)
+    discrepancies = pd.DataFrame({
+        'year': year,
+        'importer_code': both['reporter_code'],
+        'exporter_code': both['partner_code'],
+        'import_value': both['value_import'],
+        'export_value': both['value_export'],
+        'difference': both['value_import'] - both['value_export'],
+        'ratio': both['value_import'] / both['value_export']
+    }, columns=MIRROR_DISCREPANCY_COLUMNS)
+    return derived, discrepancies
+
+def filter_commodity_flows(frame, year, index):
+    """
+    Reduce one year's raw records to bilateral commodity-level flows: records
+    whose cmdCode is an HS2, HS4 or HS6 code in the commodity index, without
+    zero values or the "World" partner. Codes are replaced by index positions.
+    """
+    position = index.positions(frame['cmdCode'])
+    if 'primaryValue' in frame:
+        value = pd.to_numeric(frame['primaryValue']).astype(float).to_numpy()
+    else:
+        value = np.zeros(len(frame))
+    partner_code = frame['partnerCode'].astype(int).to_numpy()
+    keep = (position >= 0) & (value != 0) & (partner_code != 0)
+    return pd.DataFrame({
+        'position': position[keep],
+        'year': year,
+        'reporter_code': frame['reporterCode'].astype(int).to_numpy()[keep],
+        'partner_code': partner_code[keep],
+        'flow_code': frame['flowCode'].to_numpy()[keep],
+        'value': value[keep]
+    })
+
+class RunningTotals:
+    """
+    Import and export totals per group of `keys`, updated one chunk of flows
+    at a time. Groups keep first-appearance order and values are added in
+    record order with np.add.at, so totals match a plain running sum exactly
+    however the records are chunked.
+    """
+    
+    def __init__(self, keys):
+        self.keys = keys
+        self.ids = {}
+        self.imports = np.zeros(0)
+        self.exports = np.zeros(0)
+    
+    def update(self, flows):
+        """Add a chunk of filtered flows to the totals."""
+        if flows.empty:
+            return
+        
+        # Map the chunk's groups to global ids, assigning new ids in order of appearance
+        local_ids = flows.groupby(self.keys, sort=False).ngroup().to_numpy()
+        local_keys = flows[self.keys].drop_duplicates()
+        to_global = self._global_ids(zip(*(local_keys[key].tolist() for key in self.keys)))
+        
+        ids = to_global[local_ids]
+        values = flows['value'].to_numpy(dtype=float)
+        is_import = (flows['flow_code'] == 'M').to_numpy()
+        np.add.at(self.imports, ids[is_import], values[is_import])
+        np.add.at(self.exports, ids[~is_import], values[~is_import])
+    
+    def _global_ids(self, keys):
+        """Ids for `keys`, registering unseen ones in order and growing the totals."""
+        ids = np.array([self.ids.setdefault(key, len(self.ids)) for key in keys], dtype=np.int64)
+        if len(self.ids) > len(self.imports):
+            grow = len(self.ids) - len(self.imports)
+            self.imports = np.concatenate([self.imports, np.zeros(grow)])
+            self.exports = np.concatenate([self.exports, np.zeros(grow)])
+        return ids
+    
+    def to_frame(self):
+        """Totals as a DataFrame with one row per group, in first-appearance order."""
+        groups = pd.DataFrame(list(self.ids), columns=self.keys)
+        groups['imports'] = self.imports
+        groups['exports'] = self.exports
+        return groups
+
+class CommodityTotals:
+    """
+    Import and export totals per (commodity, year, reporter, partner) for
+    commodity-level records, which can outnumber the TOTAL records a
+    thousandfold. Each group is packed into one integer key, so a chunk is
+    reduced with np.unique and np.bincount rather than per-group Python work;
+    the reduced chunks are reduced once more when they pile up and at the end.
+    np.bincount adds each key's values in array order, so as long as parts
+    (and merged partials) arrive in record order the totals equal a plain
+    running sum exactly, however often they are reduced.
+    """
+    
+    # Comtrade reporter and partner codes (M49-based) are below 1000; years
+    # span 1900-2155. update() rejects anything outside these ranges, which
+    # would otherwise pack into another group's key.
+    CODE_BASE = 1000
+    YEAR_BASE = 1900
+    YEAR_SPAN = 256
+    MAX_PARTS = 64
+    
+    def __init__(self):
+        self.parts = []
+    
+    def update(self, flows):
+        """
+        Add a chunk of filtered commodity flows (see filter_commodity_flows) to
+        the totals. Raises ValueError for codes or years the keys cannot hold.
+        """
+        if flows.empty:
+            return
+        year = flows['year'].to_numpy(dtype=np.int64)
+        reporter_code = flows['reporter_code'].to_numpy(dtype=np.int64)
+        partner_code = flows['partner_code'].to_numpy(dtype=np.int64)
+        for name, values, low, high in (('year', year, self.YEAR_BASE, self.YEAR_BASE + self.YEAR_SPAN),
+                                        ('reporter code', reporter_code, 0, self.CODE_BASE),
+                                        ('partner code', partner_code, 0, self.CODE_BASE)):
+            outside = (values < low) | (values >= high)
+            if outside.any():
+                raise ValueError(f"Commodity flows with {name} {values[outside][0]} cannot be totalled "
+                                 f"(supported range {low}-{high - 1})")
+        keys = ((flows['position'].to_numpy(dtype=np.int64) * self.YEAR_SPAN
+                 + (year - self.YEAR_BASE)) * self.CODE_BASE + reporter_code) * self.CODE_BASE + partner_code
+        values = flows['value'].to_numpy(dtype=float)
+        is_import = (flows['flow_code'] == 'M').to_numpy()
+        self.parts.append((keys, np.where(is_import, values, 0.0), np.where(is_import, 0.0, values)))
+        if len(self.parts) >= self.MAX_PARTS:
+            self.parts = [self._reduce()]
+    
+    def merge(self, other):
+        """Add another set of partial totals (e.g. from a worker) into these."""
+        self.parts.extend(other.parts)
+        if len(self.parts) >= self.MAX_PARTS:
+            self.parts = [self._reduce()]
+    
+    def _reduce(self):
+        keys = np.concatenate([part[0] for part in self.parts])
+        unique, inverse = np.unique(keys, return_inverse=True)
+        imports = np.bincount(inverse, weights=np.concatenate([part[1] for part in self.parts]), minlength=len(unique))
+        exports = np.bincount(inverse, weights=np.concatenate([part[2] for part in self.parts]), minlength=len(unique))
+        return unique, imports, exports
+    
+    def to_frame(self):
+        """Totals as a DataFrame of position, year, reporter_code, partner_code, imports and exports."""
+        if not self.parts:
+            return pd.DataFrame({'position': np.zeros(0, dtype=np.int64), 'year': np.zeros(0, dtype=np.int64),
+                                 'reporter_code': np.zeros(0, dtype=np.int64),
+                                 'partner_code': np.zeros(0, dtype=np.int64),
+                                 'imports': np.zeros(0), 'exports': np.zeros(0)})
+        keys, imports, exports = self._reduce()
+        keys, partner_code = np.divmod(keys, self.CODE_BASE)
+        keys, reporter_code = np.divmod(keys, self.CODE_BASE)
+        position, year = np.divmod(keys, self.YEAR_SPAN)
+        return pd.DataFrame({'position': position, 'year': year + self.YEAR_BASE,
+                             'reporter_code': reporter_code, 'partner_code': partner_code,
+                             'imports': imports, 'exports': exports})
+
+def commodity_flows_frame(commodity_totals, index):
+    """
+    Commodity totals completed at every HS level with the rollup index (a
+    reported code keeps its value, others sum their children), as the
+    commodity_flows.csv table.
+    """
+    keys = ['year', 'reporter_code', 'partner_code']
+    flows = rollup_levels(index, commodity_totals.to_frame(), keys, ['imports', 'exports'])
+    position = flows['position'].to_numpy()
+    flows['level'] = index.levels[position]
+    flows['cmd_code'] = index.codes[position]
+    return flows.sort_values(['year', 'level', 'cmd_code', 'reporter_code', 'partner_code'],
+                             ignore_index=True)[COMMODITY_FLOW_COLUMNS]
+
+def read_commodity_flows(path=COMMODITY_FLOWS_PATH):
+    """Read commodity_flows.csv, keeping HS codes as strings (None if it does not exist)."""
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, dtype={'cmd_code': str}, float_precision='round_trip')
+
+def new_totals(flows=True):
+    """
+    Empty running totals for the summary, yearly and matrix outputs and the
+    commodity flows. Shards only total commodities (`flows=False`): their flow
+    part files are replayed into the run's totals instead (see replay_flows).
+    """
+    totals = {'commodities': CommodityTotals()}
+    if flows:
+        totals.update({
+            'summary': RunningTotals(['reporter_code']),
+            'yearly': RunningTotals(['year', 'reporter_code']),
+            'matrix': RunningTotals(['reporter_code', 'partner_code'])
+        })
+    return totals
+
+def update_flow_totals(flows, totals):
+    """Add filtered flows to the summary, yearly and matrix totals, if `totals` has them."""
+    if 'summary' not in totals:
+        return
+    totals['summary'].update(flows)
+    totals['yearly'].update(flows)
+    # Only count exports in the matrix to avoid double counting
+    totals['matrix'].update(flows[flows['flow_code'] == 'X'])
+
+def add_flows(flows, totals, flows_file, exports=None):
+    """Add filtered flows to the running totals, the flow file and the export list (when given)."""
+    update_flow_totals(flows, totals)
+    flows[TRADE_FLOW_COLUMNS].to_csv(flows_file, index=False, header=False)
+    if exports is not None:
+        exports.append(flows.loc[flows['flow'] == 'export', TRADE_FLOW_COLUMNS])
+
+def replay_flows(part_path, totals, flows_file, chunk_size=None):
+    """
+    Append a shard's flow part file to `flows_file` and add its flows to the
+    totals, in file order. Totals carried over the years (per reporter, per
+    pair) are running sums, so replaying every year's flows in year order
+    reproduces a serial run exactly, where adding up per-year partial totals
+    would not. Values are written with full precision and read back exactly.
+    """
+    with open(part_path, 'r', newline='') as part_file:
+        shutil.copyfileobj(part_file, flows_file)
+    if os.path.getsize(part_path) == 0:
+        return
+    for flows in pd.read_csv(part_path, names=TRADE_FLOW_COLUMNS,
+                             usecols=['year', 'reporter_code', 'partner_code', 'flow', 'value'],
+                             float_precision='round_trip', chunksize=chunk_size or STREAM_CHUNK_SIZE):
+        flows['flow_code'] = np.where(flows['flow'] == 'import', 'M', 'X')
+        update_flow_totals(flows, totals)
+
+def aggregate_year(year, totals, flows_file, chunk_size=None):
+    """
+    Filter and aggregate one year's records into `totals`, chunk by chunk,
+    appending each chunk's flows to `flows_file`. Returns the flow count, the
+    year's export flows, which sector synthesis reuses without a disk round
+    trip, the number of raw records read and the year's mirror
+    discrepancies. Commodity-level records go into the commodity totals.
+    In streaming mode (with `chunk_size`) the export flows are not held
+    until the year ends and None is returned in their place; sector
+    synthesis then reads the latest year from the trade store.
+    
+    Once the year is read, directions a reporter did not report are derived
+    from its partners' reports (see mirror_flows), so a year fetched with a
+    single flow per reporter still yields both.
+    """
+    flow_count = 0
+    record_count = 0
+    exports = [] if chunk_size is None else None
+    pairs = PairTotals(year)
+    index = load_commodity_index()
+    # Only the columns used below are read from the raw store
+    for frame in iter_year_chunks(year, columns=RAW_COLUMNS, chunk_size=chunk_size):
+        record_count += len(frame)
+        totals['commodities'].update(filter_commodity_flows(frame, year, index))
+        flows = filter_trade_flows(frame, year)
+        if flows.empty:
+            continue
+        add_flows(flows, totals, flows_file, exports)
+        pairs.update(flows)
+        flow_count += len(flows)
+    
+    discrepancies = pd.DataFrame(columns=MIRROR_DISCREPANCY_COLUMNS)
+    if pairs.values is not None:
+        derived, discrepancies = mirror_flows(pairs)
+        if not derived.empty:
+            print(f"Derived {len(derived)} mirror flows for {year}")
+            add_flows(derived, totals, flows_file, exports)
+            flow_count += len(derived)
+    
+    if exports is not None:
+        exports = pd.concat(exports, ignore_index=True) if exports else None
+    return flow_count, exports, record_count, discrepancies
+
+def process_year_shard(year, chunk_size, parts_dir):
+    """
+    Worker entry point: aggregate one year's commodity totals and write its
+    flows to a part file. Returns {'flow_count', 'totals', 'exports',
+    'record_count', 'discrepancies'}.
+    """
+    totals = new_totals(flows=False)
+    with open(os.path.join(parts_dir, f'{year}.csv'), 'w', newline='') as part_file:
+        flow_count, exports, record_count, discrepancies = aggregate_year(year, totals, part_file, chunk_size)
+    return {'flow_count': flow_count, 'totals': totals, 'exports': exports, 'record_count': record_count,
+            'discrepancies': discrepancies}
+
+def run_shards(years, chunk_size, workers, parts_dir):
+    """Process `years` as shards, in a process pool when `workers` > 1."""
+    years = list(years)
+    if workers > 1 and len(years) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(process_year_shard, years,
+                               [chunk_size] * len(years), [parts_dir] * len(years))
+            return dict(zip(years, results))
+    return {year: process_year_shard(year, chunk_size, parts_dir) for year in years}
+
+def load_shard(year):
+    """Load a cached shard result."""
+    with open(os.path.join(SHARD_DIR, f'{year}.pkl'), 'rb') as f:
+        return pickle.load(f)
+
+def load_processed_outputs():
+    """
+    Return values of process_yearly_data read back from up-to-date outputs
+    and the cached shards.
+    """
+    trade_summary_df = pd.read_csv('data/processed/trade_summary.csv')
+    with open('data/processed/trade_matrix.json', 'r') as f:
+        matrix_json = json.load(f)
+    with open('data/processed/trade_network.json', 'r') as f:
+        trade_network = json.load(f)
+    
+    recent_exports = None
+    for year in reversed(YEARS):
+        shard = load_shard(year)
+        if shard['flow_count']:
+            recent_exports = shard['exports']
+            break
+    return trade_summary_df, matrix_json, trade_network, recent_exports, read_commodity_flows()
+
+@staged('process_yearly_data')
+def process_yearly_data(chunk_size=None, workers=1, use_cache=False):
+    """
+    Process yearly trade data into required formats.
+    
+    Records are aggregated and appended to trade_flows_raw.csv one chunk at a
+    time: a whole year by default, or at most `chunk_size` records in
+    streaming mode, which keeps peak memory flat however much history is ingested.
+    
+    With `workers` > 1 each year is processed in a separate process; the
+    partial totals are merged in year order and the per-year flow files are
+    concatenated, giving the same outputs as a serial run.
+    
+    Commodity-level records (HS2, HS4 or HS6 codes) are totalled alongside
+    and rolled up to every HS level with the commodity index, giving
+    commodity_flows.csv, which is returned last.
+    
+    With `use_cache`, each year's shard is cached under its input hashes and
+    the code version, so only years whose raw files changed are reprocessed,
+    and the outputs are not rewritten at all when nothing changed.
+    """
     # Create output directory
     os.makedirs('data/processed', exist_ok=True)
+    metrics = current_stage()
+    metrics.set(workers=workers, chunk_size=chunk_size)
+    
+    if use_cache:
+        cache = BuildCache()
+        code = code_version(__name__, 'raw_store', 'trade_matrix', 'graph_layout', 'graph_pruning',
+                            'commodity_index', 'country_index')
+        shard_keys = {year: stage_key(year_input_files(year) + [COMMODITY_REFERENCE_PATH], code, {'year': year})
+                      for year in YEARS}
+        outputs_key = stage_key([path for path in COUNTRY_SOURCE_PATHS if os.path.exists(path)], code,
+                                upstream=list(shard_keys.values()))
+        if cache.is_fresh('outputs', outputs_key):
+            print("Processed outputs are up to date")
+            metrics.set(cached=True)
+            return load_processed_outputs()
     
-    # Load country mapping
-    country_mapping = load_country_mapping()
+    # Country reference lookups
+    country_index = load_country_index()
     
-    # Initialize data structures
-    trade_flows = []
-    trade_summary = defaultdict(lambda: {'imports': 0, 'exports': 0})
-    trade_matrix = defaultdict(lambda: defaultdict(float))
     trade_network = {'nodes': [], 'links': []}
     
-    # For yearly trends
-    yearly_data = defaultdict(lambda: defaultdict(lambda: {'imports': 0, 'exports': 0}))
+    # Aggregate year by year, appending each year's flows to the raw CSV
+    totals = new_totals()
+    flow_count = 0
+    record_count = 0
+    recent_exports = None
+    discrepancies = []
     
-    # Process each year's data
-    for year in range(2015, 2026):
-        year_file = f'data_sources/yearly/trade_data_{year}.json'
-        if not os.path.exists(year_file):
-            continue
-            
-        with open(year_file, 'r') as f:
-            data = json.load(f)
-            
-        for record in data:
-            # Skip if not total trade
-            if record.get('cmdCode') != 'TOTAL':
-                continue
-                
-            reporter_code = int(record['reporterCode'])
-            partner_code = int(record['partnerCode'])
-            flow_code = record['flowCode']
-            value = float(record.get('primaryValue', 0))
-            
-            # Skip if no value or if partner is "World" (code 0)
-            if value == 0 or partner_code == 0:
-                continue
-                
-            # Add to trade flows
-            trade_flows.append({
-                'year': year,
-                'reporter_code': reporter_code,
-                'reporter': record['reporterDesc'],
-                'partner_code': partner_code,
-                'partner': record['partnerDesc'],
-                'flow': 'import' if flow_code == 'M' else 'export',
-                'value': value
-            })
-            
-            # Update trade summary (overall totals)
-            if flow_code == 'M':
-                trade_summary[reporter_code]['imports'] += value
-            else:
-                trade_summary[reporter_code]['exports'] += value
-                
-            # Update yearly data
-            if flow_code == 'M':
-                yearly_data[year][reporter_code]['imports'] += value
-            else:
-                yearly_data[year][reporter_code]['exports'] += value
-                
-            # Update trade matrix
-            if flow_code == 'X':  # Only count exports to avoid double counting
-                trade_matrix[reporter_code][partner_code] += value
-                
-    # Convert trade summary to list
-    trade_summary_list = []
-    for code, data in trade_summary.items():
-        if code in country_mapping:
-            trade_summary_list.append({
-                'country_code': code,
-                'country': country_mapping[code]['name'],
-                'imports': data['imports'],
-                'exports': data['exports'],
-                'balance': data['exports'] - data['imports']
-            })
-            
-    # Convert yearly data to list
-    yearly_summary_list = []
-    for year, countries in yearly_data.items():
-        for code, data in countries.items():
-            if code in country_mapping:
-                yearly_summary_list.append({
-                    'year': year,
-                    'country_code': code,
-                    'country': country_mapping[code]['name'],
-                    'imports': data['imports'],
-                    'exports': data['exports'],
-                    'balance': data['exports'] - data['imports'],
-                    'total_trade': data['imports'] + data['exports']
-                })
+    with stage('aggregate'), open('data/processed/trade_flows_raw.csv', 'w', newline='') as flows_file:
+        flows_file.write(','.join(TRADE_FLOW_COLUMNS) + '\n')
+        
+        if use_cache or workers > 1:
+            parts_dir = SHARD_DIR if use_cache else tempfile.mkdtemp(prefix='.parts-', dir='data/processed')
+            os.makedirs(parts_dir, exist_ok=True)
+            try:
+                if use_cache:
+                    stale = [year for year in YEARS if not cache.is_fresh(f'shard/{year}', shard_keys[year])]
+                    print(f"Reprocessing {len(stale)} of {len(YEARS)} years")
+                else:
+                    stale = YEARS
+                shards = run_shards(stale, chunk_size, workers, parts_dir)
+                if use_cache:
+                    for year, shard in shards.items():
+                        with open(os.path.join(SHARD_DIR, f'{year}.pkl'), 'wb') as f:
+                            pickle.dump(shard, f)
+                        cache.record(f'shard/{year}', shard_keys[year],
+                                     [os.path.join(SHARD_DIR, f'{year}.pkl'), os.path.join(SHARD_DIR, f'{year}.csv')])
                 
+                # Reduce in year order so group order, sums and the CSV match a serial run
+                for year in YEARS:
+                    shard = shards[year] if year in shards else load_shard(year)
+                    totals['commodities'].merge(shard['totals']['commodities'])
+                    replay_flows(os.path.join(parts_dir, f'{year}.csv'), totals, flows_file, chunk_size)
+                    if shard['flow_count']:
+                        recent_exports = shard['exports']
+                    flow_count += shard['flow_count']
+                    record_count += shard['record_count']
+                    discrepancies.append(shard['discrepancies'])
+            finally:
+                if not use_cache:
+                    shutil.rmtree(parts_dir, ignore_errors=True)
+        else:
+            for year in YEARS:
+                year_count, year_exports, year_records, year_discrepancies = aggregate_year(
+                    year, totals, flows_file, chunk_size)
+                if year_count:
+                    recent_exports = year_exports
+                flow_count += year_count
+                record_count += year_records
+                discrepancies.append(year_discrepancies)
+    
+    # Overall totals per reporter
+    trade_summary_df = totals['summary'].to_frame()
+    trade_summary_df = trade_summary_df[country_index.is_reporter(trade_summary_df['reporter_code'])]
+    trade_summary_df = trade_summary_df.rename(columns={'reporter_code': 'country_code'})
+    trade_summary_df.insert(1, 'country', country_index.names_of(trade_summary_df['country_code']))
+    trade_summary_df['balance'] = trade_summary_df['exports'] - trade_summary_df['imports']
+    
+    # Yearly totals per reporter
+    yearly_summary_df = totals['yearly'].to_frame()
+    yearly_summary_df = yearly_summary_df[country_index.is_reporter(yearly_summary_df['reporter_code'])]
+    yearly_summary_df = yearly_summary_df.rename(columns={'reporter_code': 'country_code'})
+    yearly_summary_df.insert(2, 'country', country_index.names_of(yearly_summary_df['country_code']))
+    yearly_summary_df['balance'] = yearly_summary_df['exports'] - yearly_summary_df['imports']
+    yearly_summary_df['total_trade'] = yearly_summary_df['imports'] + yearly_summary_df['exports']
+    
+    # Bilateral export matrix
+    pair_totals = totals['matrix'].to_frame()
+    trade_matrix = TradeMatrix.from_flows(pair_totals['reporter_code'], pair_totals['partner_code'],
+                                          pair_totals['exports'])
+    
     # Create network data
     nodes = set()
     links = []
     
     # Create a list of countries we care about
-    top_countries = set([record['country_code'] for record in trade_summary_list])
+    top_countries = set(trade_summary_df['country_code'].tolist())
     
     # Add nodes
     for code in top_countries:
-        if code in country_mapping:
-            country = country_mapping[code]
+        if code in country_index:
             nodes.add(code)
             trade_network['nodes'].append({
                 'id': str(code),
-                'name': country['name'],
-                'code': country['iso3']
+                'name': country_index.name(code),
+                'code': country_index.iso3_of(code)
             })
     
     # Add links
-    for exporter in top_countries:
-        for importer in top_countries:
-            if exporter != importer:
-                if exporter in trade_matrix and importer in trade_matrix[exporter]:
-                    value = trade_matrix[exporter][importer]
-                    if value > 0:
-                        links.append({
-                            'source': str(exporter),
-                            'target': str(importer),
-                            'value': value
-                        })
+    for exporter, importer, value in trade_matrix.links(top_countries):
+        links.append({
+            'source': str(exporter),
+            'target': str(importer),
+            'value': value
+        })
     
     trade_network['links'] = links
     
-    # Convert to dataframe and save
-    trade_flows_df = pd.DataFrame(trade_flows)
-    trade_summary_df = pd.DataFrame(trade_summary_list)
-    yearly_summary_df = pd.DataFrame(yearly_summary_list)
+    with stage('network'):
+        # Tag links with levels of detail, so the frontend can draw only as many as it can afford
+        add_link_levels(trade_network)
+        
+        # Precompute node positions so the frontend needs no full force simulation
+        add_network_layout(trade_network)
     
     # Save processed data
-    trade_flows_df.to_csv('data/processed/trade_flows_raw.csv', index=False)
     trade_summary_df.to_csv('data/processed/trade_summary.csv', index=False)
     yearly_summary_df.to_csv('data/processed/yearly_trade_summary.csv', index=False)
     
@@ -157,39 +639,13 @@ def process_yearly_data():
         json.dump(trade_network, f)
     
     # Create matrix for chord diagram
-    countries = [country_mapping[code]['name'] for code in top_countries if code in country_mapping]
+    countries = [country_index.name(code) for code in top_countries if code in country_index]
     countries.sort()
     
-    matrix = []
-    for i, source_name in enumerate(countries):
-        row = []
-        source_code = None
-        for code, country in country_mapping.items():
-            if country['name'] == source_name:
-                source_code = code
-                break
-        
-        if source_code is None:
-            continue
-        
-        for j, target_name in enumerate(countries):
-            target_code = None
-            for code, country in country_mapping.items():
-                if country['name'] == target_name:
-                    target_code = code
-                    break
-            
-            if target_code is None:
-                continue
-            
-            if source_code == target_code:
-                row.append(0)  # No self-trade
-            elif source_code in trade_matrix and target_code in trade_matrix[source_code]:
-                row.append(trade_matrix[source_code][target_code])
-            else:
-                row.append(0)
-        
-        matrix.append(row)
+    # Resolve each name to its code in the index, then slice the matrix once
+    chord_matrix = trade_matrix.subset([country_index.code(name) for name in countries])
+    np.fill_diagonal(chord_matrix, 0)  # No self-trade
+    matrix = [[value if value else 0 for value in row] for row in chord_matrix.tolist()]
     
     matrix_json = {
         'countries': countries,
@@ -199,106 +655,211 @@ def process_yearly_data():
     with open('data/processed/trade_matrix.json', 'w') as f:
         json.dump(matrix_json, f)
     
-    print(f"Processed {len(trade_flows)} trade flow records")
-    print(f"Created summary for {len(trade_summary_list)} countries")
-    print(f"Created yearly summary with {len(yearly_summary_list)} records")
+    # Commodity totals at every HS level
+    commodity_df = commodity_flows_frame(totals['commodities'], load_commodity_index())
+    commodity_df.to_csv(COMMODITY_FLOWS_PATH, index=False)
+    
+    # Pairs reported by both the importer and the exporter
+    discrepancy_df = pd.concat(discrepancies, ignore_index=True)
+    discrepancy_df.to_csv(MIRROR_DISCREPANCIES_PATH, index=False)
+    
+    print(f"Processed {flow_count} trade flow records")
+    print(f"Created summary for {len(trade_summary_df)} countries")
+    print(f"Created yearly summary with {len(yearly_summary_df)} records")
     print(f"Created network with {len(trade_network['nodes'])} nodes and {len(trade_network['links'])} links")
     print(f"Created matrix for {len(countries)} countries")
+    level_counts = commodity_df['level'].value_counts()
+    print(f"Created commodity flows with {len(commodity_df)} records "
+          f"({', '.join(f'{level_counts.get(digits, 0)} HS{digits}' for digits in HS_LEVELS)})")
+    if len(discrepancy_df):
+        gap = (discrepancy_df['ratio'] - 1).abs().median() * 100
+        print(f"Recorded mirror discrepancies for {len(discrepancy_df)} pairs "
+              f"(median gap between importer and exporter {gap:.1f}%)")
+    metrics.rows_in = record_count
+    metrics.rows_out = flow_count
+    metrics.set(mirror_pairs=len(discrepancy_df))
+    
+    if use_cache:
+        cache.record('outputs', outputs_key, PROCESSED_OUTPUTS)
     
-    return trade_summary_df, matrix_json, trade_network
+    return trade_summary_df, matrix_json, trade_network, recent_exports, commodity_df
 
-def create_sector_data():
+def load_sector_rules(path=SECTOR_RULES_PATH):
+    """Load the sector synthesis rules (per-sector weights keyed by reporter code)."""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def commodity_sector_data(commodity_flows, rules, index, country_index):
+    """
+    Sector flows from commodity-level data: each HS2 chapter's exports are
+    summed into the sector its chapter belongs to (`chapters` in the rules),
+    for every year, keeping flows of at least `min_value` between reporters
+    in the country index.
+    """
+    chapters = commodity_flows[commodity_flows['level'] == 2]
+    sector_ids = index.sectors[index.positions(chapters['cmd_code'])]
+    keep = ((sector_ids >= 0) & country_index.is_reporter(chapters['reporter_code'])
+            & country_index.is_reporter(chapters['partner_code']))
+    chapters = chapters[keep].assign(sector=sector_ids[keep])
+    flows = chapters.groupby(['sector', 'year', 'reporter_code', 'partner_code'], as_index=False)['exports'].sum()
+    flows = flows[flows['exports'] >= rules['min_value']]
+    
+    return pd.DataFrame({
+        'sector': np.array(index.sector_names, dtype=object)[flows['sector'].to_numpy()],
+        'reporter': country_index.names_of(flows['reporter_code']),
+        'partner': country_index.names_of(flows['partner_code']),
+        'reporter_code': flows['reporter_code'].to_numpy(),
+        'partner_code': flows['partner_code'].to_numpy(),
+        'value': flows['exports'].to_numpy(),
+        'year': flows['year'].to_numpy(),
+        'flow': 'export'
+    })
+
+def synthesize_sector_data(recent_flows, rules, seed):
+    """
+    Simulated sector flows for when there is no commodity-level data: the
+    most recent year's large export flows, drawn into every sector in one
+    vectorized pass from a single seeded generator, so the same seed gives
+    the same output.
+    """
+    sectors = [sector['name'] for sector in rules['sectors']]
+    
+    # Get most recent year, keeping only its large export flows
+    most_recent_year = recent_flows['year'].max()
+    recent_flows = recent_flows[(recent_flows['flow'] == 'export') &
+                                (recent_flows['value'] >= rules['min_value'])]
+    
+    # Sector x reporter weight table; reporters without a rule keep weight 1
+    reporter_index, reporter_codes = pd.factorize(recent_flows['reporter_code'])
+    weight_table = np.ones((len(sectors), len(reporter_codes)))
+    code_positions = {code: i for i, code in enumerate(reporter_codes.tolist())}
+    for s, sector in enumerate(rules['sectors']):
+        for code, weight in sector['weights'].items():
+            if int(code) in code_positions:
+                weight_table[s, code_positions[int(code)]] = weight
+    
+    # Random factor per (sector, flow), scaled by the sector's reporter weight,
+    # and a random subset of flows per sector to avoid overcrowding
+    rng = np.random.default_rng(seed)
+    low, high = rules['base_factor']
+    shape = (len(sectors), len(recent_flows))
+    sector_factor = (low + rng.random(shape) * (high - low)) * weight_table[:, reporter_index]
+    keep = rng.random(shape) < rules['keep_probability']
+    sector_ids, flow_ids = np.nonzero(keep)
+    
+    chosen = recent_flows.iloc[flow_ids]
+    return pd.DataFrame({
+        'sector': np.array(sectors, dtype=object)[sector_ids],
+        'reporter': chosen['reporter'].to_numpy(),
+        'partner': chosen['partner'].to_numpy(),
+        'reporter_code': chosen['reporter_code'].to_numpy(),
+        'partner_code': chosen['partner_code'].to_numpy(),
+        'value': chosen['value'].to_numpy() * sector_factor[sector_ids, flow_ids],
+        'year': most_recent_year,
+        'flow': 'export'
+    })
+
+@staged('create_sector_data')
+def create_sector_data(seed=SECTOR_SEED, recent_flows=None, commodity_flows=None, use_cache=False):
     """
     Generate sector-specific trade data for visualization.
-    Creates simulated data for 6 key sectors based on the overall trade patterns.
+    With commodity-level records in the raw data, sectors are real: HS
+    chapters rolled up into the sector buckets of sector_rules.json, for
+    every year. Without them, sector flows are simulated from the overall
+    trade patterns (see synthesize_sector_data).
+    Each sector's network layout is written to sector_layout.json.
+    
+    `recent_flows` and `commodity_flows` hand over the most recent year's
+    flows and the commodity flows from process_yearly_data in memory; without
+    them trade_flows_raw.csv (through the trade store when it is current)
+    and commodity_flows.csv are read.
+    With `use_cache` nothing is rebuilt while the flows, rules and seed are unchanged.
     """
     # Create output directory if it doesn't exist
     os.makedirs('data/processed', exist_ok=True)
     
-    # Try to load existing trade flows
-    try:
-        trade_flows_df = pd.read_csv('data/processed/trade_flows_raw.csv')
-    except:
+    flows_path = 'data/processed/trade_flows_raw.csv'
+    sector_path = 'data/processed/sector_trade_flows.csv'
+    if recent_flows is None and not os.path.exists(flows_path):
         # If not available, process data first
-        process_yearly_data()
-        trade_flows_df = pd.read_csv('data/processed/trade_flows_raw.csv')
+        recent_flows, commodity_flows = process_yearly_data(use_cache=use_cache)[3:]
+    if commodity_flows is None:
+        commodity_flows = read_commodity_flows()
     
-    # Define sectors
-    sectors = ['agriculture', 'energy', 'machinery', 'automotive', 'textiles', 'pharmaceuticals']
+    if use_cache:
+        cache = BuildCache()
+        inputs = [flows_path, SECTOR_RULES_PATH, COMMODITY_REFERENCE_PATH]
+        if os.path.exists(COMMODITY_FLOWS_PATH):
+            inputs.append(COMMODITY_FLOWS_PATH)
+        sector_key = stage_key(inputs, code_version(__name__, 'graph_layout', 'commodity_index'),
+                               {'seed': seed})
+        if cache.is_fresh('sectors', sector_key):
+            print("Sector data is up to date")
+            current_stage().set(cached=True)
+            return pd.read_csv(sector_path)
     
-    # Get unique countries
-    countries = trade_flows_df['reporter'].unique()
+    rules = load_sector_rules()
+    if commodity_flows is not None and not commodity_flows.empty:
+        current_stage().rows_in = len(commodity_flows)
+        sector_df = commodity_sector_data(commodity_flows, rules, load_commodity_index(),
+                                          load_country_index())
+        source = 'commodity data'
+    else:
+        store = open_store(flows_path=flows_path) if recent_flows is None else None
+        if store is not None:
+            # An indexed lookup of the latest year instead of a scan of every flow
+            with store:
+                recent_flows = store.flows(year=store.latest_year())
+        elif recent_flows is None:
+            recent_flows = read_latest_year(flows_path)
+        current_stage().rows_in = len(recent_flows)
+        print("No commodity-level records, simulating sectors from total trade")
+        sector_df = synthesize_sector_data(recent_flows, rules, seed)
+        source = 'simulated'
+    current_stage().set(source=source)
     
-    # Get most recent year
-    most_recent_year = trade_flows_df['year'].max()
-    recent_flows = trade_flows_df[trade_flows_df['year'] == most_recent_year]
+    # Save
+    sector_df.to_csv(sector_path, index=False)
+    with stage('layouts'):
+        write_sector_layouts(sector_df)
+    if use_cache:
+        cache.record('sectors', sector_key, [sector_path, SECTOR_LAYOUT_PATH])
     
-    # Create sector data with weighted values for each sector
-    sector_data = []
-    
-    for sector in sectors:
-        # Use a different random seed for each sector to ensure different patterns
-        np.random.seed(sectors.index(sector))
-        
-        for _, flow in recent_flows.iterrows():
-            # Skip small flows and non-export flows
-            if flow['value'] < 1e8 or flow['flow'] != 'export':
-                continue
-                
-            # Add some randomness to make sectors different
-            sector_factor = 0.2 + np.random.random() * 1.5
-            
-            # Some sectors are dominant for certain country pairs
-            reporter = flow['reporter']
-            partner = flow['partner']
-            
-            # Add sector-specific weightings
-            if sector == 'agriculture':
-                # Higher for agricultural exporters
-                if reporter in ['Brazil', 'Australia', 'Netherlands']:
-                    sector_factor *= 1.5
-            elif sector == 'energy':
-                # Higher for energy exporters
-                if reporter in ['United States', 'Canada', 'Australia']:
-                    sector_factor *= 2.0
-            elif sector == 'machinery':
-                # Higher for industrial exporters
-                if reporter in ['Germany', 'Japan', 'China']:
-                    sector_factor *= 1.8
-            elif sector == 'automotive':
-                # Higher for car manufacturing countries
-                if reporter in ['Germany', 'Japan', 'United States', 'Korea, Rep.']:
-                    sector_factor *= 1.7
-            elif sector == 'textiles':
-                # Higher for textile exporters
-                if reporter in ['China', 'India', 'Italy']:
-                    sector_factor *= 1.6
-            elif sector == 'pharmaceuticals':
-                # Higher for pharmaceutical exporters
-                if reporter in ['United States', 'Germany', 'Switzerland']:
-                    sector_factor *= 2.0
-            
-            # Only include some flows to avoid overcrowding
-            if np.random.random() > 0.6:
-                sector_data.append({
-                    'sector': sector,
-                    'reporter': reporter,
-                    'partner': partner,
-                    'reporter_code': flow['reporter_code'],
-                    'partner_code': flow['partner_code'],
-                    'value': flow['value'] * sector_factor,
-                    'year': most_recent_year,
-                    'flow': 'export'
-                })
-    
-    # Convert to dataframe and save
-    sector_df = pd.DataFrame(sector_data)
-    sector_df.to_csv('data/processed/sector_trade_flows.csv', index=False)
-    
-    print(f"Created sector data with {len(sector_data)} records across {len(sectors)} sectors")
+    current_stage().rows_out = len(sector_df)
+    print(f"Created sector data with {len(sector_df)} records across "
+          f"{len(rules['sectors'])} sectors ({source})")
     
     return sector_df
 
 if __name__ == "__main__":
-    process_yearly_data()
-    create_sector_data() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Process UN Comtrade data for the visualization.")
+    parser.add_argument('--stream', action='store_true',
+                        help="process records in fixed-size chunks to bound memory use")
+    parser.add_argument('--chunk-size', type=int, default=STREAM_CHUNK_SIZE,
+                        help="records per chunk in streaming mode (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="process years in N worker processes (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=SECTOR_SEED,
+                        help="random seed for sector synthesis (default: %(default)s)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="rebuild every output instead of skipping up-to-date ones")
+    add_report_arguments(parser)
+    args = parser.parse_args()
+    
+    with RunReport('process', profile=args.profile, path=args.report):
+        with stage('country_index'):
+            write_country_index(use_cache=not args.no_cache)
+        recent_flows, commodity_flows = process_yearly_data(chunk_size=args.chunk_size if args.stream else None,
+                                                            workers=args.workers, use_cache=not args.no_cache)[3:]
+        with stage('write_store'):
+            write_store(use_cache=not args.no_cache)
+        create_sector_data(seed=args.seed, recent_flows=recent_flows, commodity_flows=commodity_flows,
+                           use_cache=not args.no_cache)
+        with stage('write_cubes'):
+            write_cubes(use_cache=not args.no_cache)
+        with stage('write_indicators'):
+            write_indicators(use_cache=not args.no_cache)
+        with stage('write_bundle'):
+            write_bundle(use_cache=not args.no_cache)
+        with stage('write_world_topology'):
+            write_world_topology(use_cache=not args.no_cache)
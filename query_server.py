@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Local query API over the processed trade data.
+Serves the site like `python -m http.server` and answers /api/ requests with
+small JSON slices of the processed outputs, so a client downloads only the
+rows it draws. Responses are kept in an LRU cache with ETags for conditional
+GETs, and gzipped for clients that accept it.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+PROCESSED_DIR = 'data/processed'
+DEFAULT_PORT = 8000
+CACHE_SIZE = 256
+DEFAULT_TOP_N = 10
+
+# Responses smaller than this are not worth compressing
+GZIP_MIN_SIZE = 512
+
+DATA_FILES = {
+    'flows': 'trade_flows_raw.csv',
+    'sectors': 'sector_trade_flows.csv',
+    'summary': 'trade_summary.csv',
+    'yearly': 'yearly_trade_summary.csv',
+}
+
+
+class QueryError(ValueError):
+    """A request with missing or invalid parameters."""
+
+
+def int_list(params, name):
+    """Comma-separated integer parameter as a list, or None if absent."""
+    if name not in params:
+        return None
+    try:
+        return [int(value) for value in params[name].split(',') if value]
+    except ValueError:
+        raise QueryError(f"'{name}' must be a comma-separated list of integers")
+
+
+def int_param(params, name, default=None):
+    """Single integer parameter, or `default` if absent."""
+    values = int_list(params, name)
+    if values is None:
+        return default
+    if len(values) != 1:
+        raise QueryError(f"'{name}' must be a single integer")
+    return values[0]
+
+
+def float_param(params, name, default=None):
+    """Single number parameter, or `default` if absent."""
+    if name not in params:
+        return default
+    try:
+        return float(params[name])
+    except ValueError:
+        raise QueryError(f"'{name}' must be a number")
+
+
+def str_list(params, name):
+    """Comma-separated string parameter as a list, or None if absent."""
+    if name not in params:
+        return None
+    return [value for value in params[name].split(',') if value]
+
+
+def records(frame):
+    """DataFrame rows as a list of JSON-ready dicts."""
+    return json.loads(frame.to_json(orient='records', double_precision=15))
+
+
+class TradeQueries:
+    """In-memory processed data with the query behind each endpoint."""
+
+    def __init__(self, processed_dir=PROCESSED_DIR):
+        self.processed_dir = processed_dir
+        self.version = None
+        # (frames, row positions of each flow year), replaced as one on reload
+        self.data = ({}, {})
+        self.lock = threading.Lock()
+        self.reload_if_changed()
+
+    def _paths(self):
+        return {name: os.path.join(self.processed_dir, filename) for name, filename in DATA_FILES.items()}
+
+    def reload_if_changed(self):
+        """Reload the processed files if any changed; return True if they did."""
+        stats = []
+        for path in self._paths().values():
+            stat = os.stat(path) if os.path.exists(path) else None
+            stats.append((path, stat.st_size, stat.st_mtime_ns) if stat else (path, None, None))
+        version = hashlib.sha256(repr(stats).encode('utf-8')).hexdigest()[:16]
+        if version == self.version:
+            return False
+
+        with self.lock:
+            if version == self.version:
+                return False
+            frames = {}
+            for name, path in self._paths().items():
+                if os.path.exists(path):
+                    frames[name] = pd.read_csv(path, keep_default_na=False, float_precision='round_trip')
+                else:
+                    frames[name] = pd.DataFrame()
+            # Row positions of each year, so year-filtered queries skip a full scan
+            flow_years = frames['flows'].groupby('year').indices if len(frames['flows']) else {}
+            # Published as one tuple: a query reads it once and never pairs
+            # new frames with old year positions
+            self.data = (frames, flow_years)
+            self.version = version
+        return True
+
+    @staticmethod
+    def _year_rows(data, years):
+        frames, flow_years = data
+        flows = frames['flows']
+        if years is None:
+            return flows
+        positions = [flow_years[year] for year in years if year in flow_years]
+        if not positions:
+            return flows.iloc[0:0]
+        return flows.iloc[np.sort(np.concatenate(positions))]
+
+    @staticmethod
+    def _latest_year(data, name='flows'):
+        frame = data[0][name]
+        return int(frame['year'].max()) if len(frame) else None
+
+    def _year(self, data, params, name='flows'):
+        """The single `year` parameter, the latest year by default."""
+        if params.get('year', 'latest') == 'latest':
+            return self._latest_year(data, name)
+        return int_param(params, 'year')
+
+    def years(self, params):
+        """Years present in the flow data."""
+        return sorted(int(year) for year in self.data[1])
+
+    def flows(self, params):
+        """Flows filtered by year, reporter, partner and flow direction."""
+        data = self.data
+        years = [self._latest_year(data)] if params.get('year') == 'latest' else int_list(params, 'year')
+        frame = self._year_rows(data, years)
+        mask = np.ones(len(frame), dtype=bool)
+        for column, values in (('reporter_code', int_list(params, 'reporter')),
+                               ('partner_code', int_list(params, 'partner'))):
+            if values is not None:
+                mask &= frame[column].isin(values).to_numpy()
+        flows = str_list(params, 'flow')
+        if flows is not None:
+            mask &= frame['flow'].isin(flows).to_numpy()
+        return records(frame[mask])
+
+    def top_partners(self, params):
+        """The `n` largest partners of one reporter in a year and flow direction."""
+        reporter = int_list(params, 'reporter')
+        if not reporter or len(reporter) != 1:
+            raise QueryError("'reporter' must be a single country code")
+        data = self.data
+        year = self._year(data, params)
+        flow = params.get('flow', 'export')
+        n = int_param(params, 'n', DEFAULT_TOP_N)
+
+        frame = self._year_rows(data, [year])
+        frame = frame[(frame['reporter_code'] == reporter[0]) & (frame['flow'] == flow)]
+        total = frame['value'].sum()
+        top = frame.nlargest(n, 'value')[['partner_code', 'partner', 'value']]
+        top = top.assign(share=top['value'] / total if total else 0.0)
+        return {'reporter': reporter[0], 'year': year, 'flow': flow, 'total': float(total),
+                'partners': records(top)}
+
+    def sector_names(self, params):
+        """Sectors in the sector data, in file order."""
+        sectors = self.data[0]['sectors']
+        return pd.unique(sectors['sector']).tolist() if len(sectors) else []
+
+    def sector_graph(self, params):
+        """
+        Node/link subgraph of one sector's flows in a year (the latest by
+        default), keeping links of at least `min_value`.
+        """
+        sector = params.get('sector')
+        if not sector:
+            raise QueryError("'sector' is required")
+        data = self.data
+        sectors = data[0]['sectors']
+        year = self._year(data, params, 'sectors')
+        min_value = float_param(params, 'min_value', 0.0)
+
+        frame = sectors[(sectors['sector'] == sector) & (sectors['year'] == year) &
+                        (sectors['reporter'] != sectors['partner'])]
+        frame = frame[frame['value'] >= min_value]
+        names = pd.unique(pd.concat([frame['reporter'], frame['partner']])).tolist()
+        values = frame.groupby('reporter', sort=False)['value'].sum()
+        nodes = [{'id': name, 'name': name, 'value': float(values.get(name, 0.0))} for name in names]
+        links = [{'source': source, 'target': target, 'value': value}
+                 for source, target, value in zip(frame['reporter'].tolist(), frame['partner'].tolist(),
+                                                  frame['value'].tolist())]
+        return {'sector': sector, 'year': year, 'nodes': nodes, 'links': links}
+
+    def yearly(self, params):
+        """Yearly per-country totals, optionally filtered by year and country code."""
+        frame = self.data[0]['yearly']
+        mask = np.ones(len(frame), dtype=bool)
+        for column, values in (('year', int_list(params, 'year')), ('country_code', int_list(params, 'country'))):
+            if values is not None:
+                mask &= frame[column].isin(values).to_numpy()
+        return records(frame[mask])
+
+    def summary(self, params):
+        """Per-country totals over all years."""
+        return records(self.data[0]['summary'])
+
+
+# Endpoint path -> TradeQueries method name
+ROUTES = {
+    '/api/years': 'years',
+    '/api/flows': 'flows',
+    '/api/top-partners': 'top_partners',
+    '/api/sectors': 'sector_names',
+    '/api/sector-graph': 'sector_graph',
+    '/api/yearly': 'yearly',
+    '/api/summary': 'summary',
+}
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of encoded responses keyed by request."""
+
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def encode_response(payload):
+    """JSON body, its gzip copy (if worth it) and a strong ETag."""
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    compressed = gzip.compress(body, compresslevel=6, mtime=0) if len(body) >= GZIP_MIN_SIZE else None
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    return {'body': body, 'gzip': compressed, 'etag': etag}
+
+
+class QueryRequestHandler(SimpleHTTPRequestHandler):
+    """Static files from the site root plus the /api/ endpoints."""
+
+    # Keep-alive, so clients can reuse connections; headers and body go out as
+    # separate writes, so Nagle's algorithm would stall each response on a delayed ACK
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def __init__(self, *args, queries=None, cache=None, **kwargs):
+        self.queries = queries
+        self.cache = cache
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if not url.path.startswith('/api/'):
+            return super().do_GET()
+
+        method = ROUTES.get(url.path.rstrip('/'))
+        if method is None:
+            return self.send_json_error(HTTPStatus.NOT_FOUND, f"Unknown endpoint {url.path}")
+
+        if self.queries.reload_if_changed():
+            self.cache.clear()
+
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        # Keyed by the data version read before the query runs: reload publishes
+        # the data before the version, so a payload computed from data older than
+        # the current version can only land under an old key that is never read
+        key = (self.queries.version, method, tuple(sorted(params.items())))
+        entry = self.cache.get(key)
+        if entry is None:
+            try:
+                payload = getattr(self.queries, method)(params)
+            except ValueError as e:
+                return self.send_json_error(HTTPStatus.BAD_REQUEST, str(e))
+            except Exception as e:
+                # Answer rather than drop the connection, and keep serving
+                self.log_error("Error in %s: %r", url.path, e)
+                return self.send_json_error(HTTPStatus.INTERNAL_SERVER_ERROR, "Internal error")
+            entry = encode_response(payload)
+            self.cache.put(key, entry)
+
+        if entry['etag'] in self.headers.get('If-None-Match', ''):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', entry['etag'])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = entry['body']
+        use_gzip = entry['gzip'] is not None and 'gzip' in self.headers.get('Accept-Encoding', '')
+        if use_gzip:
+            body = entry['gzip']
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', entry['etag'])
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json_error(self, status, message):
+        body = json.dumps({'error': message}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(host='127.0.0.1', port=DEFAULT_PORT, processed_dir=PROCESSED_DIR,
+                cache_size=CACHE_SIZE, directory=None, quiet=False):
+    """Create (but do not start) a threaded query server."""
+    handler = partial(QueryRequestHandler, queries=TradeQueries(processed_dir),
+                      cache=ResponseCache(cache_size), directory=directory or os.getcwd())
+    server = ThreadingHTTPServer((host, port), handler)
+    server.quiet = quiet
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the visualization and a query API over the processed data.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        help="number of responses kept in the LRU cache (default: %(default)s)")
+    parser.add_argument('--quiet', action='store_true', help="do not log each request")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, cache_size=args.cache_size, quiet=args.quiet)
+    print(f"Serving on http://{args.host}:{args.port} (API under /api/)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
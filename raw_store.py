@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Columnar storage for raw UN Comtrade records.
+Records are stored as compressed Parquet files partitioned by year, reporter
+and flow, so readers can load only the partitions and columns they need.
+"""
+
+import argparse
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+RAW_STORE_DIR = 'data_sources/yearly/parquet'
+COMPRESSION = 'zstd'
+
+# Column types for Comtrade preview records; other columns keep their inferred type
+RAW_SCHEMA = {
+    'typeCode': pa.string(),
+    'freqCode': pa.string(),
+    'refPeriodId': pa.int32(),
+    'refYear': pa.int16(),
+    'refMonth': pa.int8(),
+    'period': pa.string(),
+    'reporterCode': pa.int32(),
+    'reporterISO': pa.string(),
+    'reporterDesc': pa.string(),
+    'flowCode': pa.string(),
+    'flowDesc': pa.string(),
+    'partnerCode': pa.int32(),
+    'partnerISO': pa.string(),
+    'partnerDesc': pa.string(),
+    'partner2Code': pa.int32(),
+    'cmdCode': pa.string(),
+    'cmdDesc': pa.string(),
+    'aggrLevel': pa.int8(),
+    'isLeaf': pa.bool_(),
+    'motCode': pa.int32(),
+    'qtyUnitCode': pa.int16(),
+    'qty': pa.float64(),
+    'netWgt': pa.float64(),
+    'grossWgt': pa.float64(),
+    'cifvalue': pa.float64(),
+    'fobvalue': pa.float64(),
+    'primaryValue': pa.float64(),
+    'isReported': pa.bool_(),
+    'isAggregate': pa.bool_(),
+}
+
+# Hive-style partition columns added by the directory layout
+PARTITIONING = ds.partitioning(
+    pa.schema([('year', pa.int16()), ('reporter', pa.int32()), ('flow', pa.string())]),
+    flavor='hive'
+)
+
+
+def partition_path(year, reporter, flow, root=RAW_STORE_DIR):
+    """Path of the Parquet file holding one (year, reporter, flow) partition."""
+    return os.path.join(root, f"year={year}", f"reporter={reporter}", f"flow={flow}", 'data.parquet')
+
+
+def records_to_table(records):
+    """Convert Comtrade records to an Arrow table with typed columns."""
+    table = pa.Table.from_pylist(records)
+    fields = []
+    for field in table.schema:
+        fields.append(pa.field(field.name, RAW_SCHEMA.get(field.name, field.type)))
+    return table.cast(pa.schema(fields))
+
+
+def write_partition(year, reporter, flow, records, root=RAW_STORE_DIR):
+    """Write a partition's records atomically and return its path."""
+    path = partition_path(year, reporter, flow, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Dot-prefixed temp files are ignored by dataset discovery
+    tmp_path = os.path.join(os.path.dirname(path), '.data.parquet.tmp')
+    pq.write_table(records_to_table(records), tmp_path, compression=COMPRESSION)
+    os.replace(tmp_path, path)
+    return path
+
+
+def remove_partition(year, reporter, flow, root=RAW_STORE_DIR):
+    """Delete a partition's file if there is one; returns whether it existed."""
+    path = partition_path(year, reporter, flow, root)
+    if not os.path.exists(path):
+        return False
+    os.remove(path)
+    return True
+
+
+def read_partition(path, columns=None):
+    """Read one partition file back as a list of records."""
+    if not path or not os.path.exists(path):
+        return []
+    return pq.read_table(path, columns=columns).to_pylist()
+
+
+def load_raw(years=None, reporters=None, flows=None, columns=None, root=RAW_STORE_DIR):
+    """
+    Load raw records as a DataFrame, reading only the requested partitions
+    and columns. `years`, `reporters` and `flows` are optional lists.
+    """
+    if not os.path.isdir(root):
+        return pd.DataFrame(columns=columns or [])
+
+    dataset = ds.dataset(root, format='parquet', partitioning=PARTITIONING)
+    expression = None
+    for name, values in (('year', years), ('reporter', reporters), ('flow', flows)):
+        if values is None:
+            continue
+        if name != 'flow':
+            values = [int(v) for v in values]
+        condition = ds.field(name).isin(list(values))
+        expression = condition if expression is None else expression & condition
+
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def load_year_frame(year, columns=None, root=RAW_STORE_DIR):
+    """
+    Load one year's records as a DataFrame.
+    Reads the Parquet store, falling back to a trade_data_{year}.ndjson or
+    legacy trade_data_{year}.json file.
+    """
+    if os.path.isdir(os.path.join(root, f"year={year}")):
+        return load_raw(years=[year], columns=columns, root=root)
+
+    ndjson_file = f'data_sources/yearly/trade_data_{year}.ndjson'
+    json_file = f'data_sources/yearly/trade_data_{year}.json'
+    if os.path.exists(ndjson_file):
+        with open(ndjson_file, 'r') as f:
+            frame = pd.DataFrame([json.loads(line) for line in f if line.strip()])
+    elif os.path.exists(json_file):
+        with open(json_file, 'r') as f:
+            frame = pd.DataFrame(json.load(f))
+    else:
+        return pd.DataFrame(columns=columns or [])
+    return frame if columns is None else frame.reindex(columns=columns)
+
+
+def year_input_files(year, root=RAW_STORE_DIR):
+    """Every raw file that feeds one year, in a stable order."""
+    year_dir = os.path.join(root, f"year={year}")
+    if os.path.isdir(year_dir):
+        return sorted(os.path.join(dirpath, name)
+                      for dirpath, _, filenames in os.walk(year_dir)
+                      for name in filenames if not name.startswith('.'))
+    for year_file in (f'data_sources/yearly/trade_data_{year}.ndjson',
+                      f'data_sources/yearly/trade_data_{year}.json'):
+        if os.path.exists(year_file):
+            return [year_file]
+    return []
+
+
+def iter_year_chunks(year, columns=None, chunk_size=None, root=RAW_STORE_DIR):
+    """
+    Yield one year's records as DataFrames of at most `chunk_size` rows.
+    With no `chunk_size` the whole year is yielded at once. Parquet batches,
+    trade_data_{year}.ndjson lines and legacy JSON arrays (via ijson) are
+    all read incrementally, so only one chunk is held in memory.
+    """
+    if chunk_size is None:
+        frame = load_year_frame(year, columns, root)
+        if not frame.empty:
+            yield frame
+        return
+
+    if os.path.isdir(os.path.join(root, f"year={year}")):
+        dataset = ds.dataset(root, format='parquet', partitioning=PARTITIONING)
+        for batch in dataset.to_batches(columns=columns, filter=ds.field('year') == int(year),
+                                        batch_size=chunk_size):
+            if batch.num_rows:
+                yield batch.to_pandas()
+        return
+
+    ndjson_file = f'data_sources/yearly/trade_data_{year}.ndjson'
+    json_file = f'data_sources/yearly/trade_data_{year}.json'
+    if os.path.exists(ndjson_file):
+        f = open(ndjson_file, 'r')
+        records = (json.loads(line) for line in f if line.strip())
+    elif os.path.exists(json_file):
+        import ijson
+        f = open(json_file, 'rb')
+        records = ijson.items(f, 'item', use_float=True)
+    else:
+        return
+
+    with f:
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) == chunk_size:
+                yield pd.DataFrame(chunk, columns=columns)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns)
+
+
+def migrate_json_year(year_file, root=RAW_STORE_DIR):
+    """Split a legacy year JSON file into Parquet partitions."""
+    with open(year_file, 'r') as f:
+        records = json.load(f)
+
+    partitions = {}
+    for record in records:
+        key = (int(record['refYear'] if 'refYear' in record else record['period']),
+               int(record['reporterCode']), record['flowCode'])
+        partitions.setdefault(key, []).append(record)
+
+    for (year, reporter, flow), partition_records in partitions.items():
+        write_partition(year, reporter, flow, partition_records, root)
+    return len(records), len(partitions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the Parquet store of raw Comtrade records.")
+    parser.add_argument('--migrate', action='store_true',
+                        help="convert legacy data_sources/yearly/trade_data_*.json files to Parquet")
+    args = parser.parse_args()
+
+    if args.migrate:
+        for name in sorted(os.listdir('data_sources/yearly')):
+            if name.startswith('trade_data_') and name.endswith('.json'):
+                rows, count = migrate_json_year(os.path.join('data_sources/yearly', name))
+                print(f"Migrated {name}: {rows} records into {count} partitions")
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Synthetic UN Comtrade data for benchmarks and scale tests.
+Generates records in the schema of the preview_*.json files at any scale:
+years x reporters x partners x flows, each with a TOTAL record and optionally
+a commodity breakdown down to HS2, HS4 or HS6. Commodity codes are sampled
+from commodity_reference.json, and each level's values add up to the level
+above, so the sampled codes stand in for the whole classification.
+Records can be written as preview-style JSON files or straight into the
+Parquet raw store the pipeline reads; synthetic_site runs them through the
+pipeline into a servable copy of the site.
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_PATH = os.path.join(REPO_DIR, 'data_sources', 'preview_842.json')
+COMMODITY_REFERENCE_PATH = os.path.join(REPO_DIR, 'data_sources', 'commodity_reference.json')
+
+HS_DEPTHS = (0, 2, 4, 6)
+
+# Leaf codes sampled at the deepest HS level
+DEFAULT_COMMODITIES = 20
+
+FLOWS = (('M', 'Import'), ('X', 'Export'))
+
+
+def load_template(path=TEMPLATE_PATH):
+    """The first record of a preview file, used for every field the generator does not set."""
+    with open(path, 'r') as f:
+        return json.load(f)[0]
+
+
+def sample_commodities(hs_depth, count=DEFAULT_COMMODITIES, seed=0, path=COMMODITY_REFERENCE_PATH):
+    """
+    Sample `count` codes at HS level `hs_depth` and add their ancestors.
+    Returns a DataFrame of code, description, level, parent and leaf flag,
+    parents before children; empty for depth 0 (TOTAL only).
+    """
+    if hs_depth not in HS_DEPTHS:
+        raise ValueError(f"hs_depth must be one of {HS_DEPTHS}, got {hs_depth}")
+    columns = ['code', 'description', 'level', 'parent', 'leaf']
+    if hs_depth == 0:
+        return pd.DataFrame(columns=columns)
+
+    reference = pd.read_json(path, dtype={'id': str, 'parent': str})
+    reference = reference[reference['aggrLevel'].isin([2, 4, 6])]
+    codes = reference['id'].to_numpy()
+    rng = np.random.default_rng(seed)
+    candidates = codes[reference['aggrLevel'].to_numpy() == hs_depth]
+    leaves = rng.choice(candidates, size=min(count, len(candidates)), replace=False)
+
+    wanted = {code[:level] for code in leaves for level in range(2, hs_depth + 1, 2)}
+    chosen = reference[reference['id'].isin(wanted)].sort_values('id')
+    return pd.DataFrame({
+        'code': chosen['id'].to_numpy(),
+        # Reference texts read "010110 - Horses: ..."; records carry just the description
+        'description': [text.split(' - ', 1)[-1].lstrip('- ') for text in chosen['text']],
+        'level': chosen['aggrLevel'].to_numpy(),
+        'parent': [code[:-2] if len(code) > 2 else 'TOTAL' for code in chosen['id']],
+        'leaf': chosen['aggrLevel'].to_numpy() == hs_depth,
+    }, columns=columns)
+
+
+def commodity_values(totals, commodities, rng):
+    """
+    Split each partner's total over the commodity tree. Returns an array of
+    shape (len(totals), len(commodities)) whose leaves add up to the totals
+    and whose parents are the sums of their children.
+    """
+    values = np.zeros((len(totals), len(commodities)))
+    if commodities.empty:
+        return values
+    leaf = commodities['leaf'].to_numpy()
+    shares = rng.gamma(0.5, size=(len(totals), leaf.sum()))
+    values[:, leaf] = totals[:, None] * shares / shares.sum(axis=1, keepdims=True)
+
+    # Roll the leaves up, deepest level first
+    positions = {code: i for i, code in enumerate(commodities['code'])}
+    for i in np.argsort(-commodities['level'].to_numpy(), kind='stable'):
+        parent = positions.get(commodities['parent'].iat[i])
+        if parent is not None:
+            values[:, parent] += values[:, i]
+    return values
+
+
+def country_names(codes, country_mapping):
+    """Name and ISO3 for each code, from the country mapping where it has one."""
+    names = {}
+    for code in codes:
+        country = country_mapping.get(str(code)) or {}
+        names[code] = (country.get('name', f"Country {code}"), country.get('iso3', ''))
+    names[0] = ('World', 'W00')
+    return names
+
+
+def iter_partitions(years, reporters, partners, hs_depth=0, commodities=DEFAULT_COMMODITIES,
+                    country_mapping=None, seed=0):
+    """
+    Yield ((year, reporter, flow), records) for every partition, so callers
+    can write large datasets without holding every record. Each partition
+    has one TOTAL record per partner other than the reporter itself (Comtrade
+    has no self-trade) plus the "World" (code 0) total, each with the sampled
+    commodity breakdown. The same arguments give the same records.
+    """
+    template = load_template()
+    tree = sample_commodities(hs_depth, commodities, seed)
+    codes = [('TOTAL', 'All Commodities', 0, False)] + list(zip(
+        tree['code'], tree['description'], tree['level'].tolist(), tree['leaf'].tolist()))
+    names = country_names(set(reporters) | set(partners), country_mapping or {})
+    partners = list(partners)
+    rng = np.random.default_rng(seed)
+
+    for year in years:
+        for reporter in reporters:
+            reporter_name, reporter_iso = names[reporter]
+            reporter_partners = [partner for partner in partners if partner != reporter]
+            for flow, flow_desc in FLOWS:
+                totals = rng.uniform(1e6, 1e11, len(reporter_partners))
+                totals = np.concatenate([[totals.sum()], totals])
+                values = np.hstack([totals[:, None], commodity_values(totals, tree, rng)])
+                records = []
+                for p, partner in enumerate([0] + reporter_partners):
+                    partner_name, partner_iso = names[partner]
+                    for c, (code, description, level, leaf) in enumerate(codes):
+                        value = float(values[p, c])
+                        record = dict(template)
+                        record.update({
+                            'refYear': year, 'period': str(year), 'refPeriodId': year * 10000 + 101,
+                            'reporterCode': reporter, 'reporterISO': reporter_iso, 'reporterDesc': reporter_name,
+                            'partnerCode': partner, 'partnerISO': partner_iso, 'partnerDesc': partner_name,
+                            'flowCode': flow, 'flowDesc': flow_desc,
+                            'cmdCode': code, 'cmdDesc': description, 'aggrLevel': level, 'isLeaf': leaf,
+                            'primaryValue': value, 'cifvalue': value if flow == 'M' else None,
+                            'fobvalue': value if flow == 'X' else None,
+                            'isAggregate': partner == 0 or not leaf,
+                        })
+                        records.append(record)
+                yield (year, reporter, flow), records
+
+
+def synthetic_records(years, reporters, partners, seed=0, hs_depth=0, commodities=DEFAULT_COMMODITIES,
+                      country_mapping=None):
+    """All records of iter_partitions as one list."""
+    return [record
+            for _, records in iter_partitions(years, reporters, partners, hs_depth, commodities,
+                                              country_mapping, seed)
+            for record in records]
+
+
+def write_raw_store(root, years, reporters, partners, seed=0, hs_depth=0,
+                    commodities=DEFAULT_COMMODITIES, country_mapping=None):
+    """Write synthetic partitions to a Parquet raw store under `root`; returns the record count."""
+    from raw_store import write_partition
+
+    count = 0
+    for (year, reporter, flow), records in iter_partitions(years, reporters, partners, hs_depth,
+                                                           commodities, country_mapping, seed):
+        write_partition(year, reporter, flow, records, root=root)
+        count += len(records)
+    return count
+
+
+def write_preview_files(out_dir, years, reporters, partners, seed=0, hs_depth=0,
+                        commodities=DEFAULT_COMMODITIES, country_mapping=None):
+    """
+    Write one preview_{reporter}_{year}_{flow}.json per partition, shaped
+    like the preview files from the API. Returns the paths written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for (year, reporter, flow), records in iter_partitions(years, reporters, partners, hs_depth,
+                                                           commodities, country_mapping, seed):
+        path = os.path.join(out_dir, f'preview_{reporter}_{year}_{flow}.json')
+        with open(path, 'w') as f:
+            json.dump(records, f)
+        paths.append(path)
+    return paths
+
+
+# Reference files the processing pipeline reads from data_sources
+REFERENCE_FILES = ['country_mapping.json', 'reporters.json', 'partners.json', 'country_regions.json',
+                   'sector_rules.json', 'commodity_reference.json', 'gdp_reference.csv', 'world.geojson']
+
+# Frontend files served with a synthetic dataset
+SITE_FILES = ['index.html', 'visualization.js', 'trade_bundle.js', 'arc_layer.js', 'data_worker.js']
+
+
+def copy_data_sources(path, names=REFERENCE_FILES):
+    """Copy reference files from the repository's data_sources into `path`/data_sources."""
+    os.makedirs(os.path.join(path, 'data_sources'), exist_ok=True)
+    for name in names:
+        with open(os.path.join(REPO_DIR, 'data_sources', name), 'rb') as src, \
+                open(os.path.join(path, 'data_sources', name), 'wb') as dst:
+            dst.write(src.read())
+
+
+def synthetic_site(path, years=10, reporters=60, partners=200, workers=1):
+    """
+    Build a servable copy of the site over a large synthetic dataset in `path`:
+    synthetic raw records for real country codes (so names and the map still
+    resolve) run through the full pipeline, with the frontend files linked in.
+    """
+    import subprocess
+    import sys
+    from raw_store import RAW_STORE_DIR
+
+    with open(os.path.join(REPO_DIR, 'data_sources', 'country_mapping.json'), 'r') as f:
+        country_mapping = json.load(f)
+    codes = sorted(int(code) for code in country_mapping)
+    os.makedirs(os.path.join(path, 'data', 'processed'), exist_ok=True)
+    copy_data_sources(path)
+    count = write_raw_store(os.path.join(path, RAW_STORE_DIR), range(2025 - years, 2025), codes[:reporters],
+                            codes[:partners], country_mapping=country_mapping)
+    print(f"Synthetic site: {count} records, {years} years x {reporters} reporters x {partners} partners")
+
+    subprocess.run([sys.executable, os.path.join(REPO_DIR, 'process_trade_data.py'), '--workers', str(workers)],
+                   cwd=path, env=dict(os.environ, PYTHONPATH=REPO_DIR), check=True)
+    for name in SITE_FILES:
+        if not os.path.exists(os.path.join(path, name)):
+            os.symlink(os.path.join(REPO_DIR, name), os.path.join(path, name))
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic Comtrade-shaped trade records.")
+    parser.add_argument('--years', type=int, default=10, help="number of years, ending in 2024")
+    parser.add_argument('--reporters', type=int, default=15)
+    parser.add_argument('--partners', type=int, default=200)
+    parser.add_argument('--hs-depth', type=int, choices=HS_DEPTHS, default=0,
+                        help="commodity breakdown depth: 0 (TOTAL only), 2, 4 or 6 digits")
+    parser.add_argument('--commodities', type=int, default=DEFAULT_COMMODITIES,
+                        help="codes sampled at the deepest HS level (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', choices=['store', 'preview'], default='store',
+                        help="Parquet raw store partitions or preview-style JSON files")
+    parser.add_argument('--out', required=True, help="output directory")
+    args = parser.parse_args()
+
+    with open(os.path.join(REPO_DIR, 'data_sources', 'country_mapping.json'), 'r') as f:
+        mapping = json.load(f)
+    codes = sorted(int(code) for code in mapping)
+    # Beyond the mapping, use unmapped codes: Comtrade codes (and the
+    # pipeline's packed commodity keys) stop at 999, and 0 is the World
+    needed = max(args.reporters, args.partners) - len(codes)
+    if needed > 0:
+        spare = sorted(set(range(1, 1000)) - set(codes))
+        if needed > len(spare):
+            parser.error(f"at most {len(codes) + len(spare)} reporters or partners can be generated")
+        codes += spare[:needed]
+    options = dict(years=range(2025 - args.years, 2025), reporters=codes[:args.reporters],
+                   partners=codes[:args.partners], seed=args.seed, hs_depth=args.hs_depth,
+                   commodities=args.commodities, country_mapping=mapping)
+
+    if args.format == 'store':
+        count = write_raw_store(args.out, **options)
+        print(f"Wrote {count} records to the raw store in {args.out}")
+    else:
+        paths = write_preview_files(args.out, **options)
+        print(f"Wrote {len(paths)} preview files to {args.out}")
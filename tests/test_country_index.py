@@ -0,0 +1,126 @@
+"""Lookups of the compiled country index and which code wins an ISO code or name shared by several."""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from country_index import OTHER_REGION, REPORTERS_PATH, CountryIndex, source_version
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def reporter(code, name, iso2, iso3, effective='1900-01-01T00:00:00', expired=None, group=False):
+    return {'reporterCode': code, 'reporterDesc': name, 'reporterCodeIsoAlpha2': iso2,
+            'reporterCodeIsoAlpha3': iso3, 'entryEffectiveDate': effective, 'entryExpiredDate': expired,
+            'isGroup': group}
+
+
+def partner(code, name, iso2, iso3, effective='1900-01-01T00:00:00', expired=None, group=False):
+    return {'PartnerCode': code, 'PartnerDesc': name, 'PartnerCodeIsoAlpha2': iso2,
+            'PartnerCodeIsoAlpha3': iso3, 'entryEffectiveDate': effective, 'entryExpiredDate': expired,
+            'isGroup': group}
+
+
+@pytest.fixture
+def sources(tmp_path):
+    files = {
+        'mapping': {'276': {'name': 'Germany', 'iso2': 'DE', 'iso3': 'DEU'}},
+        'reporters': [
+            # Listed first, but expired
+            reporter(841, 'USA and Puerto Rico (...1980)', 'US', 'USA', expired='1980-12-31T00:00:00'),
+            reporter(842, 'USA', 'US', 'USA', effective='1981-01-01T00:00:00'),
+            reporter(276, 'Federal Republic of Germany', 'DE', 'DEU'),
+            # Two current entries: the more recently effective one wins
+            reporter(710, 'South Africa', 'ZA', 'ZAF', effective='2000-01-01T00:00:00'),
+            reporter(711, 'Southern African Customs Union', 'ZA', 'ZAF', effective='1990-01-01T00:00:00'),
+            reporter(97, 'EU', None, float('nan'), group=True),
+        ],
+        'partners': [
+            # A partner-only code sharing a reporter's ISO code loses to the reporter
+            partner(840, 'United States (partner)', 'US', 'USA', effective='2020-01-01T00:00:00'),
+            partner(0, 'World', None, 'W00', group=True),
+            partner(490, 'Other Asia, nes', None, 'S19'),
+        ],
+        'regions': {'North America': ['USA'], 'Europe': ['DEU']},
+    }
+    paths = {}
+    for name, content in files.items():
+        paths[name] = str(tmp_path / f'{name}.json')
+        with open(paths[name], 'w') as f:
+            json.dump(content, f)
+    return paths
+
+
+@pytest.fixture
+def index(sources):
+    return CountryIndex.from_sources(sources['mapping'], sources['reporters'], sources['partners'],
+                                     sources['regions'])
+
+
+def test_shared_iso_codes_prefer_current_reporters(index):
+    assert index.code('USA') == index.code('US') == 842
+    assert index.code('ZAF') == 710
+    # Expired and partner-only entries stay reachable by code and by their own name
+    assert index.name(841) == 'USA and Puerto Rico (...1980)'
+    assert index.code('USA and Puerto Rico (...1980)') == 841
+    assert index.code('United States (partner)') == 840
+
+
+def test_rows_are_in_preference_order(index):
+    rows = index.codes.tolist()
+    assert rows.index(842) < rows.index(841)
+    assert rows.index(710) < rows.index(711)
+    assert max(rows.index(code) for code in (841, 842, 276, 710, 711, 97)) < rows.index(840)
+
+
+def test_the_mapping_names_a_code_before_the_references(index):
+    assert index.name(276) == 'Germany'
+    assert index.code('Germany') == 276
+    assert index.region('DEU') == 'Europe'
+
+
+def test_lookups_by_code_iso_and_name(index):
+    assert index.name('US') == 'USA'
+    assert index.iso3_of(842) == 'USA'
+    assert index.region(842) == 'North America'
+    assert index.region('S19') == OTHER_REGION
+    # Missing ISO codes are empty strings, not keys
+    assert index.iso3_of(97) == ''
+    assert index.position('') == -1
+
+
+def test_unknown_keys(index):
+    assert index.position(999) == -1
+    assert index.code('XXX') is None
+    assert index.name(999) is None
+    assert 999 not in index and 842 in index
+
+
+def test_array_lookups(index):
+    codes = np.array([842, 999, 0, 276])
+    assert index.positions(codes).tolist() == [index.position(842), -1, index.position(0), index.position(276)]
+    assert index.names_of(codes).tolist() == ['USA', None, 'World', 'Germany']
+    assert index.is_reporter(codes).tolist() == [True, False, False, True]
+    assert sorted(index.reporter_codes().tolist()) == [97, 276, 710, 711, 841, 842]
+    assert index.group[index.position(0)] and not index.group[index.position(842)]
+
+
+def test_save_and_load_round_trip(index, sources, tmp_path):
+    path = str(tmp_path / 'country_index.npz')
+    index.save(path)
+    loaded = CountryIndex.load(path)
+    assert loaded.version == index.version == source_version(
+        [sources['mapping'], sources['reporters'], sources['partners'], sources['regions']])
+    assert loaded.to_json() == index.to_json()
+    assert loaded.code('USA') == 842
+
+
+def test_real_references_resolve_current_codes(monkeypatch):
+    monkeypatch.chdir(REPO_DIR)
+    if not os.path.exists(REPORTERS_PATH):
+        pytest.skip("reporter reference not fetched")
+    index = CountryIndex.from_sources()
+    assert index.code('USA') == 842
+    assert index.iso3_of(842) == 'USA'
@@ -0,0 +1,72 @@
+"""Manifest bookkeeping of fetch_trade_data against a stub Comtrade API."""
+
+import json
+import os
+
+import pytest
+
+from comtrade_stub import StubComtradeAPI, StubFrame
+from databank_search import fetch_trade_data
+from fetch_engine import TokenBucket
+from manifest import MANIFEST_PATH, partition_key
+from raw_store import partition_path
+
+
+class FixedAPI(StubComtradeAPI):
+    """Returns the same records for a partition on every call; partitions in `empty` have none."""
+
+    def __init__(self):
+        super().__init__(latency=0, partners=3)
+        self.empty = set()
+        self.calls = []
+
+    def previewFinalData(self, period, reporterCode, flowCode, **kwargs):
+        self.calls.append((period, reporterCode, flowCode))
+        if (period, reporterCode, flowCode) in self.empty:
+            return StubFrame([])
+        return StubFrame([{'period': period, 'reporterCode': int(reporterCode), 'partnerCode': partner,
+                           'flowCode': flowCode, 'cmdCode': 'TOTAL', 'primaryValue': float(partner)}
+                          for partner in range(1, self.partners + 1)])
+
+
+@pytest.fixture
+def fetch(tmp_path, monkeypatch):
+    """Run fetch_trade_data (exports only, one worker, no rate limit) in a scratch directory."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data_sources')
+    api = FixedAPI()
+
+    def run(**kwargs):
+        api.calls.clear()
+        fetch_trade_data(workers=1, api=api, limiter=TokenBucket(rate=1e6, capacity=1e6), flows=('X',), **kwargs)
+        with open(MANIFEST_PATH, 'r') as f:
+            return json.load(f)
+
+    run.api = api
+    return run
+
+
+def test_deleted_partition_file_is_restored(fetch):
+    fetch()
+    year, reporter, flow = fetch.api.calls[0]
+    path = partition_path(year, reporter, flow)
+    os.remove(path)
+
+    fetch()
+    assert fetch.api.calls == [(year, reporter, flow)]
+    assert os.path.exists(path)
+    # Restored, so the next run has nothing to fetch
+    fetch()
+    assert fetch.api.calls == []
+
+
+def test_partition_that_becomes_empty_loses_its_file(fetch):
+    fetch()
+    year, reporter, flow = fetch.api.calls[0]
+    path = partition_path(year, reporter, flow)
+    assert os.path.exists(path)
+
+    fetch.api.empty.add((year, reporter, flow))
+    manifest = fetch(force=True)
+    assert manifest[partition_key(year, reporter, flow)]['status'] == 'empty'
+    assert not os.path.exists(path)
@@ -0,0 +1,176 @@
+"""Rate limiting, retries and ordering of the concurrent fetch engine."""
+
+import http.client
+import threading
+import time
+
+import pytest
+
+from fetch_engine import TokenBucket, call_with_retry, run_fetches
+from http_transport import HttpError
+
+
+class FakeClock:
+    """A clock that only moves when something sleeps on it."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class MaxJitter:
+    """An rng whose jitter always picks the full backoff, so delays are predictable."""
+
+    def uniform(self, low, high):
+        return high
+
+
+def test_token_bucket_caps_call_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=1, clock=clock, sleep=clock.sleep)
+    starts = []
+    for _ in range(10):
+        bucket.acquire()
+        starts.append(clock.now)
+    # The first call starts at once, each later one half a second after the last
+    assert starts == pytest.approx([i * 0.5 for i in range(10)])
+
+
+def test_token_bucket_allows_a_burst_up_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, capacity=5, clock=clock, sleep=clock.sleep)
+    for _ in range(5):
+        bucket.acquire()
+    assert clock.sleeps == []
+    bucket.acquire()
+    assert clock.now == pytest.approx(1.0)
+
+
+def test_token_bucket_caps_rate_across_threads():
+    bucket = TokenBucket(rate=100, capacity=1)
+    start = time.monotonic()
+    threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(10)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.monotonic() - start >= 39 / 100
+
+
+def failing(errors, result='ok'):
+    """A function raising each of `errors` on successive calls, then returning `result`."""
+    errors = list(errors)
+    calls = []
+
+    def func():
+        calls.append(None)
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    func.calls = calls
+    return func
+
+
+@pytest.mark.parametrize('status', [429, 500, 502, 503])
+def test_call_with_retry_backs_off_on_throttling_and_server_errors(status):
+    clock = FakeClock()
+    func = failing([HttpError('http://stub', status)] * 3)
+    result, attempts = call_with_retry(func, retries=4, base_delay=1.0, max_delay=60.0,
+                                       sleep=clock.sleep, rng=MaxJitter())
+    assert (result, attempts) == ('ok', 4)
+    assert clock.sleeps == [1.0, 2.0, 4.0]
+
+
+def test_call_with_retry_caps_the_delay():
+    clock = FakeClock()
+    func = failing([HttpError('http://stub', 503)] * 4)
+    call_with_retry(func, retries=4, base_delay=1.0, max_delay=3.0, sleep=clock.sleep, rng=MaxJitter())
+    assert clock.sleeps == [1.0, 2.0, 3.0, 3.0]
+
+
+def test_call_with_retry_gives_up_after_retries():
+    clock = FakeClock()
+    func = failing([HttpError('http://stub', 429)] * 10)
+    with pytest.raises(HttpError) as error:
+        call_with_retry(func, retries=3, sleep=clock.sleep, rng=MaxJitter())
+    assert error.value.status == 429
+    assert len(func.calls) == 4
+    assert len(clock.sleeps) == 3
+
+
+def test_call_with_retry_takes_a_token_per_attempt():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, capacity=1, clock=clock, sleep=clock.sleep)
+    func = failing([HttpError('http://stub', 500)])
+    call_with_retry(func, limiter=bucket, base_delay=0.0, sleep=clock.sleep, rng=MaxJitter())
+    # The retry waits for the bucket to refill before it starts
+    assert clock.now == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize('error', [HttpError('http://stub', 400), HttpError('http://stub', 404),
+                                   ValueError("Comtrade error: invalid period"), KeyError('data')])
+def test_call_with_retry_raises_permanent_errors_at_once(error):
+    clock = FakeClock()
+    func = failing([error])
+    with pytest.raises(type(error)):
+        call_with_retry(func, retries=4, sleep=clock.sleep, rng=MaxJitter())
+    assert len(func.calls) == 1
+    assert clock.sleeps == []
+
+
+@pytest.mark.parametrize('error', [ConnectionResetError(), TimeoutError(), http.client.RemoteDisconnected()])
+def test_call_with_retry_retries_connection_failures(error):
+    clock = FakeClock()
+    func = failing([error])
+    assert call_with_retry(func, sleep=clock.sleep, rng=MaxJitter()) == ('ok', 2)
+
+
+def test_run_fetches_preserves_task_order():
+    tasks = list(range(20))
+
+    def fetch(task):
+        # Later tasks finish first
+        time.sleep(0.001 * (20 - task))
+        return task * 2
+
+    outcomes, stats = run_fetches(tasks, fetch, workers=4)
+    assert [outcome['task'] for outcome in outcomes] == tasks
+    assert [outcome['data'] for outcome in outcomes] == [task * 2 for task in tasks]
+    assert stats['tasks'] == stats['calls'] == 20
+    assert stats['failed'] == 0
+
+
+def test_run_fetches_reports_failures():
+    def fetch(task):
+        if task % 3 == 0:
+            raise HttpError('http://stub', 503)
+        return task
+
+    finished = []
+    outcomes, stats = run_fetches(range(9), fetch, workers=3, retries=2, base_delay=0.0,
+                                  on_result=finished.append)
+    failed = [outcome for outcome in outcomes if outcome['error'] is not None]
+    assert [outcome['task'] for outcome in failed] == [0, 3, 6]
+    assert all(isinstance(outcome['error'], HttpError) and outcome['data'] is None and outcome['attempts'] == 3
+               for outcome in failed)
+    assert [outcome['data'] for outcome in outcomes if outcome['error'] is None] == [1, 2, 4, 5, 7, 8]
+    assert stats['failed'] == 3
+    assert stats['calls'] == 6 + 3 * 3
+    assert sorted(outcome['task'] for outcome in finished) == list(range(9))
+
+
+def test_run_fetches_counts_attempts_of_permanent_failures():
+    def fetch(task):
+        raise HttpError('http://stub', 400)
+
+    outcomes, stats = run_fetches(range(3), fetch, workers=2, retries=2, base_delay=0.0)
+    assert [outcome['attempts'] for outcome in outcomes] == [1, 1, 1]
+    assert stats['calls'] == 3
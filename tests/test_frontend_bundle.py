@@ -0,0 +1,26 @@
+"""Latest-year reads of the processed CSVs for the frontend bundle."""
+
+import pandas as pd
+import pytest
+
+from frontend_bundle import read_csv, read_latest_year
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 5, 100])
+def test_read_latest_year_matches_a_full_read(tmp_path, chunk_size):
+    path = tmp_path / 'flows.csv'
+    pd.DataFrame({'year': [2019, 2019, 2021, 2020, 2021, 2021, 2018],
+                  'reporter': ['A', 'NA', 'B', 'C', 'D', '', 'E'],
+                  'value': [0.1, 0.2, 1 / 3, 0.4, 2 / 3, 1e20, 0.7]}).to_csv(path, index=False)
+    full = read_csv(path)
+    latest = read_latest_year(path, chunk_size)
+    assert latest.equals(full[full['year'] == 2021])
+    # Strings such as 'NA' stay verbatim and floats round-trip exactly
+    assert latest['reporter'].tolist() == ['B', 'D', '']
+    assert latest['value'].tolist() == [1 / 3, 2 / 3, 1e20]
+
+
+def test_read_latest_year_of_an_empty_file(tmp_path):
+    path = tmp_path / 'flows.csv'
+    path.write_text('year,reporter,value\n')
+    assert read_latest_year(path).empty
@@ -0,0 +1,30 @@
+"""Blocked repulsion of the offline force layout."""
+
+import numpy as np
+import pytest
+
+from graph_layout import force_layout, repulsion
+
+
+def dense_repulsion(positions, k):
+    """The all-pairs repulsion in one n x n block."""
+    delta = positions[:, None, :] - positions[None, :, :]
+    distance = np.maximum(np.sqrt((delta ** 2).sum(axis=-1)), 1e-4)
+    np.fill_diagonal(distance, np.inf)
+    return (delta * (k * k / distance ** 2)[..., None]).sum(axis=1)
+
+
+@pytest.mark.parametrize('block_pairs', [1, 37, 500, 10 ** 6])
+def test_blocked_repulsion_matches_dense(block_pairs):
+    positions = np.random.default_rng(0).random((120, 2))
+    k = np.sqrt(1 / 120)
+    assert np.array_equal(repulsion(positions, k, block_pairs), dense_repulsion(positions, k))
+
+
+def test_force_layout_is_stable_and_in_the_unit_square():
+    rng = np.random.default_rng(1)
+    sources, targets = rng.integers(0, 50, 200), rng.integers(0, 50, 200)
+    layout = force_layout(50, sources, targets, iterations=50)
+    assert layout.shape == (50, 2)
+    assert ((layout >= 0) & (layout <= 1)).all()
+    assert np.array_equal(layout, force_layout(50, sources, targets, iterations=50))
@@ -0,0 +1,85 @@
+"""Nesting of the edge levels of detail and the pruning method behind each level."""
+
+import numpy as np
+import pytest
+
+from graph_pruning import (LOD_LEVELS, PRUNING_METHODS, add_link_levels, cumulative_share, disparity_filter,
+                           edge_levels, level_summary, top_k)
+
+
+@pytest.fixture
+def graph():
+    """A random directed graph without self-loops or repeated edges, with heavy-tailed values."""
+    rng = np.random.default_rng(0)
+    pairs = [(s, t) for s in range(30) for t in range(30) if s != t]
+    chosen = rng.choice(len(pairs), size=300, replace=False)
+    sources = np.array([pairs[i][0] for i in chosen])
+    targets = np.array([pairs[i][1] for i in chosen])
+    return sources, targets, rng.pareto(1.2, len(chosen)) * 1e6 + 1.0
+
+
+@pytest.mark.parametrize('levels', [
+    LOD_LEVELS,
+    # Levels that are not nested themselves still give nested levels of detail
+    [('share', 0.95), ('top_k', 1), ('disparity', 0.05), ('all', None)],
+])
+def test_each_level_holds_the_union_of_its_methods(graph, levels):
+    sources, targets, values = graph
+    lod = edge_levels(sources, targets, values, levels)
+    union = np.zeros(len(values), dtype=bool)
+    for level, (method, param) in enumerate(levels):
+        union |= PRUNING_METHODS[method](sources, targets, values, param)
+        np.testing.assert_array_equal(lod <= level, union)
+    assert (lod <= len(levels) - 1).all()
+
+
+def test_level_counts_grow_to_every_edge(graph):
+    lod = edge_levels(*graph)
+    counts = [level['links'] for level in level_summary(lod)]
+    assert counts == sorted(counts)
+    assert 0 < counts[0] < counts[-1] == len(lod)
+    assert [(level['method'], level['param']) for level in level_summary(lod)] == LOD_LEVELS
+
+
+def test_larger_shares_keep_more_edges(graph):
+    narrow = cumulative_share(*graph, 0.8)
+    wide = cumulative_share(*graph, 0.95)
+    assert (narrow <= wide).all() and wide.sum() > narrow.sum()
+    assert (top_k(*graph, 2) <= top_k(*graph, 3)).all()
+
+
+def test_top_k_keeps_the_largest_edges_of_sources_or_targets():
+    sources = np.array([0, 0, 0, 1])
+    targets = np.array([1, 2, 3, 3])
+    values = np.array([5.0, 9.0, 1.0, 2.0])
+    # 0 -> 3 is neither 0's largest export nor 3's largest import; 0 -> 1 is 1's only import
+    assert top_k(sources, targets, values, 1).tolist() == [True, True, False, True]
+    # ...but it is among 3's two largest imports
+    assert top_k(sources, targets, values, 2).all()
+
+
+def test_cumulative_share_keeps_the_edge_crossing_the_threshold():
+    sources = np.zeros(3, dtype=int)
+    targets = np.ones(3, dtype=int)
+    values = np.array([10.0, 50.0, 30.0])
+    # 50 alone is short of 80% of 90; the 30 edge crosses the threshold and is kept
+    assert cumulative_share(sources, targets, values, 0.8).tolist() == [False, True, True]
+    assert cumulative_share(sources, targets, values, 0.5).tolist() == [False, True, False]
+
+
+def test_disparity_filter_keeps_dominant_edges_and_single_links():
+    sources = np.array([0, 0, 0, 0, 0, 1])
+    targets = np.array([2, 2, 2, 2, 2, 3])
+    values = np.array([1000.0, 1.0, 1.0, 1.0, 1.0, 5.0])
+    keep = disparity_filter(sources, targets, values, 0.05)
+    assert keep.tolist() == [True, False, False, False, False, True]
+
+
+def test_links_with_string_ids_are_tagged():
+    network = {'links': [{'source': 'USA', 'target': 'CHN', 'value': 100.0},
+                         {'source': 'USA', 'target': 'DEU', 'value': 1.0},
+                         {'source': 'DEU', 'target': 'CHN', 'value': 50.0}]}
+    add_link_levels(network)
+    assert [link['lod'] for link in network['links']] == \
+        edge_levels(['USA', 'USA', 'DEU'], ['CHN', 'DEU', 'CHN'], [100.0, 1.0, 50.0]).tolist()
+    assert network['levels'][-1]['links'] == 3
@@ -0,0 +1,128 @@
+"""Request coalescing and caching of the shared HTTP transport against the local Comtrade stub."""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import comtrade_api
+from comtrade_api import ComtradeAPI
+from comtrade_stub import stub_comtrade_server
+from http_transport import HttpError, HttpTransport
+
+CALLERS = 8
+PREVIEW_PATH = '/public/v1/preview/C/A/HS'
+
+
+@pytest.fixture
+def stub():
+    # Enough latency that every caller asks while the first request is still in flight
+    server, base_url = stub_comtrade_server(latency=0.2, partners=5)
+    try:
+        yield server, base_url
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def concurrent_gets(transport, url, params=None):
+    """CALLERS identical GETs released at the same moment; returns each call's response or error."""
+    barrier = threading.Barrier(CALLERS)
+
+    def get(_):
+        barrier.wait()
+        try:
+            return transport.get(url, params)
+        except HttpError as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=CALLERS) as pool:
+        return list(pool.map(get, range(CALLERS)))
+
+
+def test_concurrent_identical_gets_make_one_upstream_request(stub, tmp_path):
+    server, base_url = stub
+    with HttpTransport(cache_dir=str(tmp_path)) as transport:
+        responses = concurrent_gets(transport, base_url + PREVIEW_PATH,
+                                    {'period': 2020, 'reporterCode': 842, 'flowCode': 'X'})
+    assert server.requests == 1
+    assert transport.stats['network'] == 1
+    assert transport.stats['coalesced'] == CALLERS - 1
+    assert len({response.body for response in responses}) == 1
+    assert responses[0].json()['data']
+
+
+def test_concurrent_gets_without_cache_make_one_upstream_request(stub):
+    server, base_url = stub
+    with HttpTransport(cache_dir=None) as transport:
+        concurrent_gets(transport, base_url + PREVIEW_PATH, {'period': 2020, 'reporterCode': 842, 'flowCode': 'X'})
+    assert server.requests == 1
+
+
+def test_coalesced_callers_share_the_error(stub):
+    server, base_url = stub
+    with HttpTransport(cache_dir=None) as transport:
+        errors = concurrent_gets(transport, base_url + '/missing')
+    assert server.requests == 1
+    assert all(isinstance(error, HttpError) and error.status == 404 for error in errors)
+
+
+def test_different_requests_are_not_coalesced(stub, tmp_path):
+    server, base_url = stub
+    with HttpTransport(cache_dir=str(tmp_path)) as transport:
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            list(pool.map(lambda reporter: transport.get(base_url + PREVIEW_PATH, {
+                'period': 2020, 'reporterCode': reporter, 'flowCode': 'X'}), [36, 156, 842]))
+    assert server.requests == 3
+    assert transport.stats['coalesced'] == 0
+
+
+def test_cached_response_needs_no_request(stub, tmp_path):
+    server, base_url = stub
+    params = {'period': 2020, 'reporterCode': 842, 'flowCode': 'M'}
+    with HttpTransport(cache_dir=str(tmp_path)) as transport:
+        first = transport.get(base_url + PREVIEW_PATH, params)
+        second = transport.get(base_url + PREVIEW_PATH, params)
+    assert server.requests == 1
+    assert (first.source, second.source) == ('network', 'cache')
+    assert first.body == second.body
+
+
+def preview(api, reporter=842):
+    return api.previewFinalData(typeCode='C', freqCode='A', clCode='HS', period=2020, reporterCode=reporter,
+                                cmdCode='TOTAL', flowCode='X', partnerCode=None, partner2Code=None,
+                                customsCode=None, motCode=None, maxRecords=500)
+
+
+def test_error_payload_is_not_cached(stub, tmp_path):
+    server, base_url = stub
+    server.preview_errors = 1
+    with HttpTransport(cache_dir=str(tmp_path)) as transport:
+        api = ComtradeAPI(transport, base_url)
+        with pytest.raises(ValueError, match='Too many requests'):
+            preview(api)
+        assert len(preview(api)) == 6
+        assert len(preview(api)) == 6
+    assert server.requests == 2
+    assert transport.stats['downloaded'] == 2
+    assert transport.stats['cache_hits'] == 1
+
+
+def test_cached_error_payload_is_evicted_and_fetched_afresh(stub, tmp_path, monkeypatch):
+    server, base_url = stub
+    server.preview_errors = 1
+    with HttpTransport(cache_dir=str(tmp_path), ttl=0) as transport:
+        api = ComtradeAPI(transport, base_url)
+        # An error payload stored by an older version of the transport
+        monkeypatch.setattr(comtrade_api, 'without_error', lambda body: True)
+        with pytest.raises(ValueError):
+            preview(api)
+        monkeypatch.undo()
+        assert len(os.listdir(tmp_path)) == 2
+
+        assert len(preview(api)) == 6
+    # Fetched without If-None-Match, rather than revalidating the error
+    assert transport.stats['revalidated'] == 0
+    assert transport.stats['downloaded'] == 2
+    assert server.requests == 2
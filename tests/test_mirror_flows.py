@@ -0,0 +1,114 @@
+"""Mirror statistics: flows derived from partners' reports and the discrepancies between both sides."""
+
+import pandas as pd
+import pytest
+
+from process_trade_data import (MIRROR_DISCREPANCIES_PATH, MIRROR_DISCREPANCY_COLUMNS, PairTotals,
+                                mirror_flows, process_yearly_data)
+from raw_store import RAW_STORE_DIR, write_partition
+from synthetic_comtrade import copy_data_sources, iter_partitions
+
+YEAR = 2020
+
+
+def flows_frame(rows):
+    """Filtered flows (as from filter_trade_flows) of (reporter, partner, flow code, value) rows."""
+    return pd.DataFrame({
+        'year': YEAR,
+        'reporter_code': [row[0] for row in rows],
+        'reporter': [f"Country {row[0]}" for row in rows],
+        'partner_code': [row[1] for row in rows],
+        'partner': [f"Country {row[1]}" for row in rows],
+        'flow': ['import' if row[2] == 'M' else 'export' for row in rows],
+        'value': [row[3] for row in rows],
+        'flow_code': [row[2] for row in rows],
+    })
+
+
+# Reporter 1 reports both directions, 2 only exports and 3 only imports
+ROWS = [(1, 2, 'X', 50.0), (1, 3, 'X', 30.0), (1, 2, 'M', 10.0), (1, 3, 'M', 40.0),
+        (2, 1, 'X', 8.0), (2, 3, 'X', 6.0),
+        (3, 1, 'M', 33.0), (3, 2, 'M', 5.0)]
+
+
+def pair_totals(*chunks):
+    pairs = PairTotals(YEAR)
+    for chunk in chunks:
+        pairs.update(flows_frame(chunk))
+    return pairs
+
+
+def test_missing_directions_are_mirrored_from_partners():
+    derived, _ = mirror_flows(pair_totals(ROWS))
+    derived = derived.set_index(['reporter_code', 'partner_code', 'flow_code'])
+    # 2's imports are 1's exports to it; 3's exports are 1's imports from it. 2 and 3
+    # each lack the direction the other would need, so their trade is not mirrored
+    assert derived['value'].to_dict() == {(2, 1, 'M'): 50.0, (3, 1, 'X'): 40.0}
+    assert set(derived['flow']) == {'import', 'export'}
+    assert derived.loc[(2, 1, 'M'), ['reporter', 'partner']].tolist() == ['Country 2', 'Country 1']
+
+
+def test_nothing_is_mirrored_when_every_reporter_has_both_directions():
+    rows = [(1, 2, 'X', 5.0), (1, 2, 'M', 4.0), (2, 1, 'X', 3.0), (2, 1, 'M', 2.0)]
+    derived, discrepancies = mirror_flows(pair_totals(rows))
+    assert derived.empty
+    assert len(discrepancies) == 2
+
+
+def test_discrepancies_compare_importer_and_exporter_reports():
+    _, discrepancies = mirror_flows(pair_totals(ROWS))
+    assert discrepancies.columns.tolist() == MIRROR_DISCREPANCY_COLUMNS
+    rows = discrepancies.set_index(['importer_code', 'exporter_code'])
+    assert rows.index.tolist() == [(1, 2), (3, 1), (3, 2)]
+    assert rows.loc[(1, 2), ['import_value', 'export_value', 'difference', 'ratio']].tolist() == \
+        [10.0, 8.0, 2.0, 1.25]
+    assert rows.loc[(3, 1), ['import_value', 'export_value', 'difference']].tolist() == [33.0, 30.0, 3.0]
+    assert rows.loc[(3, 2), ['import_value', 'export_value', 'difference']].tolist() == [5.0, 6.0, -1.0]
+    assert (discrepancies['year'] == YEAR).all()
+
+
+def test_chunks_fold_into_the_same_pairs():
+    # The same pair split across chunks adds up, as a whole-year read would
+    split = [(1, 2, 'X', 20.0), (1, 2, 'X', 30.0)]
+    whole = mirror_flows(pair_totals(ROWS))
+    chunked = mirror_flows(pair_totals(ROWS[2:4], split + ROWS[1:2], ROWS[4:]))
+    for expected, actual in zip(whole, chunked):
+        key = expected.columns[:5].tolist()
+        pd.testing.assert_frame_equal(expected.sort_values(key, ignore_index=True),
+                                      actual.sort_values(key, ignore_index=True), check_like=True)
+
+
+@pytest.fixture
+def processed(tmp_path, monkeypatch):
+    """process_yearly_data over a small raw store in which reporter 8 fetched only exports."""
+    copy_data_sources(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    for (year, reporter, flow), records in iter_partitions([YEAR], [4, 8, 12], [4, 8, 12, 20]):
+        if (reporter, flow) != (8, 'M'):
+            write_partition(year, reporter, flow, records, root=RAW_STORE_DIR)
+    process_yearly_data()
+    return (pd.read_csv(MIRROR_DISCREPANCIES_PATH),
+            pd.read_csv('data/processed/trade_flows_raw.csv', keep_default_na=False))
+
+
+def test_discrepancy_file_matches_the_reported_flows(processed):
+    discrepancies, flows = processed
+    assert discrepancies.columns.tolist() == MIRROR_DISCREPANCY_COLUMNS
+    # Every importer that reported imports, against every reporter that reported exports to it
+    assert list(zip(discrepancies['importer_code'], discrepancies['exporter_code'])) == \
+        [(4, 8), (4, 12), (12, 4), (12, 8)]
+
+    values = flows.set_index(['reporter_code', 'partner_code', 'flow'])['value']
+    for row in discrepancies.itertuples():
+        assert row.import_value == values[(row.importer_code, row.exporter_code, 'import')]
+        assert row.export_value == values[(row.exporter_code, row.importer_code, 'export')]
+        assert row.difference == pytest.approx(row.import_value - row.export_value)
+        assert row.ratio == pytest.approx(row.import_value / row.export_value)
+
+
+def test_mirrored_imports_reach_the_flow_file(processed):
+    _, flows = processed
+    imports = flows[(flows['reporter_code'] == 8) & (flows['flow'] == 'import')]
+    exports = flows[(flows['partner_code'] == 8) & (flows['flow'] == 'export')]
+    assert sorted(zip(imports['partner_code'], imports['value'])) == \
+        sorted(zip(exports['reporter_code'], exports['value']))
@@ -0,0 +1,149 @@
+"""Endpoints, conditional GETs, parameter errors and reload safety of the local query server."""
+
+import gzip
+import http.client
+import json
+import threading
+
+import pandas as pd
+import pytest
+
+from query_server import DATA_FILES, make_server
+
+
+def write_flows(processed_dir, years):
+    rows = [(year, reporter, f"Country {reporter}", partner, f"Country {partner}", flow, value)
+            for year in years
+            for reporter, partner, flow, value in [(1, 2, 'export', 10.0), (1, 3, 'export', 30.0),
+                                                   (1, 4, 'export', 20.0), (1, 2, 'import', 5.0),
+                                                   (2, 1, 'export', 7.5)]]
+    pd.DataFrame(rows, columns=['year', 'reporter_code', 'reporter', 'partner_code', 'partner', 'flow',
+                                'value']).to_csv(processed_dir / DATA_FILES['flows'], index=False)
+
+
+@pytest.fixture
+def processed_dir(tmp_path):
+    write_flows(tmp_path, [2021, 2022])
+    pd.DataFrame({'sector': ['Energy', 'Energy', 'Energy', 'Food'], 'year': [2022, 2022, 2022, 2022],
+                  'reporter': ['A', 'B', 'A', 'A'], 'partner': ['B', 'A', 'A', 'C'],
+                  'value': [5.0, 1.0, 9.0, 2.0]}).to_csv(tmp_path / DATA_FILES['sectors'], index=False)
+    pd.DataFrame({'year': [2021, 2022, 2022], 'country_code': [1, 1, 2],
+                  'exports': [60.0, 60.0, 7.5]}).to_csv(tmp_path / DATA_FILES['yearly'], index=False)
+    return tmp_path
+
+
+@pytest.fixture
+def server(processed_dir):
+    server = make_server(port=0, processed_dir=str(processed_dir), directory=str(processed_dir), quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def get(server, path, headers=None):
+    """(status, headers, body) of one GET."""
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    try:
+        connection.request('GET', path, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+def get_json(server, path):
+    status, _, body = get(server, path)
+    assert status == 200, body
+    return json.loads(body)
+
+
+def test_years_and_filtered_flows(server):
+    assert get_json(server, '/api/years') == [2021, 2022]
+    flows = get_json(server, '/api/flows?year=2021&reporter=1&flow=export')
+    assert [(row['year'], row['partner_code']) for row in flows] == [(2021, 2), (2021, 3), (2021, 4)]
+    assert len(get_json(server, '/api/flows?year=latest&partner=1')) == 1
+
+
+def test_top_partners(server):
+    top = get_json(server, '/api/top-partners?reporter=1&n=2')
+    assert (top['year'], top['flow'], top['total']) == (2022, 'export', 60.0)
+    assert [row['partner_code'] for row in top['partners']] == [3, 4]
+    assert [row['share'] for row in top['partners']] == pytest.approx([0.5, 20.0 / 60.0])
+
+
+def test_sector_graph_drops_self_links_and_small_values(server):
+    assert get_json(server, '/api/sectors') == ['Energy', 'Food']
+    graph = get_json(server, '/api/sector-graph?sector=Energy&min_value=2')
+    assert graph['year'] == 2022
+    assert graph['links'] == [{'source': 'A', 'target': 'B', 'value': 5.0}]
+    assert [node['id'] for node in graph['nodes']] == ['A', 'B']
+
+
+def test_yearly_filters_and_missing_file(server):
+    assert [row['exports'] for row in get_json(server, '/api/yearly?year=2022&country=2')] == [7.5]
+    assert get_json(server, '/api/summary') == []
+
+
+def test_etag_answers_304_and_gzip_matches(server):
+    status, headers, body = get(server, '/api/flows')
+    assert status == 200
+    etag = headers['ETag']
+
+    status, headers, empty = get(server, '/api/flows', {'If-None-Match': etag})
+    assert (status, headers['ETag'], empty) == (304, etag, b'')
+
+    status, headers, compressed = get(server, '/api/flows', {'Accept-Encoding': 'gzip'})
+    assert (status, headers['Content-Encoding'], headers['ETag']) == (200, 'gzip', etag)
+    assert gzip.decompress(compressed) == body
+
+
+@pytest.mark.parametrize('path', [
+    '/api/flows?year=abc',
+    '/api/flows?reporter=1.5',
+    '/api/top-partners',
+    '/api/top-partners?reporter=1,2',
+    '/api/top-partners?reporter=1&n=x',
+    '/api/top-partners?reporter=1&year=2021,2022',
+    '/api/sector-graph',
+    '/api/sector-graph?sector=Energy&min_value=lots',
+])
+def test_bad_parameters_answer_400(server, path):
+    status, headers, body = get(server, path)
+    assert status == 400
+    assert headers['Content-Type'] == 'application/json'
+    assert json.loads(body)['error']
+
+
+def test_unknown_endpoint_answers_404(server):
+    status, _, body = get(server, '/api/nothing')
+    assert status == 404
+    assert 'error' in json.loads(body)
+
+
+def test_changed_files_are_served_after_reload(server, processed_dir):
+    assert get_json(server, '/api/years') == [2021, 2022]
+    write_flows(processed_dir, [2021, 2022, 2023])
+    assert get_json(server, '/api/years') == [2021, 2022, 2023]
+
+
+def test_reload_during_a_query_does_not_cache_the_stale_payload(server, processed_dir):
+    handler = server.RequestHandlerClass.keywords
+    queries, cache = handler['queries'], handler['cache']
+    years = queries.years
+
+    def years_then_reload(params):
+        # Computed from the old data, then another request reloads before the payload is cached
+        payload = years(params)
+        write_flows(processed_dir, [2021, 2022, 2023])
+        assert queries.reload_if_changed()
+        cache.clear()
+        return payload
+
+    queries.years = years_then_reload
+    assert get_json(server, '/api/years') == [2021, 2022]
+    queries.years = years
+    assert get_json(server, '/api/years') == [2021, 2022, 2023]
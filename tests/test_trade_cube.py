@@ -0,0 +1,40 @@
+"""Building trade cubes from rows, whole or in chunks."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from trade_cube import AXIS_NAMES, TRADE_CUBE_AXES, TradeCube
+
+
+@pytest.fixture
+def flows():
+    rng = np.random.default_rng(0)
+    n = 500
+    reporter = rng.integers(1, 8, n)
+    partner = rng.integers(1, 12, n)
+    return pd.DataFrame({'year': rng.integers(2018, 2023, n), 'reporter_code': reporter,
+                         'reporter': [f"Country {code}" for code in reporter], 'partner_code': partner,
+                         'partner': [f"Country {code}" for code in partner],
+                         'flow': rng.choice(['export', 'import'], n), 'value': rng.uniform(1, 1e9, n)})
+
+
+def test_cells_sum_repeated_rows(flows):
+    cube = TradeCube.from_frame(flows, TRADE_CUBE_AXES, names=AXIS_NAMES)
+    expected = flows.groupby(['year', 'reporter_code', 'partner_code', 'flow'])['value'].sum()
+    for (year, reporter, partner, flow), value in expected.items():
+        assert cube.get(year=year, reporter=reporter, partner=partner, flow=flow) == pytest.approx(value)
+    assert cube.values.sum() == pytest.approx(flows['value'].sum())
+    assert cube.names['reporter'].tolist() == [f"Country {code}" for code in cube.labels['reporter']]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 499, 1000])
+def test_chunks_match_the_whole_frame(flows, chunk_size):
+    whole = TradeCube.from_frame(flows, TRADE_CUBE_AXES, names=AXIS_NAMES)
+    chunked = TradeCube.from_chunks(lambda: (flows.iloc[i:i + chunk_size] for i in range(0, len(flows), chunk_size)),
+                                    TRADE_CUBE_AXES, names=AXIS_NAMES)
+    assert np.array_equal(chunked.values, whole.values)
+    for axis in whole.axes:
+        assert chunked.labels[axis].tolist() == whole.labels[axis].tolist()
+    assert {axis: names.tolist() for axis, names in chunked.names.items()} == \
+        {axis: names.tolist() for axis, names in whole.names.items()}
@@ -0,0 +1,87 @@
+"""Indicator formulas: concentration (HHI), openness and balance against GDP, and partner shares."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from trade_cube import AXIS_NAMES, TRADE_CUBE_AXES, TradeCube
+from trade_indicators import TOP_PARTNERS, compute_indicators, concentration, indicator_frames, load_gdp
+
+
+def test_concentration_is_the_sum_of_squared_shares():
+    values = np.array([[50.0, 30.0, 20.0], [10.0, 0.0, 0.0], [1.0, 1.0, 1.0], [0.0, 0.0, 0.0]])
+    hhi = concentration(values)
+    assert hhi[:3] == pytest.approx([0.25 + 0.09 + 0.04, 1.0, 1 / 3])
+    # No trade, no concentration
+    assert np.isnan(hhi[3])
+
+
+def test_openness_balance_and_export_ratio():
+    exports = np.array([[60.0, 40.0], [0.0, 0.0]])
+    imports = np.array([[30.0, 20.0], [0.0, 0.0]])
+    gdp = np.array([500.0, np.nan])
+    indicators = compute_indicators(exports, imports, gdp)
+    assert indicators['exports'][0] == 100.0 and indicators['imports'][0] == 50.0
+    assert indicators['trade_openness'][0] == pytest.approx(150 / 500 * 100)
+    assert indicators['trade_balance'][0] == 50.0
+    assert indicators['trade_balance_ratio'][0] == pytest.approx(50 / 500 * 100)
+    assert indicators['export_ratio'][0] == pytest.approx(100 / 150 * 100)
+    assert indicators['export_concentration'][0] == pytest.approx(0.6 ** 2 + 0.4 ** 2)
+    # Unknown GDP leaves the GDP ratios undefined, not zero
+    assert np.isnan(indicators['trade_openness'][1]) and np.isnan(indicators['trade_balance_ratio'][1])
+
+
+def test_top_partner_shares():
+    trade = np.arange(1.0, TOP_PARTNERS + 3)
+    indicators = compute_indicators(trade[None, :], np.zeros((1, len(trade))), np.array([1.0]))
+    assert indicators['top_partner'][0] == len(trade) - 1
+    assert indicators['top_partner_share'][0] == pytest.approx(trade[-1] / trade.sum() * 100)
+    assert indicators['top_partners_share'][0] == pytest.approx(trade[-TOP_PARTNERS:].sum() / trade.sum() * 100)
+    # Ties go to the lower partner position
+    tied = compute_indicators(np.array([[5.0, 5.0]]), np.zeros((1, 2)), np.array([1.0]))
+    assert tied['top_partner'][0] == 0
+
+
+def test_gdp_fills_from_the_nearest_reference_year_and_records_it(tmp_path):
+    path = tmp_path / 'gdp.csv'
+    pd.DataFrame({'country_code': [1, 1, 2], 'year': [2018, 2020, 2020],
+                  'gdp_usd': [100.0, 200.0, 50.0]}).to_csv(path, index=False)
+    gdp, gdp_years = load_gdp([2017, 2018, 2019, 2020, 2021], [1, 2, 3], path)
+    np.testing.assert_array_equal(gdp[:, 0], [100.0, 100.0, 100.0, 200.0, 200.0])
+    np.testing.assert_array_equal(gdp_years[:, 0], [2018, 2018, 2018, 2020, 2020])
+    np.testing.assert_array_equal(gdp[:, 1], [50.0] * 5)
+    np.testing.assert_array_equal(gdp_years[:, 1], [2020] * 5)
+    assert np.isnan(gdp[:, 2]).all() and np.isnan(gdp_years[:, 2]).all()
+    assert all(np.isnan(values).all() for values in load_gdp([2020], [1], tmp_path / 'missing.csv'))
+
+
+def test_indicator_tables_over_a_cube(tmp_path):
+    flows = pd.DataFrame({
+        'year': [2020, 2020, 2020, 2021, 2021],
+        'reporter_code': [1, 1, 1, 1, 2],
+        'reporter': ['A', 'A', 'A', 'A', 'B'],
+        'partner_code': [2, 3, 2, 2, 1],
+        'partner': ['B', 'C', 'B', 'B', 'A'],
+        'flow': ['export', 'export', 'import', 'export', 'import'],
+        'value': [30.0, 10.0, 20.0, 40.0, 5.0],
+    })
+    gdp_path = tmp_path / 'gdp.csv'
+    pd.DataFrame({'country_code': [1, 1], 'year': [2020, 2021], 'gdp_usd': [600.0, 400.0]}).to_csv(gdp_path,
+                                                                                                  index=False)
+    history, summary = indicator_frames(TradeCube.from_frame(flows, TRADE_CUBE_AXES, names=AXIS_NAMES), gdp_path)
+
+    rows = history.set_index(['year', 'country_code'])
+    assert rows.index.tolist() == [(2020, 1), (2021, 1), (2021, 2)]
+    assert rows.loc[(2020, 1), 'trade_openness'] == pytest.approx(60 / 600 * 100)
+    assert rows.loc[(2020, 1), 'export_concentration'] == pytest.approx(0.75 ** 2 + 0.25 ** 2)
+    assert rows.loc[(2020, 1), 'top_partner_code'] == 2
+    assert rows.loc[(2021, 1), 'trade_balance_ratio'] == pytest.approx(40 / 400 * 100)
+    assert np.isnan(rows.loc[(2021, 2), 'trade_openness'])
+    assert rows['gdp_year'].tolist() == [2020, 2021, pd.NA]
+
+    # Over all years, GDP is summed over the years the reporter traded in
+    overall = summary.set_index('country_code')
+    assert overall.loc[1, 'country'] == 'A'
+    assert overall.loc[1, 'gdp'] == 1000.0
+    assert overall.loc[1, 'trade_openness'] == pytest.approx(100 / 1000 * 100)
+    assert overall.loc[1, 'export_ratio'] == pytest.approx(80 / 100 * 100)
@@ -0,0 +1,98 @@
+"""Slices and top-N queries of the SQLite trade store against the same queries in pandas."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from trade_store import TradeStore, build_store, open_store
+
+# TradeStore.flows filter -> trade_flows_raw.csv column
+FILTER_COLUMNS = {'year': 'year', 'reporter': 'reporter_code', 'partner': 'partner_code', 'flow': 'flow'}
+
+
+@pytest.fixture
+def flows(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 400
+    reporter = rng.integers(1, 6, n)
+    partner = rng.integers(1, 9, n)
+    frame = pd.DataFrame({'year': rng.integers(2019, 2023, n), 'reporter_code': reporter,
+                          'reporter': [f"Country {code}" for code in reporter], 'partner_code': partner,
+                          'partner': [f"Country {code}" for code in partner],
+                          'flow': rng.choice(['export', 'import'], n), 'value': rng.uniform(1, 1e9, n)})
+    frame.to_csv(tmp_path / 'trade_flows_raw.csv', index=False)
+    return frame
+
+
+@pytest.fixture
+def store(tmp_path, flows):
+    build_store(str(tmp_path / 'trade_flows_raw.csv'), None, str(tmp_path / 'trade_flows.sqlite'))
+    with TradeStore(str(tmp_path / 'trade_flows.sqlite')) as store:
+        yield store
+
+
+def test_years_and_latest_year(store, flows):
+    assert store.years() == sorted(flows['year'].unique())
+    assert store.latest_year() == flows['year'].max()
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'year': 2021},
+    {'year': 2020, 'reporter': 3},
+    {'partner': [2, 5], 'flow': 'import'},
+    {'year': np.int64(2022), 'reporter': np.array([1, 4]), 'flow': 'export'},
+])
+def test_flow_slices_keep_csv_rows_and_order(store, flows, filters):
+    mask = np.ones(len(flows), dtype=bool)
+    for name, value in filters.items():
+        mask &= flows[FILTER_COLUMNS[name]].isin(np.atleast_1d(value)).to_numpy()
+    expected = flows[mask].reset_index(drop=True)
+    # Values come back bit for bit
+    pd.testing.assert_frame_equal(store.flows(**filters), expected, check_dtype=False, check_exact=True)
+
+
+def test_top_partners_sums_repeated_pairs_and_reports_shares(store, flows):
+    year = flows['year'].max()
+    rows = flows[(flows['year'] == year) & (flows['reporter_code'] == 2) & (flows['flow'] == 'export')]
+    by_partner = rows.groupby('partner_code')['value'].sum().sort_values(ascending=False)
+
+    top = store.top_partners(2, n=3)
+    assert top['partner_code'].tolist() == by_partner.index[:3].tolist()
+    assert top['value'].to_numpy() == pytest.approx(by_partner.to_numpy()[:3])
+    assert top['share'].to_numpy() == pytest.approx(by_partner.to_numpy()[:3] / rows['value'].sum())
+    assert top['partner'].tolist() == [f"Country {code}" for code in top['partner_code']]
+
+
+def test_top_partners_of_a_reporter_without_flows(store):
+    top = store.top_partners(99, year=2020)
+    assert top.empty
+    assert 'share' in top
+
+
+def test_top_flows(store, flows):
+    rows = flows[(flows['year'] == 2020) & (flows['flow'] == 'import')]
+    expected = rows.nlargest(5, 'value')
+    top = store.top_flows(year=2020, flow='import', n=5)
+    assert top['value'].tolist() == expected['value'].tolist()
+    assert list(zip(top['reporter_code'], top['partner_code'])) == \
+        list(zip(expected['reporter_code'], expected['partner_code']))
+
+
+def test_totals(store, flows):
+    totals = store.totals(year=2021)
+    rows = flows[flows['year'] == 2021]
+    exports = rows[rows['flow'] == 'export'].groupby('reporter_code')['value'].sum()
+    assert totals['reporter_code'].tolist() == sorted(rows['reporter_code'].unique())
+    assert totals.set_index('reporter_code')['exports'].to_numpy() == \
+        pytest.approx(exports.reindex(totals['reporter_code'], fill_value=0).to_numpy())
+
+
+def test_open_store_rejects_a_store_of_other_flows(tmp_path, store, flows):
+    flows_path = str(tmp_path / 'trade_flows_raw.csv')
+    path = str(tmp_path / 'trade_flows.sqlite')
+    current = open_store(path, flows_path)
+    assert current is not None
+    current.close()
+    flows.head(10).to_csv(flows_path, index=False)
+    assert open_store(path, flows_path) is None
@@ -0,0 +1,405 @@
+// Decoder for the compact binary data bundle written by frontend_bundle.py
+// Numeric columns are typed-array views over the downloaded buffer; rows are
+// only turned into objects for the charts that take arrays of records.
+
+const TRADE_BUNDLE_MAGIC = 'TRDB';
+const TRADE_BUNDLE_VERSION = 1;
+
+// Bundle dtypes are little-endian, which matches every browser platform
+const TRADE_BUNDLE_DTYPES = {
+    f8: Float64Array,
+    f4: Float32Array,
+    i4: Int32Array,
+    i2: Int16Array,
+    u2: Uint16Array,
+    u1: Uint8Array,
+    u4: Uint32Array
+};
+
+// Fetch the bundle, preferring the gzip copy when the browser can inflate it
+async function fetchTradeBundle(url) {
+    if (typeof DecompressionStream !== 'undefined') {
+        const response = await fetch(url + '.gz');
+        if (response.ok) {
+            const buffer = await response.arrayBuffer();
+            const head = new Uint8Array(buffer, 0, 2);
+            // Servers that send .gz files with Content-Encoding: gzip hand back the inflated bundle
+            if (head[0] !== 0x1f || head[1] !== 0x8b) {
+                return buffer;
+            }
+            const stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream('gzip'));
+            return new Response(stream).arrayBuffer();
+        }
+    }
+
+    const response = await fetch(url);
+    if (!response.ok) {
+        throw new Error(`Failed to load ${url}: ${response.status} ${response.statusText}`);
+    }
+    return response.arrayBuffer();
+}
+
+// Parse the header and create typed-array views for every column and array
+function decodeTradeBundle(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== TRADE_BUNDLE_MAGIC) {
+        throw new Error('Not a trade data bundle');
+    }
+    const version = view.getUint32(4, true);
+    if (version !== TRADE_BUNDLE_VERSION) {
+        throw new Error(`Unsupported trade bundle version ${version}`);
+    }
+
+    const headerLength = view.getUint32(8, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 12, headerLength)));
+    const bodyStart = 12 + headerLength;
+
+    function typedView(meta, length) {
+        return new TRADE_BUNDLE_DTYPES[meta.dtype](buffer, bodyStart + meta.offset, length);
+    }
+
+    const tables = {};
+    Object.entries(header.tables).forEach(([name, table]) => {
+        tables[name] = {
+            rows: table.rows,
+            columns: table.columns.map(meta => ({
+                name: meta.name,
+                strings: meta.strings,
+                values: typedView(meta, table.rows)
+            }))
+        };
+    });
+
+    const arrays = {};
+    Object.entries(header.arrays).forEach(([name, meta]) => {
+        arrays[name] = {
+            shape: meta.shape,
+            strings: meta.strings,
+            values: typedView(meta, meta.shape.reduce((a, b) => a * b, 1))
+        };
+    });
+
+    return {strings: header.strings, tables: tables, arrays: arrays, cubes: header.cubes || {}};
+}
+
+// Materialize a table as an array of row objects, decoding string columns
+function bundleRows(bundle, name) {
+    const table = bundle.tables[name];
+    const rows = new Array(table.rows);
+    for (let i = 0; i < table.rows; i++) {
+        const row = {};
+        table.columns.forEach(column => {
+            row[column.name] = column.strings ? bundle.strings[column.values[i]] : column.values[i];
+        });
+        rows[i] = row;
+    }
+    return rows;
+}
+
+// A 1-d array as plain values, or a 2-d array as a list of row views
+function bundleArray(bundle, name) {
+    const array = bundle.arrays[name];
+    if (array.strings) {
+        return Array.from(array.values, id => bundle.strings[id]);
+    }
+    if (array.shape.length === 2) {
+        const [rows, cols] = array.shape;
+        return Array.from({length: rows}, (_, i) => array.values.subarray(i * cols, (i + 1) * cols));
+    }
+    return array.values;
+}
+
+// Dense cube of values over labelled axes (see trade_cube.py). Labels are
+// mapped to integer positions once, so slices and cells are read by offset
+// instead of scanning rows.
+class TradeCube {
+    constructor(axes, labels, values, names, positions) {
+        this.axes = axes;
+        this.labels = labels;
+        this.names = names || {};
+        this.values = values;
+        this.shape = axes.map(axis => labels[axis].length);
+        this.strides = this.shape.map((_, i) => this.shape.slice(i + 1).reduce((a, b) => a * b, 1));
+        // Label -> position maps, shared with slices of this cube
+        this.positions = positions || {};
+    }
+
+    // Position of a label on an axis, or -1
+    indexOf(axis, label) {
+        if (!this.positions[axis]) {
+            this.positions[axis] = new Map(Array.from(this.labels[axis], (value, i) => [value, i]));
+        }
+        const position = this.positions[axis].get(label);
+        return position === undefined ? -1 : position;
+    }
+
+    // Value at integer positions, one per axis
+    at(...indices) {
+        return this.values[indices.reduce((offset, index, i) => offset + index * this.strides[i], 0)];
+    }
+
+    // Sub-cube with some axes fixed to a label, e.g. slice({year: 2022}).
+    // Fixing leading axes returns a view; otherwise only the slice is copied.
+    slice(selectors) {
+        let offset = 0;
+        const kept = [];
+        this.axes.forEach((axis, i) => {
+            if (!(axis in selectors)) {
+                kept.push(i);
+                return;
+            }
+            const position = this.indexOf(axis, selectors[axis]);
+            if (position < 0) {
+                throw new Error(`${selectors[axis]} is not on the ${axis} axis`);
+            }
+            offset += position * this.strides[i];
+        });
+
+        const shape = kept.map(i => this.shape[i]);
+        const size = shape.reduce((a, b) => a * b, 1);
+        let values;
+        if (kept.every((axis, k) => axis === this.axes.length - kept.length + k)) {
+            values = this.values.subarray(offset, offset + size);
+        } else {
+            values = new this.values.constructor(size);
+            for (let j = 0; j < size; j++) {
+                let rest = j;
+                let source = offset;
+                for (let k = kept.length - 1; k >= 0; k--) {
+                    source += (rest % shape[k]) * this.strides[kept[k]];
+                    rest = Math.floor(rest / shape[k]);
+                }
+                values[j] = this.values[source];
+            }
+        }
+        return new TradeCube(kept.map(i => this.axes[i]), this.labels, values, this.names, this.positions);
+    }
+
+    // Cube with one axis summed out
+    sum(axis) {
+        const i = this.axes.indexOf(axis);
+        const length = this.shape[i];
+        const inner = this.strides[i];
+        const outer = this.values.length / (length * inner);
+        const values = new Float64Array(outer * inner);
+        for (let o = 0; o < outer; o++) {
+            for (let j = 0; j < length; j++) {
+                const start = (o * length + j) * inner;
+                for (let k = 0; k < inner; k++) {
+                    values[o * inner + k] += this.values[start + k];
+                }
+            }
+        }
+        return new TradeCube(this.axes.filter(a => a !== axis), this.labels, values, this.names, this.positions);
+    }
+
+    // Non-zero cells as row objects keyed by axis (display names where the axis has them) plus value
+    cells() {
+        const rows = [];
+        for (let j = 0; j < this.values.length; j++) {
+            if (!this.values[j]) continue;
+            const row = {};
+            this.axes.forEach((axis, i) => {
+                const index = Math.floor(j / this.strides[i]) % this.shape[i];
+                row[axis] = (this.names[axis] || this.labels[axis])[index];
+            });
+            row.value = this.values[j];
+            rows.push(row);
+        }
+        return rows;
+    }
+}
+
+// A cube stored in the bundle, or null if the bundle has none by that name
+function bundleCube(bundle, name) {
+    const cube = bundle.cubes[name];
+    if (!cube) {
+        return null;
+    }
+    const labels = {};
+    const names = {};
+    cube.axes.forEach(axis => {
+        labels[axis] = bundleArray(bundle, `${name}.${axis}`);
+    });
+    cube.names.forEach(axis => {
+        names[axis] = bundleArray(bundle, `${name}.${axis}_names`);
+    });
+    return new TradeCube(cube.axes, labels, bundle.arrays[name].values, names);
+}
+
+// Group sector layout rows as {sector: {country: [x, y]}}
+function sectorLayouts(rows) {
+    const layouts = {};
+    rows.forEach(row => {
+        (layouts[row.sector] = layouts[row.sector] || {})[row.country] = [row.layout_x, row.layout_y];
+    });
+    return layouts;
+}
+
+// Lookups over the compiled country index. Rows come in preference order,
+// so an ISO code or name shared by several codes (e.g. 842 "USA" and 841
+// "USA and Puerto Rico (...1980)") resolves to the first. `regionNames`
+// lists the regions in reference order, 'Other' last.
+class CountryIndex {
+    constructor(rows, regionNames) {
+        this.rows = rows;
+        this.regionNames = regionNames || ['Other'];
+        this.byCode = new Map();
+        this.byKey = new Map();
+        rows.forEach(row => {
+            this.byCode.set(row.code, row);
+            [row.iso3, row.iso2, row.name].forEach(key => {
+                if (key && !this.byKey.has(key)) this.byKey.set(key, row);
+            });
+        });
+    }
+
+    // Row of a numeric code, an ISO2 or ISO3 code, or a name
+    get(key) {
+        return typeof key === 'number' ? this.byCode.get(key) : this.byKey.get(key);
+    }
+
+    region(key) {
+        const row = this.get(key);
+        return row ? row.region : 'Other';
+    }
+}
+
+// Summary indicator columns (computed at build time) -> the fields the charts read
+const SUMMARY_INDICATORS = {
+    trade_openness: 'tradeOpenness',
+    export_ratio: 'exportRatio',
+    trade_balance_ratio: 'tradeBalanceRatio',
+    export_concentration: 'exportConcentration',
+    import_concentration: 'importConcentration'
+};
+
+// Summary rows (already ordered by total trade) with their indicators under
+// the chart field names; NaN indicators are left off
+function indicatorRows(rows) {
+    rows.forEach(row => {
+        Object.entries(SUMMARY_INDICATORS).forEach(([column, field]) => {
+            if (!(column in row)) return;
+            if (!Number.isNaN(row[column])) row[field] = row[column];
+            delete row[column];
+        });
+        row.tradeBalance = row.exports - row.imports;
+    });
+    return rows;
+}
+
+// Aggregates computed once per load (in the data worker when there is one):
+// yearly reporter totals summed over partners
+function bundleAggregates(bundle) {
+    const tradeCube = bundleCube(bundle, 'trade_cube');
+    return {
+        tradeTotals: tradeCube ? tradeCube.sum('partner').values : null
+    };
+}
+
+// ArrayBuffers behind the typed arrays of an aggregates object, for postMessage transfer lists
+function aggregateBuffers(aggregates) {
+    const buffers = [];
+    Object.values(aggregates).forEach(value => {
+        if (ArrayBuffer.isView(value)) {
+            buffers.push(value.buffer);
+        } else if (value && typeof value === 'object') {
+            buffers.push(...aggregateBuffers(value));
+        }
+    });
+    return buffers;
+}
+
+// The datasets in the shape the charts expect. Each one is only materialized
+// the first time a chart reads it, so tabs that are never opened cost nothing.
+function tradeDatasets(bundle, aggregates) {
+    aggregates = aggregates || bundleAggregates(bundle);
+    const datasets = {};
+    const lazy = (name, build) => Object.defineProperty(datasets, name, {
+        configurable: true,
+        enumerable: true,
+        get() {
+            const value = build();
+            Object.defineProperty(datasets, name, {value: value, enumerable: true});
+            return value;
+        }
+    });
+
+    lazy('tradeFlowsData', () => bundleRows(bundle, 'flows'));
+    lazy('tradeSummaryData', () => indicatorRows(bundleRows(bundle, 'summary')));
+    lazy('tradeMatrixData', () => ({
+        countries: bundleArray(bundle, 'matrix_countries'),
+        matrix: bundleArray(bundle, 'matrix')
+    }));
+    lazy('tradeNetworkData', () => ({
+        nodes: bundleRows(bundle, 'network_nodes'),
+        links: bundleRows(bundle, 'network_links')
+    }));
+    lazy('yearlyTradeData', () => bundleRows(bundle, 'yearly'));
+    // Per-year indicators of each country, computed at build time
+    lazy('indicatorHistory', () => bundle.tables.indicators ? bundleRows(bundle, 'indicators') : []);
+    lazy('sectorTradeData', () => bundleRows(bundle, 'sectors'));
+    lazy('sectorLayoutData', () => sectorLayouts(bundleRows(bundle, 'sector_layout')));
+    lazy('countryData', () => bundle.tables.countries ? bundleRows(bundle, 'countries') : []);
+    lazy('countryIndex', () => new CountryIndex(datasets.countryData,
+        bundle.arrays.country_regions ? bundleArray(bundle, 'country_regions') : null));
+    lazy('tradeCube', () => bundleCube(bundle, 'trade_cube'));
+    lazy('sectorCube', () => bundleCube(bundle, 'sector_cube'));
+    // [year x reporter x flow] totals of the trade cube
+    lazy('tradeTotals', () => {
+        const cube = datasets.tradeCube;
+        if (!cube || !aggregates.tradeTotals) return null;
+        return new TradeCube(cube.axes.filter(axis => axis !== 'partner'), cube.labels,
+                             aggregates.tradeTotals, cube.names, cube.positions);
+    });
+    return datasets;
+}
+
+// Load the bundle on the main thread
+async function loadTradeBundle(url) {
+    return tradeDatasets(decodeTradeBundle(await fetchTradeBundle(url)));
+}
+
+// Client for data_worker.js: the worker fetches, inflates and aggregates the
+// bundle and transfers the buffers back, so the page only decodes the header
+class TradeDataWorker {
+    constructor(workerUrl) {
+        this.worker = new Worker(workerUrl);
+        this.pending = new Map();
+        this.nextId = 0;
+        this.worker.onmessage = event => {
+            const {id, error} = event.data;
+            const request = this.pending.get(id);
+            this.pending.delete(id);
+            if (error) {
+                request.reject(new Error(error));
+            } else {
+                request.resolve(event.data);
+            }
+        };
+        this.worker.onerror = event => {
+            this.pending.forEach(request => request.reject(new Error(event.message || 'Data worker failed')));
+            this.pending.clear();
+        };
+    }
+
+    request(message) {
+        const id = this.nextId++;
+        return new Promise((resolve, reject) => {
+            this.pending.set(id, {resolve, reject});
+            this.worker.postMessage(Object.assign({id: id}, message));
+        });
+    }
+
+    // Datasets of the bundle at `url`, as returned by loadTradeBundle
+    async loadBundle(url) {
+        const {buffer, aggregates} = await this.request({type: 'bundle', url: url});
+        return tradeDatasets(decodeTradeBundle(buffer), aggregates);
+    }
+
+    // A JSON document fetched and parsed in the worker
+    async json(url) {
+        return (await this.request({type: 'json', url: url})).data;
+    }
+}
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Dense, year-indexed cubes of trade values.
+Flows are stored as one contiguous array indexed by integer positions along
+[year x reporter x partner x flow] (and [sector x year x reporter x partner]
+for the sector data), so a year, country or flow slice is an array view
+instead of a scan over every row.
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from build_cache import BuildCache, code_version, stage_key
+
+PROCESSED_DIR = 'data/processed'
+TRADE_CUBE_PATH = os.path.join(PROCESSED_DIR, 'trade_cube.npz')
+SECTOR_CUBE_PATH = os.path.join(PROCESSED_DIR, 'sector_cube.npz')
+
+# Cube axis -> source column, and the column holding display names for an axis
+TRADE_CUBE_AXES = {'year': 'year', 'reporter': 'reporter_code', 'partner': 'partner_code', 'flow': 'flow'}
+SECTOR_CUBE_AXES = {'sector': 'sector', 'year': 'year', 'reporter': 'reporter_code', 'partner': 'partner_code'}
+AXIS_NAMES = {'reporter': 'reporter', 'partner': 'partner'}
+
+# Rows of a processed CSV read at a time when building a cube
+CSV_CHUNK_SIZE = 500000
+
+
+class TradeCube:
+    """Dense n-dimensional value array with labelled axes."""
+
+    def __init__(self, axes, labels, values, names=None):
+        self.axes = list(axes)
+        self.labels = {axis: np.asarray(labels[axis]) for axis in self.axes}
+        self.names = {axis: np.asarray(axis_names) for axis, axis_names in (names or {}).items()
+                      if axis in self.axes}
+        self.values = values
+        self._positions = {}
+
+    @classmethod
+    def from_frame(cls, frame, axes, value='value', names=None):
+        """
+        Build a cube from rows. `axes` maps each axis to its column; labels
+        are the sorted unique column values. `names` maps axes to a column of
+        display names (the first name seen for each label). Repeated cells are summed.
+        """
+        return cls.from_chunks(lambda: iter([frame]), axes, value, names)
+
+    @classmethod
+    def from_chunks(cls, chunks, axes, value='value', names=None):
+        """
+        Build a cube as `from_frame` does from rows that arrive in chunks,
+        holding one chunk at a time. `chunks()` returns a fresh iterator of
+        DataFrames; it is read twice, for the labels and then the values.
+        Cells are summed in row order, so the result matches `from_frame`
+        on the concatenated rows exactly.
+        """
+        seen = {axis: [] for axis in axes}
+        first_names = {axis: {} for axis in (names or {})}
+        for frame in chunks():
+            for axis, column in axes.items():
+                seen[axis].append(pd.unique(frame[column].to_numpy()))
+            for axis, name_column in (names or {}).items():
+                first = frame.drop_duplicates(axes[axis])
+                for label, name in zip(first[axes[axis]].tolist(), first[name_column].tolist()):
+                    first_names[axis].setdefault(label, name)
+        labels = {axis: np.unique(np.concatenate(parts)) if parts else np.array([], dtype=np.int64)
+                  for axis, parts in seen.items()}
+
+        values = np.zeros(tuple(len(labels[axis]) for axis in axes))
+        for frame in chunks():
+            indices = tuple(np.searchsorted(labels[axis], frame[column].to_numpy()) for axis, column in axes.items())
+            # np.add.at is unbuffered, so repeated cells accumulate in row order
+            np.add.at(values, indices, frame[value].to_numpy(dtype=float))
+
+        axis_names = {axis: np.array([first_names[axis][label] for label in labels[axis].tolist()], dtype=object)
+                      for axis in first_names}
+        return cls(axes, labels, values, axis_names)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def index(self, axis, label):
+        """Position of `label` along `axis`, or -1 if it is not there."""
+        if axis not in self._positions:
+            self._positions[axis] = {label: i for i, label in enumerate(self.labels[axis].tolist())}
+        return self._positions[axis].get(label, -1)
+
+    def slice(self, **selectors):
+        """
+        Sub-cube with the given axes fixed to a label, e.g. slice(year=2022).
+        The result is a view of this cube's array; missing labels raise KeyError.
+        """
+        key = []
+        for axis in self.axes:
+            if axis in selectors:
+                position = self.index(axis, selectors[axis])
+                if position < 0:
+                    raise KeyError(f"{selectors[axis]!r} is not on the {axis} axis")
+                key.append(position)
+            else:
+                key.append(slice(None))
+        axes = [axis for axis in self.axes if axis not in selectors]
+        return TradeCube(axes, self.labels, self.values[tuple(key)], self.names)
+
+    def get(self, **selectors):
+        """Value of one cell, with every axis fixed; 0 for labels not in the cube."""
+        try:
+            return float(self.slice(**selectors).values)
+        except KeyError:
+            return 0.0
+
+    def sum(self, *axes):
+        """Cube with the given axes summed out."""
+        positions = tuple(self.axes.index(axis) for axis in axes)
+        remaining = [axis for axis in self.axes if axis not in axes]
+        return TradeCube(remaining, self.labels, self.values.sum(axis=positions), self.names)
+
+    def to_frame(self):
+        """Non-zero cells as rows of axis labels and a `value` column."""
+        cells = np.nonzero(self.values)
+        frame = pd.DataFrame({axis: self.labels[axis][index] for axis, index in zip(self.axes, cells)})
+        frame['value'] = self.values[cells]
+        return frame
+
+    def save(self, path):
+        """Save as a compressed .npz archive."""
+        arrays = {'values': self.values, 'axes': np.array(self.axes)}
+        for axis in self.axes:
+            labels = self.labels[axis]
+            arrays[f'{axis}_labels'] = labels.astype(str) if labels.dtype == object else labels
+        for axis, axis_names in self.names.items():
+            arrays[f'{axis}_names'] = axis_names.astype(str)
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Load a cube saved with `save`."""
+        with np.load(path) as archive:
+            axes = archive['axes'].tolist()
+            labels = {axis: archive[f'{axis}_labels'] for axis in axes}
+            labels = {axis: values.astype(object) if values.dtype.kind == 'U' else values
+                      for axis, values in labels.items()}
+            names = {axis: archive[f'{axis}_names'].astype(object) for axis in axes
+                     if f'{axis}_names' in archive.files}
+            return cls(axes, labels, archive['values'], names)
+
+
+def write_cubes(processed_dir=PROCESSED_DIR, use_cache=False):
+    """
+    Build the trade and sector cubes from the processed CSVs, read in
+    chunks of CSV_CHUNK_SIZE rows, and save them.
+    With `use_cache` nothing is rebuilt while the CSVs are unchanged.
+    """
+    flows_path = os.path.join(processed_dir, 'trade_flows_raw.csv')
+    sector_path = os.path.join(processed_dir, 'sector_trade_flows.csv')
+    outputs = [os.path.join(processed_dir, os.path.basename(TRADE_CUBE_PATH)),
+               os.path.join(processed_dir, os.path.basename(SECTOR_CUBE_PATH))]
+
+    if use_cache:
+        cache = BuildCache()
+        cube_key = stage_key([flows_path, sector_path], code_version(__name__))
+        if cache.is_fresh('cubes', cube_key):
+            print("Trade cubes are up to date")
+            return outputs
+
+    for path, axes, cube_path in ((flows_path, TRADE_CUBE_AXES, outputs[0]),
+                                  (sector_path, SECTOR_CUBE_AXES, outputs[1])):
+        # Read in chunks, so memory holds the cube but never the whole flow history
+        columns = list(axes.values()) + list(AXIS_NAMES.values()) + ['value']
+        cube = TradeCube.from_chunks(
+            lambda: pd.read_csv(path, usecols=columns, keep_default_na=False, float_precision='round_trip',
+                                chunksize=CSV_CHUNK_SIZE),
+            axes, names=AXIS_NAMES)
+        cube.save(cube_path)
+        print(f"Created {os.path.basename(cube_path)} with shape "
+              f"{' x '.join(f'{len(cube.labels[axis])} {axis}' for axis in cube.axes)}")
+
+    if use_cache:
+        cache.record('cubes', cube_key, outputs)
+    return outputs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the year-indexed trade and sector cubes.")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="rebuild the cubes even if the processed CSVs are unchanged")
+    args = parser.parse_args()
+
+    write_cubes(use_cache=not args.no_cache)
@@ -4,10 +4,8 @@ Script to fetch and process global trade data for visualization.
 Uses publicly available data sources to create a dataset suitable for interactive visualization.
 """
 
-import requests
 import pandas as pd
 import json
-import time
 import os
 from datetime import datetime
 
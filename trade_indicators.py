@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Trade indicators computed at build time.
+Runs over the [year x reporter x partner x flow] trade cube for every year at
+once: export and import concentration (Herfindahl-Hirschman index over
+partners), trade openness and balance relative to GDP, the export ratio and
+the top partners' share of trade. GDP comes from a local reference file;
+the shipped one has 2022 values only, which then stand in for every year.
+Each year's row records the reference year of the GDP it used (gdp_year),
+which the page labels the ratios with.
+Results are written as columns, one row per year and reporter
+(trade_indicators.csv) plus one per reporter over all years
+(summary_indicators.csv), so the browser does no indicator work.
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from build_cache import BuildCache, code_version, stage_key
+from trade_cube import TradeCube
+
+PROCESSED_DIR = 'data/processed'
+GDP_REFERENCE_PATH = 'data_sources/gdp_reference.csv'
+INDICATORS_PATH = os.path.join(PROCESSED_DIR, 'trade_indicators.csv')
+SUMMARY_INDICATORS_PATH = os.path.join(PROCESSED_DIR, 'summary_indicators.csv')
+
+# Partners counted in `top_partners_share`
+TOP_PARTNERS = 5
+
+INDICATOR_COLUMNS = ['exports', 'imports', 'gdp', 'trade_openness', 'export_ratio', 'trade_balance',
+                     'trade_balance_ratio', 'export_concentration', 'import_concentration',
+                     'top_partner_code', 'top_partner_share', 'top_partners_share']
+
+
+def load_gdp(years, reporters, path=GDP_REFERENCE_PATH):
+    """
+    GDP in USD and the reference year it comes from, as [year x reporter]
+    arrays. Years missing from the reference take the nearest earlier year's
+    value (or the nearest later one before the first); reporters without any
+    GDP are NaN in both.
+    """
+    gdp = np.full((len(years), len(reporters)), np.nan)
+    if not os.path.exists(path):
+        return gdp, gdp.copy()
+    reference = pd.read_csv(path)
+    table = reference.pivot_table(index='year', columns='country_code', values='gdp_usd', aggfunc='last')
+    table = table.reindex(index=sorted(set(table.index) | set(int(year) for year in years)))
+    # Filled the same way as the values, so each cell keeps the year its value came from
+    source = pd.DataFrame(np.where(table.notna(), table.index.to_numpy()[:, None], np.nan),
+                          index=table.index, columns=table.columns)
+    index, columns = [int(year) for year in years], [int(code) for code in reporters]
+    return tuple(frame.ffill().bfill().reindex(index=index, columns=columns).to_numpy(dtype=float)
+                 for frame in (table, source))
+
+
+def concentration(values):
+    """Herfindahl-Hirschman index (0-1) over the last axis; NaN where the total is zero."""
+    total = values.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shares = values / total[..., None]
+        return np.where(total > 0, (shares ** 2).sum(axis=-1), np.nan)
+
+
+def compute_indicators(exports, imports, gdp):
+    """
+    Indicators from [..., reporter, partner] export and import arrays and a
+    matching [..., reporter] GDP array. Returns {column: [..., reporter] array}.
+    """
+    export_total = exports.sum(axis=-1)
+    import_total = imports.sum(axis=-1)
+    trade = exports + imports
+    trade_total = export_total + import_total
+    balance = export_total - import_total
+
+    # Partners by descending trade; ties keep the lower partner position
+    ranked = np.argsort(-trade, axis=-1, kind='stable')
+    top = np.take_along_axis(trade, ranked[..., :TOP_PARTNERS], axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'exports': export_total,
+            'imports': import_total,
+            'gdp': gdp,
+            'trade_openness': trade_total / gdp * 100,
+            'export_ratio': export_total / trade_total * 100,
+            'trade_balance': balance,
+            'trade_balance_ratio': balance / gdp * 100,
+            'export_concentration': concentration(exports),
+            'import_concentration': concentration(imports),
+            'top_partner': ranked[..., 0],
+            'top_partner_share': top[..., 0] / trade_total * 100,
+            'top_partners_share': top.sum(axis=-1) / trade_total * 100,
+        }
+
+
+def indicator_frames(cube, gdp_path=GDP_REFERENCE_PATH):
+    """
+    Indicators of every reporter per year and over all years, as DataFrames.
+    Over all years, GDP-relative indicators use the GDP summed over the
+    years the reporter traded in.
+    """
+    flows = list(cube.labels['flow'])
+    exports = cube.values[..., flows.index('export')] if 'export' in flows else np.zeros(cube.shape[:-1])
+    imports = cube.values[..., flows.index('import')] if 'import' in flows else np.zeros(cube.shape[:-1])
+    years = cube.labels['year']
+    reporters = cube.labels['reporter']
+    partners = cube.labels['partner']
+    names = cube.names.get('reporter', reporters.astype(str))
+    gdp, gdp_years = load_gdp(years, reporters, gdp_path)
+
+    traded = (exports.sum(axis=-1) + imports.sum(axis=-1)) > 0
+    total_gdp = np.where(traded, gdp, 0).sum(axis=0)
+    total_gdp[np.isnan(gdp).all(axis=0)] = np.nan
+    yearly = compute_indicators(exports, imports, gdp)
+    overall = compute_indicators(exports.sum(axis=0), imports.sum(axis=0), total_gdp)
+
+    def frame(indicators, keep, index):
+        columns = {name: values[keep] for name, values in indicators.items() if name != 'top_partner'}
+        columns['top_partner_code'] = partners[indicators['top_partner'][keep]]
+        result = pd.DataFrame(index)
+        for column in INDICATOR_COLUMNS:
+            result[column] = columns[column]
+        return result
+
+    year_index, reporter_index = np.nonzero(traded)
+    history = frame(yearly, traded, {'year': years[year_index], 'country_code': reporters[reporter_index],
+                                     'country': names[reporter_index]})
+    history.insert(history.columns.get_loc('gdp') + 1, 'gdp_year', pd.array(gdp_years[traded], dtype='Int64'))
+    any_trade = traded.any(axis=0)
+    summary = frame(overall, any_trade, {'country_code': reporters[any_trade], 'country': names[any_trade]})
+    return history, summary
+
+
+def write_indicators(processed_dir=PROCESSED_DIR, gdp_path=GDP_REFERENCE_PATH, use_cache=False):
+    """
+    Compute the indicators from the trade cube and write both tables.
+    With `use_cache` nothing is rebuilt while the cube and GDP are unchanged.
+    """
+    cube_path = os.path.join(processed_dir, 'trade_cube.npz')
+    outputs = [os.path.join(processed_dir, os.path.basename(INDICATORS_PATH)),
+               os.path.join(processed_dir, os.path.basename(SUMMARY_INDICATORS_PATH))]
+    if use_cache:
+        cache = BuildCache()
+        inputs = [cube_path] + ([gdp_path] if os.path.exists(gdp_path) else [])
+        indicators_key = stage_key(inputs, code_version(__name__, 'trade_cube'), {'top_partners': TOP_PARTNERS})
+        if cache.is_fresh('indicators', indicators_key):
+            print("Trade indicators are up to date")
+            return outputs
+
+    history, summary = indicator_frames(TradeCube.load(cube_path), gdp_path)
+    history.to_csv(outputs[0], index=False)
+    summary.to_csv(outputs[1], index=False)
+    missing = summary.loc[summary['gdp'].isna(), 'country'].tolist()
+    print(f"Created indicators for {len(summary)} countries over {history['year'].nunique()} years"
+          + (f" (no GDP for {len(missing)}: {', '.join(missing[:5])}{'...' if len(missing) > 5 else ''})"
+             if missing else ""))
+
+    if use_cache:
+        cache.record('indicators', indicators_key, outputs)
+    return outputs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute trade indicators from the trade cube.")
+    parser.add_argument('--gdp', default=GDP_REFERENCE_PATH,
+                        help="CSV of country_code, year and gdp_usd (default: %(default)s)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="recompute even if the cube and GDP are unchanged")
+    args = parser.parse_args()
+
+    write_indicators(gdp_path=args.gdp, use_cache=not args.no_cache)
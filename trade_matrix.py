@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Indexed bilateral trade matrix.
+Holds exporter -> importer values as a dense NumPy array, or a scipy.sparse
+array once the country count grows, with a country code <-> index map built once.
+"""
+
+import numpy as np
+
+# Above this many countries the matrix is stored as scipy.sparse
+SPARSE_THRESHOLD = 1000
+
+
+class TradeMatrix:
+    """Square exporter x importer value matrix addressed by country code."""
+
+    def __init__(self, codes, values):
+        self.codes = np.asarray(codes)
+        self.index = {code: i for i, code in enumerate(self.codes.tolist())}
+        self.values = values
+        self.sparse = not isinstance(values, np.ndarray)
+        self._columns = None
+
+    @classmethod
+    def from_flows(cls, exporters, importers, values, codes=None, sparse=None):
+        """
+        Build the matrix from parallel arrays of exporter codes, importer codes
+        and values. Repeated pairs are summed in input order. `codes` fixes the
+        axis order; by default it is every code seen, sorted.
+        """
+        exporters = np.asarray(exporters, dtype=np.int64)
+        importers = np.asarray(importers, dtype=np.int64)
+        values = np.asarray(values, dtype=float)
+        if codes is None:
+            codes = np.unique(np.concatenate([exporters, importers]))
+        else:
+            codes = np.asarray(codes, dtype=np.int64)
+
+        lookup = np.argsort(codes)
+        rows = lookup[np.searchsorted(codes, exporters, sorter=lookup)]
+        cols = lookup[np.searchsorted(codes, importers, sorter=lookup)]
+
+        n = len(codes)
+        if sparse is None:
+            sparse = n > SPARSE_THRESHOLD
+        if sparse:
+            from scipy import sparse as sp
+            matrix = sp.coo_array((values, (rows, cols)), shape=(n, n)).tocsr()
+            matrix.sum_duplicates()
+        else:
+            matrix = np.zeros((n, n))
+            # np.add.at is unbuffered, so repeated pairs accumulate in input order
+            np.add.at(matrix, (rows, cols), values)
+        return cls(codes, matrix)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self.index
+
+    def get(self, exporter, importer, default=0.0):
+        """Value exported from `exporter` to `importer`."""
+        i = self.index.get(exporter)
+        j = self.index.get(importer)
+        if i is None or j is None:
+            return default
+        return float(self.values[i, j])
+
+    def row(self, code):
+        """Exports of `code` to every country, in axis order."""
+        i = self.index[code]
+        if self.sparse:
+            return self.values[[i], :].toarray()[0]
+        return self.values[i]
+
+    def column(self, code):
+        """Imports of `code` from every country, in axis order."""
+        j = self.index[code]
+        if self.sparse:
+            if self._columns is None:
+                self._columns = self.values.tocsc()
+            return self._columns[:, [j]].toarray()[:, 0]
+        return self.values[:, j]
+
+    def positions(self, codes):
+        """Axis positions of `codes`, with -1 for codes not in the matrix."""
+        return np.array([self.index.get(code, -1) for code in codes], dtype=np.int64)
+
+    def subset(self, codes):
+        """
+        Dense len(codes) x len(codes) array for `codes`, in the given order.
+        Codes not in the matrix get zero rows and columns.
+        """
+        positions = self.positions(codes)
+        present = positions >= 0
+        result = np.zeros((len(positions), len(positions)))
+        block = self.values[np.ix_(positions[present], positions[present])]
+        result[np.ix_(present, present)] = block.toarray() if self.sparse else block
+        return result
+
+    def links(self, codes):
+        """
+        (exporter, importer, value) for every positive off-diagonal cell among
+        `codes`, in row-major order of `codes`.
+        """
+        codes = list(codes)
+        block = self.subset(codes)
+        np.fill_diagonal(block, 0)
+        rows, cols = np.nonzero(block > 0)
+        return [(codes[i], codes[j], value)
+                for i, j, value in zip(rows.tolist(), cols.tolist(), block[rows, cols].tolist())]
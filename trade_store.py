@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Embedded SQLite store of the processed flows.
+Loads trade_flows_raw.csv (and commodity_flows.csv when present) into
+data/processed/trade_flows.sqlite with covering indexes, so slices such as
+one year's flows of a reporter, a partner's suppliers or the top N partners
+are answered from an index instead of a scan over every row. TradeStore is a
+small query API returning DataFrames; `query` runs ad-hoc SQL.
+"""
+
+import argparse
+import os
+import sqlite3
+
+import pandas as pd
+
+from build_cache import BuildCache, code_version, file_digest, stage_key
+
+PROCESSED_DIR = 'data/processed'
+STORE_PATH = os.path.join(PROCESSED_DIR, 'trade_flows.sqlite')
+FLOWS_PATH = os.path.join(PROCESSED_DIR, 'trade_flows_raw.csv')
+COMMODITY_FLOWS_PATH = os.path.join(PROCESSED_DIR, 'commodity_flows.csv')
+
+# Rows read from the CSVs and inserted per batch
+LOAD_CHUNK_SIZE = 200000
+
+DEFAULT_TOP_N = 10
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE countries (code INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE flows (
+    year INTEGER NOT NULL, reporter_code INTEGER NOT NULL, partner_code INTEGER NOT NULL,
+    flow TEXT NOT NULL, value REAL NOT NULL
+);
+CREATE TABLE commodity_flows (
+    year INTEGER NOT NULL, reporter_code INTEGER NOT NULL, partner_code INTEGER NOT NULL,
+    level INTEGER NOT NULL, cmd_code TEXT NOT NULL, imports REAL NOT NULL, exports REAL NOT NULL
+);
+"""
+
+# Built after loading. Every index carries the value columns, so filtered
+# slices are answered from the index alone.
+INDEXES = """
+CREATE INDEX flows_by_reporter ON flows (year, reporter_code, partner_code, flow, value);
+CREATE INDEX flows_by_partner ON flows (year, partner_code, reporter_code, flow, value);
+CREATE INDEX commodity_flows_by_reporter ON commodity_flows
+    (year, reporter_code, level, cmd_code, partner_code, imports, exports);
+CREATE INDEX commodity_flows_by_code ON commodity_flows
+    (cmd_code, year, reporter_code, partner_code, imports, exports);
+ANALYZE;
+"""
+
+
+def load_table(conn, table, path, columns, dtype=None, chunk_size=LOAD_CHUNK_SIZE):
+    """Append a CSV's `columns` to `table` in batches; returns the row count."""
+    placeholders = ', '.join('?' * len(columns))
+    statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    count = 0
+    for chunk in pd.read_csv(path, usecols=columns, dtype=dtype, chunksize=chunk_size,
+                             float_precision='round_trip'):
+        conn.executemany(statement, chunk[columns].itertuples(index=False, name=None))
+        count += len(chunk)
+    return count
+
+
+def build_store(flows_path=FLOWS_PATH, commodity_path=COMMODITY_FLOWS_PATH, path=STORE_PATH):
+    """
+    Build the store from the processed CSVs. It is written to a temporary
+    file and moved into place, so readers never see a half-built store.
+    Returns (flow rows, commodity rows).
+    """
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        # The file is discarded on failure, so skip the journal
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.executescript(SCHEMA)
+        flow_count = load_table(conn, 'flows', flows_path,
+                                ['year', 'reporter_code', 'partner_code', 'flow', 'value'])
+
+        # Names are stored once per code rather than on every flow
+        names = {}
+        for chunk in pd.read_csv(flows_path, usecols=['reporter_code', 'reporter', 'partner_code', 'partner'],
+                                 keep_default_na=False, chunksize=LOAD_CHUNK_SIZE):
+            for code, name in ('reporter_code', 'reporter'), ('partner_code', 'partner'):
+                names.update(chunk.drop_duplicates(code).set_index(code)[name].to_dict())
+        conn.executemany("INSERT INTO countries VALUES (?, ?)",
+                         ((int(code), name) for code, name in names.items()))
+
+        commodity_count = 0
+        if commodity_path and os.path.exists(commodity_path):
+            commodity_count = load_table(conn, 'commodity_flows', commodity_path,
+                                         ['year', 'reporter_code', 'partner_code', 'level', 'cmd_code',
+                                          'imports', 'exports'], dtype={'cmd_code': str})
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [('flows_digest', file_digest(flows_path))])
+        conn.executescript(INDEXES)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return flow_count, commodity_count
+
+
+def write_store(processed_dir=PROCESSED_DIR, use_cache=False):
+    """
+    Build the store from the processed CSVs in `processed_dir`.
+    With `use_cache` nothing is rebuilt while the CSVs are unchanged.
+    """
+    flows_path = os.path.join(processed_dir, os.path.basename(FLOWS_PATH))
+    commodity_path = os.path.join(processed_dir, os.path.basename(COMMODITY_FLOWS_PATH))
+    path = os.path.join(processed_dir, os.path.basename(STORE_PATH))
+    if use_cache:
+        cache = BuildCache()
+        inputs = [flows_path] + ([commodity_path] if os.path.exists(commodity_path) else [])
+        store_key = stage_key(inputs, code_version(__name__))
+        if cache.is_fresh('store', store_key):
+            print("Trade store is up to date")
+            return path
+
+    flow_count, commodity_count = build_store(flows_path, commodity_path, path)
+    print(f"Created {os.path.basename(path)} with {flow_count} flows and {commodity_count} commodity flows "
+          f"({os.path.getsize(path) / 1e6:.1f} MB)")
+
+    if use_cache:
+        cache.record('store', store_key, [path])
+    return path
+
+
+def open_store(path=STORE_PATH, flows_path=FLOWS_PATH):
+    """The store, or None if it is missing or was built from a different trade_flows_raw.csv."""
+    if not os.path.exists(path) or not os.path.exists(flows_path):
+        return None
+    store = TradeStore(path)
+    if store.meta('flows_digest') != file_digest(flows_path):
+        store.close()
+        return None
+    return store
+
+
+def where(filters):
+    """
+    SQL WHERE clause and parameters for {column: value} filters; a value may
+    be a single value or any iterable of values, and None means no filter.
+    """
+    clauses = []
+    params = []
+    for column, value in filters.items():
+        if value is None:
+            continue
+        values = [value] if isinstance(value, str) or not hasattr(value, '__iter__') else list(value)
+        # NumPy scalars are not SQLite parameters
+        values = [getattr(v, 'item', lambda: v)() for v in values]
+        clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+
+class TradeStore:
+    """Read-only queries over a store built with build_store."""
+
+    def __init__(self, path=STORE_PATH):
+        self.conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def query(self, sql, params=()):
+        """Run any SQL against the store and return the result as a DataFrame."""
+        return pd.read_sql_query(sql, self.conn, params=list(params))
+
+    def meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def years(self):
+        """Years with flows, ascending."""
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT year FROM flows ORDER BY year")]
+
+    def latest_year(self):
+        return self.conn.execute("SELECT MAX(year) FROM flows").fetchone()[0]
+
+    def flows(self, year=None, reporter=None, partner=None, flow=None):
+        """
+        Flows in the trade_flows_raw.csv layout and row order, filtered by
+        year, reporter and partner code and flow ('import' or 'export').
+        """
+        clause, params = where({'f.year': year, 'f.reporter_code': reporter,
+                                'f.partner_code': partner, 'f.flow': flow})
+        return self.query(
+            "SELECT f.year, f.reporter_code, r.name AS reporter, f.partner_code, p.name AS partner, "
+            "f.flow, f.value FROM flows f "
+            "LEFT JOIN countries r ON r.code = f.reporter_code "
+            "LEFT JOIN countries p ON p.code = f.partner_code"
+            + clause + " ORDER BY f.rowid", params)
+
+    def totals(self, year=None, reporter=None):
+        """Import and export totals per year and reporter."""
+        clause, params = where({'year': year, 'reporter_code': reporter})
+        return self.query(
+            "SELECT year, reporter_code, "
+            "SUM(CASE WHEN flow = 'import' THEN value ELSE 0 END) AS imports, "
+            "SUM(CASE WHEN flow = 'export' THEN value ELSE 0 END) AS exports "
+            "FROM flows" + clause + " GROUP BY year, reporter_code ORDER BY year, reporter_code", params)
+
+    def top_partners(self, reporter, year=None, flow='export', n=DEFAULT_TOP_N):
+        """The `n` largest partners of one reporter in a year (the latest by default), with shares."""
+        year = self.latest_year() if year is None else year
+        top = self.query(
+            "SELECT f.partner_code, c.name AS partner, SUM(f.value) AS value FROM flows f "
+            "LEFT JOIN countries c ON c.code = f.partner_code "
+            "WHERE f.year = ? AND f.reporter_code = ? AND f.flow = ? "
+            "GROUP BY f.partner_code ORDER BY value DESC LIMIT ?", (year, reporter, flow, n))
+        total = self.conn.execute("SELECT SUM(value) FROM flows WHERE year = ? AND reporter_code = ? AND flow = ?",
+                                  (year, reporter, flow)).fetchone()[0] or 0.0
+        return top.assign(share=top['value'] / total if total else 0.0)
+
+    def top_flows(self, year=None, flow='export', n=DEFAULT_TOP_N):
+        """The `n` largest bilateral flows in a year (the latest by default)."""
+        year = self.latest_year() if year is None else year
+        return self.query(
+            "SELECT f.reporter_code, r.name AS reporter, f.partner_code, p.name AS partner, f.value "
+            "FROM flows f LEFT JOIN countries r ON r.code = f.reporter_code "
+            "LEFT JOIN countries p ON p.code = f.partner_code "
+            "WHERE f.year = ? AND f.flow = ? ORDER BY f.value DESC LIMIT ?", (year, flow, n))
+
+    def commodity_flows(self, year=None, reporter=None, partner=None, level=None, code=None):
+        """Commodity flows in the commodity_flows.csv layout, filtered like `flows` and by HS level and code."""
+        clause, params = where({'year': year, 'reporter_code': reporter, 'partner_code': partner,
+                                'level': level, 'cmd_code': code})
+        return self.query(
+            "SELECT year, reporter_code, partner_code, level, cmd_code, imports, exports FROM commodity_flows"
+            + clause + " ORDER BY year, level, cmd_code, reporter_code, partner_code", params)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the SQLite store of processed flows, or query it.")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="rebuild the store even if the processed CSVs are unchanged")
+    parser.add_argument('--top-partners', type=int, metavar='CODE',
+                        help="print the top export partners of a reporter instead of building")
+    parser.add_argument('--year', type=int, help="year for --top-partners (default: latest)")
+    parser.add_argument('-n', type=int, default=DEFAULT_TOP_N)
+    args = parser.parse_args()
+
+    if args.top_partners is None:
+        write_store(use_cache=not args.no_cache)
+    else:
+        with TradeStore() as store:
+            print(store.top_partners(args.top_partners, args.year, n=args.n).to_string(index=False))
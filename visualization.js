@@ -5,86 +5,121 @@
 document.addEventListener('DOMContentLoaded', function() {
     console.log("DOM loaded, starting visualization...");
     
-    // Load the data files
-    Promise.all([
-        d3.csv('data/processed/trade_flows_raw.csv'),
-        d3.csv('data/processed/trade_summary.csv'),
-        d3.json('data/processed/trade_matrix.json'),
-        d3.json('data/processed/trade_network.json'),
-        d3.csv('data/processed/yearly_trade_summary.csv'),
-        d3.json('https://raw.githubusercontent.com/holtzy/D3-graph-gallery/master/DATA/world.geojson'),
-        d3.csv('data/processed/sector_trade_flows.csv')
-    ]).then(function(files) {
-        console.log("All data files loaded successfully");
-        const tradeFlowsData = files[0];
-        const tradeSummaryData = files[1];
-        const tradeMatrixData = files[2];
-        const tradeNetworkData = files[3];
-        const yearlyTradeData = files[4];
-        const worldGeoData = files[5];
-        const sectorTradeData = files[6];
-        
-        console.log("Trade summary data count:", tradeSummaryData.length);
-        console.log("Trade network nodes:", tradeNetworkData.nodes.length);
-        console.log("Trade matrix countries:", tradeMatrixData.countries.length);
-        console.log("Yearly trade data records:", yearlyTradeData ? yearlyTradeData.length : "Not available");
-        console.log("Sector trade data records:", sectorTradeData ? sectorTradeData.length : "Not available");
-        
-        // Calculate key economic indicators
-        calculateEconomicIndicators(tradeSummaryData, tradeMatrixData);
-        
-        // Initialize visualizations
+    // Fetch, inflate and aggregate the binary data bundle in a Web Worker (see
+    // data_worker.js), or on the main thread when workers are unavailable
+    const bundleUrl = 'data/processed/trade_bundle.bin';
+    let dataWorker = null;
+    if (useDataWorker()) {
         try {
-            createNetworkGraph(tradeNetworkData);
-            createChordDiagram(tradeMatrixData);
-            createTradeBalanceChart(tradeSummaryData);
-            createTopExportersChart(tradeSummaryData);
-            createTopImportersChart(tradeSummaryData);
-            createHistoricalTrendChart(yearlyTradeData || tradeFlowsData, tradeSummaryData);
-            createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData);
-            createSectorNetworkGraph(sectorTradeData || tradeFlowsData, 'agriculture');
-            console.log("All visualizations created successfully");
+            dataWorker = new TradeDataWorker('data_worker.js');
         } catch (error) {
-            console.error("Error creating visualizations:", error);
-            document.querySelectorAll('.chart-container').forEach(container => {
+            console.warn("Data worker unavailable, decoding on the main thread:", error);
+        }
+    }
+    const dataLoaded = dataWorker
+        ? dataWorker.loadBundle(bundleUrl).catch(error => {
+            console.warn("Data worker failed, decoding on the main thread:", error);
+            dataWorker = null;
+            return loadTradeBundle(bundleUrl);
+        })
+        : loadTradeBundle(bundleUrl);
+    
+    dataLoaded.then(function(data) {
+        console.log("Trade data bundle loaded");
+        setGdpLabels(data.indicatorHistory);
+        
+        // The world map is only fetched when the map tab is first shown: the
+        // pipeline's pre-projected topology for a zoom level (world_topology.py)
+        const worldMaps = {};
+        function loadWorldMap(zoom) {
+            if (!worldMaps[zoom]) {
+                const url = `data/processed/world_topology_z${zoom}.json`;
+                worldMaps[zoom] = (dataWorker ? dataWorker.json(url) : d3.json(url))
+                    .then(topology => topologyFeatures(topology, topology.objects.countries));
+            }
+            return worldMaps[zoom];
+        }
+        
+        function activeSectorId() {
+            const activeSectorBtn = document.querySelector('#sectors-panel .btn-group button.active');
+            return activeSectorBtn ? activeSectorBtn.id.replace('sector-', '') : 'agriculture';
+        }
+        
+        // Chart of each tab. Hidden tabs have no size to lay out in, so each chart
+        // is built when its tab is first shown, and rebuilt only after a resize.
+        const tabCharts = {
+            'network-tab': {
+                container: 'network-chart',
+                build: () => createNetworkGraph(data.tradeNetworkData, data.countryIndex)
+            },
+            'chord-tab': {
+                container: 'chord-chart',
+                build: () => createChordDiagram(data.tradeMatrixData)
+            },
+            'balance-tab': {
+                container: 'bar-chart',
+                build: () => createTradeBalanceChart(data.tradeSummaryData)
+            },
+            'history-tab': {
+                container: 'history-chart',
+                build: () => createHistoricalTrendChart(data.yearlyTradeData || data.tradeFlowsData,
+                                                        data.tradeSummaryData, data.tradeTotals,
+                                                        data.indicatorHistory, data.countryIndex)
+            },
+            'map-tab': {
+                container: 'map-chart',
+                build: () => loadWorldMap(MAP_ZOOM_LEVELS[0]).then(world => {
+                    createGeographicMap(data.tradeFlowsData, data.tradeSummaryData, world, data.countryIndex,
+                                        loadWorldMap);
+                })
+            },
+            'sectors-tab': {
+                container: 'sector-chart',
+                build: () => createSectorNetworkGraph(data.sectorTradeData || data.tradeFlowsData, activeSectorId(),
+                                                      data.sectorLayoutData, data.sectorCube)
+            }
+        };
+        const builtWidths = {};
+        
+        function showChart(tabId, force) {
+            const chart = tabCharts[tabId];
+            if (!chart) return;
+            const container = document.getElementById(chart.container);
+            if (!force && builtWidths[tabId] === container.clientWidth) return;
+            builtWidths[tabId] = container.clientWidth;
+            
+            d3.select(container).select('svg').remove();
+            const showError = error => {
+                console.error(`Error creating the ${tabId} chart:`, error);
                 container.innerHTML = '<div class="alert alert-danger">Error creating visualization: ' + error.message + '</div>';
-            });
+            };
+            try {
+                Promise.resolve(chart.build()).catch(showError);
+            } catch (error) {
+                showError(error);
+            }
         }
         
-        // Set up tab switching behavior
-        const tabs = document.querySelectorAll('button[data-bs-toggle="tab"]');
-        tabs.forEach(tab => {
+        // Build the visible tab's chart first; the page is interactive once it is drawn
+        const activeTab = document.querySelector('#vizTabs button.active');
+        showChart(activeTab ? activeTab.id : 'network-tab');
+        performance.mark('trade-interactive');
+        console.log("Initial visualization created");
+        
+        // The exporter and importer charts below the tabs are built when the browser is idle
+        whenIdle(function() {
+            try {
+                createTopExportersChart(data.tradeSummaryData);
+                createTopImportersChart(data.tradeSummaryData);
+            } catch (error) {
+                console.error("Error creating the top traders charts:", error);
+            }
+        });
+        
+        // Build or resize each tab's chart when it is shown
+        document.querySelectorAll('button[data-bs-toggle="tab"]').forEach(tab => {
             tab.addEventListener('shown.bs.tab', function(event) {
-                // Redraw charts when tab is shown to ensure proper sizing
-                if (event.target.id === 'network-tab') {
-                    // Redraw network graph
-                    d3.select('#network-chart').select('svg').remove();
-                    createNetworkGraph(tradeNetworkData);
-                } else if (event.target.id === 'chord-tab') {
-                    // Redraw chord diagram
-                    d3.select('#chord-chart').select('svg').remove();
-                    createChordDiagram(tradeMatrixData);
-                } else if (event.target.id === 'balance-tab') {
-                    // Redraw trade balance chart
-                    d3.select('#bar-chart').select('svg').remove();
-                    createTradeBalanceChart(tradeSummaryData);
-                } else if (event.target.id === 'history-tab') {
-                    // Redraw historical trend chart
-                    d3.select('#history-chart').select('svg').remove();
-                    createHistoricalTrendChart(yearlyTradeData || tradeFlowsData, tradeSummaryData);
-                } else if (event.target.id === 'map-tab') {
-                    // Redraw geographic map
-                    d3.select('#map-chart').select('svg').remove();
-                    createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData);
-                } else if (event.target.id === 'sectors-tab') {
-                    // Find the active sector button
-                    const activeSectorBtn = document.querySelector('#sectors-panel .btn-group button.active');
-                    const sectorId = activeSectorBtn ? activeSectorBtn.id.replace('sector-', '') : 'agriculture';
-                    
-                    // Redraw sector network
-                    d3.select('#sector-chart').select('svg').remove();
-                    createSectorNetworkGraph(sectorTradeData || tradeFlowsData, sectorId);
-                }
+                showChart(event.target.id);
             });
         });
         
@@ -97,24 +132,14 @@ document.addEventListener('DOMContentLoaded', function() {
                 });
                 this.classList.add('active');
                 
-                // Get sector from button ID
-                const sectorId = this.id.replace('sector-', '');
-                
                 // Redraw sector network
-                d3.select('#sector-chart').select('svg').remove();
-                createSectorNetworkGraph(sectorTradeData || tradeFlowsData, sectorId);
+                showChart('sectors-tab', true);
             });
         });
         
         // Set up show all countries checkbox
         document.getElementById('sector-show-all').addEventListener('change', function() {
-            // Find the active sector button
-            const activeSectorBtn = document.querySelector('#sectors-panel .btn-group button.active');
-            const sectorId = activeSectorBtn ? activeSectorBtn.id.replace('sector-', '') : 'agriculture';
-            
-            // Redraw sector network
-            d3.select('#sector-chart').select('svg').remove();
-            createSectorNetworkGraph(sectorTradeData || tradeFlowsData, sectorId);
+            showChart('sectors-tab', true);
         });
     }).catch(function(error) {
         console.error('Error loading data files:', error);
@@ -124,87 +149,149 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
-// Calculate economic indicators for deeper analysis
-function calculateEconomicIndicators(tradeSummaryData, tradeMatrixData) {
-    // Add trade openness (trade as % of estimated GDP - using a proxy calculation)
-    tradeSummaryData.forEach(country => {
-        // Set GDP approximations based on known data (in trillions USD)
-        // In a real implementation, this would come from actual GDP data
-        const gdpEstimates = {
-            'United States': 23.0,
-            'China': 17.7, 
-            'Japan': 5.0,
-            'Germany': 4.2,
-            'United Kingdom': 3.1,
-            'India': 3.2,
-            'France': 2.9,
-            'Italy': 2.1,
-            'Canada': 1.9,
-            'Rep. of Korea': 1.8,
-            'Australia': 1.5,
-            'Brazil': 1.8,
-            'Spain': 1.4,
-            'Mexico': 1.3,
-            'Netherlands': 1.0
-        };
-        
-        const gdp = gdpEstimates[country.country] || 1.0; // Fallback if country not found
-        const totalTrade = Number(country.exports) + Number(country.imports);
-        
-        // Calculate trade metrics
-        country.tradeOpenness = (totalTrade / (gdp * 1e12)) * 100; // Trade as % of GDP
-        country.exportRatio = Number(country.exports) / totalTrade * 100; // Exports as % of total trade
-        country.tradeBalance = Number(country.exports) - Number(country.imports);
-        country.tradeBalanceRatio = country.tradeBalance / (gdp * 1e12) * 100; // Trade balance as % of GDP
+// Workers are used unless the browser lacks them or the page has ?worker=0
+function useDataWorker() {
+    return typeof Worker !== 'undefined' && new URLSearchParams(window.location.search).get('worker') !== '0';
+}
+
+// Run `callback` once the main thread is idle
+function whenIdle(callback) {
+    if (typeof requestIdleCallback !== 'undefined') {
+        requestIdleCallback(callback, {timeout: 2000});
+    } else {
+        setTimeout(callback, 0);
+    }
+}
+
+// Most links each chart draws; the pipeline tags every link with a level of
+// detail (lod) and the chart shows the largest level that fits
+const NETWORK_LINK_BUDGET = 300;
+const MAP_LINK_BUDGET = 150;
+
+// Beyond MAP_LINK_BUDGET the map's flows are drawn by the arc layer
+// (arc_layer.js), which keeps up with this many
+const MAP_CANVAS_LINK_BUDGET = 50000;
+
+// Label and note of the GDP ratios, set by setGdpLabels once the data loads.
+// The shipped data_sources/gdp_reference.csv holds 2022 GDP only, so every
+// year's ratios divide by the same 2022 value: an approximation, labelled as such
+let GDP_LABEL = '% of GDP';
+let GDP_NOTE = '';
+
+// Build the GDP labels from the reference year of the GDP behind each year's
+// indicators (gdp_year, written by the pipeline), so they always match the data
+function setGdpLabels(indicatorHistory) {
+    const used = (indicatorHistory || []).filter(d => Number.isFinite(d.gdp_year));
+    const years = Array.from(new Set(used.map(d => d.gdp_year))).sort(d3.ascending);
+    // Some year's ratios divide by another year's GDP
+    const approximate = used.some(d => d.gdp_year !== d.year);
+    let description = 'Trade openness is trade as a share of GDP';
+    if (years.length === 1) {
+        GDP_LABEL = `% of ${years[0]} GDP`;
+        if (approximate) {
+            GDP_NOTE = `GDP ratios use constant ${years[0]} GDP for every year (an approximation)`;
+            description += `; the GDP used is the ${years[0]} value for every year, so its changes ` +
+                'follow trade volume rather than the size of each economy';
+        }
+    } else if (approximate) {
+        GDP_NOTE = `Years without GDP data use the nearest year's GDP (${years[0]}-${years[years.length - 1]}), ` +
+            'an approximation';
+        description += "; years without GDP data use the nearest year's GDP";
+    }
+    d3.select('#metric-openness').attr('title', `Trade as ${GDP_LABEL}` + (GDP_NOTE ? `: ${GDP_NOTE}` : ''));
+    d3.select('#openness-note').text(description);
+}
+
+// Zoom levels of the map, each with its own world topology detail
+// (WORLD_ZOOM_LEVELS in world_topology.py)
+const MAP_ZOOM_LEVELS = [1, 2, 4, 8];
+
+// GeoJSON features of a TopoJSON GeometryCollection of polygons, as written by
+// world_topology.py: arcs are delta-encoded on the quantization grid, and an
+// arc index ~i stands for arc i reversed
+function topologyFeatures(topology, object) {
+    const [scaleX, scaleY] = topology.transform.scale;
+    const [translateX, translateY] = topology.transform.translate;
+    const arcs = topology.arcs.map(arc => {
+        let x = 0, y = 0;
+        return arc.map(([dx, dy]) => {
+            x += dx;
+            y += dy;
+            return [x * scaleX + translateX, y * scaleY + translateY];
+        });
     });
-    
-    // Calculate trade concentration (simplified Herfindahl-Hirschman Index)
-    // For each country, analyze export and import concentration
-    if (tradeMatrixData && tradeMatrixData.matrix) {
-        const countries = tradeMatrixData.countries;
-        const matrix = tradeMatrixData.matrix;
-        
-        // For each country, calculate HHI
-        matrix.forEach((row, i) => {
-            const countryName = countries[i];
-            // Find the trade summary entry
-            const countrySummary = tradeSummaryData.find(c => c.country === countryName);
-            if (!countrySummary) return;
-            
-            // Calculate export concentration
-            const totalExports = row.reduce((sum, val) => sum + val, 0);
-            if (totalExports > 0) {
-                // Calculate normalized HHI (0-1 scale)
-                const exportHHI = row.reduce((sum, val) => {
-                    const share = val / totalExports;
-                    return sum + (share * share);
-                }, 0);
-                countrySummary.exportConcentration = exportHHI;
-            }
-            
-            // Calculate import concentration (using column data)
-            const importData = matrix.map(r => r[i]);
-            const totalImports = importData.reduce((sum, val) => sum + val, 0);
-            if (totalImports > 0) {
-                const importHHI = importData.reduce((sum, val) => {
-                    const share = val / totalImports;
-                    return sum + (share * share);
-                }, 0);
-                countrySummary.importConcentration = importHHI;
-            }
+    // Consecutive arcs of a ring share their end and start points
+    const ring = indices => {
+        const points = [];
+        indices.forEach(index => {
+            const arc = index < 0 ? arcs[~index].slice().reverse() : arcs[index];
+            if (points.length) points.pop();
+            arc.forEach(point => points.push(point));
         });
+        return points;
+    };
+    const polygon = rings => rings.map(ring);
+    return object.geometries.map(geometry => ({
+        type: 'Feature',
+        id: geometry.id,
+        properties: geometry.properties || {},
+        geometry: {
+            type: geometry.type,
+            coordinates: geometry.type === 'MultiPolygon' ? geometry.arcs.map(polygon) : polygon(geometry.arcs)
+        }
+    }));
+}
+
+// Highest level of detail whose links, with all sparser levels, fit in `budget`
+function detailLevel(links, budget) {
+    const counts = [];
+    links.forEach(link => {
+        const lod = link.lod === undefined ? 0 : link.lod;
+        counts[lod] = (counts[lod] || 0) + 1;
+    });
+    let level = 0;
+    let total = counts[0] || 0;
+    for (let lod = 1; lod < counts.length; lod++) {
+        total += counts[lod] || 0;
+        if (total > budget) break;
+        level = lod;
     }
-    
-    // Sort by trade volume
-    tradeSummaryData.sort((a, b) => {
-        return (Number(b.exports) + Number(b.imports)) - (Number(a.exports) + Number(a.imports));
+    return level;
+}
+
+// Renderer for the map's flows: ?map=svg|canvas|webgl, otherwise SVG while
+// every flow fits its budget and WebGL (or canvas) beyond it
+function mapRenderer(linkCount) {
+    const requested = new URLSearchParams(window.location.search).get('map');
+    if (['svg', 'canvas', 'webgl'].includes(requested)) return requested;
+    return linkCount <= MAP_LINK_BUDGET ? 'svg' : 'webgl';
+}
+
+// Links at or below a level of detail
+function linksAtLevel(links, level) {
+    return links.filter(link => link.lod === undefined || link.lod <= level);
+}
+
+// Warm-started simulations settle from this alpha in about 20 ticks
+const WARM_START_ALPHA = 0.1;
+const WARM_START_ALPHA_DECAY = 0.2;
+
+// Place nodes at their precomputed layout position (normalized to [0, 1]).
+// Returns true when every node has a position, so the simulation can warm-start.
+function placeNodes(nodes, positionOf, width, height) {
+    nodes.forEach(node => {
+        if (node.x !== undefined) return;
+        const position = positionOf(node);
+        if (position) {
+            node.x = position[0] * width;
+            node.y = position[1] * height;
+        }
     });
-    
-    console.log("Economic indicators calculated", tradeSummaryData);
+    return nodes.every(node => node.x !== undefined);
 }
 
 // Network Graph Visualization with Enhanced Economic Context
-function createNetworkGraph(data) {
+function createNetworkGraph(data, countryIndex) {
     console.log("Creating network graph...");
     const container = document.getElementById('network-chart');
     if (!container) {
@@ -219,7 +306,7 @@ function createNetworkGraph(data) {
     const nodeIds = new Set(data.nodes.map(node => node.id));
     console.log("Available node IDs:", Array.from(nodeIds));
     
-    const filteredLinks = data.links.filter(link => {
+    const connectedLinks = data.links.filter(link => {
         // Convert source/target to string if they're not already
         const sourceId = typeof link.source === 'object' ? link.source.id : String(link.source);
         const targetId = typeof link.target === 'object' ? link.target.id : String(link.target);
@@ -227,7 +314,11 @@ function createNetworkGraph(data) {
         return nodeIds.has(sourceId) && nodeIds.has(targetId);
     });
     
-    console.log(`Filtered links from ${data.links.length} to ${filteredLinks.length}`);
+    // Keep the densest level of detail that fits the render budget
+    const level = detailLevel(connectedLinks, NETWORK_LINK_BUDGET);
+    const filteredLinks = linksAtLevel(connectedLinks, level);
+    
+    console.log(`Filtered links from ${data.links.length} to ${filteredLinks.length} (level of detail ${level})`);
     
     // Calculate stats for better scaling
     const values = filteredLinks.map(link => link.value);
@@ -235,23 +326,9 @@ function createNetworkGraph(data) {
     const minValue = Math.min(...values);
     console.log(`Link values - min: ${minValue}, max: ${maxValue}`);
     
-    // Group nodes by region for economic analysis
-    const regions = {
-        'North America': ['USA', 'Canada', 'Mexico'],
-        'Europe': ['Germany', 'United Kingdom', 'France', 'Italy', 'Spain', 'Netherlands'],
-        'Asia-Pacific': ['China', 'Japan', 'Rep. of Korea', 'Australia', 'India'],
-        'South America': ['Brazil']
-    };
-    
-    // Assign regions to nodes
+    // Group nodes by region (from the country index, by ISO3 code) for economic analysis
     data.nodes.forEach(node => {
-        for (const [region, countries] of Object.entries(regions)) {
-            if (countries.includes(node.name)) {
-                node.region = region;
-                break;
-            }
-        }
-        node.region = node.region || 'Other';
+        node.region = countryIndex ? countryIndex.region(node.code) : 'Other';
     });
     
     // Use the filtered links with region information
@@ -280,12 +357,19 @@ function createNetworkGraph(data) {
         'Other': '#9467bd'
     };
     
+    // Start from the layout computed by the pipeline when there is one
+    const warmStart = placeNodes(simulationData.nodes,
+        node => node.layout_x !== undefined ? [node.layout_x, node.layout_y] : null, width, height);
+    
     // Create a force simulation
     const simulation = d3.forceSimulation(simulationData.nodes)
         .force('link', d3.forceLink(simulationData.links).id(d => d.id).distance(200))
         .force('charge', d3.forceManyBody().strength(-1000))
         .force('center', d3.forceCenter(width / 2, height / 2))
         .force('collision', d3.forceCollide().radius(60));
+    if (warmStart) {
+        simulation.alpha(WARM_START_ALPHA).alphaDecay(WARM_START_ALPHA_DECAY);
+    }
     
     // Create links with much thinner lines
     const link = g.append('g')
@@ -308,7 +392,7 @@ function createNetworkGraph(data) {
         .data(simulationData.nodes)
         .join('circle')
         .attr('r', 20)  // Larger nodes
-        .attr('fill', d => regionColors[d.region])
+        .attr('fill', d => regionColors[d.region] || regionColors.Other)
         .call(drag(simulation));
     
     // Add labels to nodes
@@ -354,21 +438,22 @@ function createNetworkGraph(data) {
     
     svg.call(zoom);
     
-    // Zoom controls
-    document.getElementById('network-zoom-in')?.addEventListener('click', () => {
+    // Zoom controls. Named listeners replace the previous build's on a rebuild
+    // (resize or tab re-show) instead of stacking up on the controls
+    d3.select('#network-zoom-in').on('click.network', () => {
         svg.transition().duration(500).call(zoom.scaleBy, 1.5);
     });
     
-    document.getElementById('network-zoom-out')?.addEventListener('click', () => {
+    d3.select('#network-zoom-out').on('click.network', () => {
         svg.transition().duration(500).call(zoom.scaleBy, 0.75);
     });
     
-    document.getElementById('network-reset')?.addEventListener('click', () => {
+    d3.select('#network-reset').on('click.network', () => {
         svg.transition().duration(500).call(zoom.transform, d3.zoomIdentity);
     });
     
     // Toggle labels
-    document.getElementById('show-labels')?.addEventListener('change', function() {
+    d3.select('#show-labels').on('change.network', function() {
         if (this.checked) {
             label.style('display', 'block');
         } else {
@@ -818,7 +903,7 @@ function createTradeBalanceChart(data) {
             return `${d.country} Exports:
 $${d3.format(',.2f')(d.exports / 1e12)}T
 ${d.exportRatio ? d3.format(',.1f')(d.exportRatio) + '% of total trade' : ''}
-${d.tradeOpenness ? 'Trade openness: ' + d3.format(',.1f')(d.tradeOpenness) + '% of GDP' : ''}
+${d.tradeOpenness ? 'Trade openness: ' + d3.format(',.1f')(d.tradeOpenness) + GDP_LABEL : ''}
 ${d.exportConcentration ? 'Export HHI: ' + d3.format(',.3f')(d.exportConcentration) : ''}`;
         });
     
@@ -855,7 +940,7 @@ ${d.importConcentration ? 'Import HHI: ' + d3.format(',.3f')(d.importConcentrati
             const surplusOrDeficit = d.balance > 0 ? 'Surplus' : 'Deficit';
             return `${d.country} Trade ${surplusOrDeficit}:
 $${d3.format(',.2f')(Math.abs(d.balance) / 1e12)}T
-${d.tradeBalanceRatio ? d3.format(',.1f')(d.tradeBalanceRatio) + '% of GDP' : ''}`;
+${d.tradeBalanceRatio ? d3.format(',.1f')(d.tradeBalanceRatio) + GDP_LABEL + '\n' + GDP_NOTE : ''}`;
         });
     
     // Add trade balance % of GDP markers
@@ -943,7 +1028,9 @@ ${d.tradeBalanceRatio ? d3.format(',.1f')(d.tradeBalanceRatio) + '% of GDP' : ''
     legend.append('text')
         .attr('x', 20)
         .attr('y', 78)
-        .text('% of GDP');
+        .text(GDP_LABEL)
+        .append('title')
+        .text(GDP_NOTE);
     
     // Add economic insight annotation
     const annotations = g.append('g')
@@ -965,7 +1052,7 @@ ${d.tradeBalanceRatio ? d3.format(',.1f')(d.tradeBalanceRatio) + '% of GDP' : ''
             .attr('y', y(highestSurplus.balance) - 45)
             .attr('text-anchor', 'middle')
             .attr('font-size', '10px')
-            .text(`Highest surplus: ${d3.format('.1f')(highestSurplus.tradeBalanceRatio)}% of GDP`);
+            .text(`Highest surplus: ${d3.format('.1f')(highestSurplus.tradeBalanceRatio)}${GDP_LABEL}`);
     }
     
     if (lowestDeficit && lowestDeficit.tradeBalanceRatio < 0) {
@@ -980,7 +1067,7 @@ ${d.tradeBalanceRatio ? d3.format(',.1f')(d.tradeBalanceRatio) + '% of GDP' : ''
             .attr('y', y(lowestDeficit.balance) + 60)
             .attr('text-anchor', 'middle')
             .attr('font-size', '10px')
-            .text(`Largest deficit: ${d3.format('.1f')(Math.abs(lowestDeficit.tradeBalanceRatio))}% of GDP`);
+            .text(`Largest deficit: ${d3.format('.1f')(Math.abs(lowestDeficit.tradeBalanceRatio))}${GDP_LABEL}`);
     }
     
     // Define arrow marker for annotations
@@ -1238,7 +1325,33 @@ function createTopImportersChart(data) {
 }
 
 // Historical Trade Trends Chart to track trading power over time
-function createHistoricalTrendChart(tradeData, tradeSummaryData) {
+// Yearly exports and imports of each reporter from the trade cube (or its
+// [year x reporter x flow] totals), in the shape of the yearly summary rows
+function cubeYearlyTotals(tradeCube) {
+    const totals = tradeCube.axes.includes('partner') ? tradeCube.sum('partner') : tradeCube;
+    const exportIndex = totals.indexOf('flow', 'export');
+    const importIndex = totals.indexOf('flow', 'import');
+    const rows = [];
+    totals.labels.year.forEach((year, y) => {
+        totals.names.reporter.forEach((country, r) => {
+            const exports = exportIndex < 0 ? 0 : totals.at(y, r, exportIndex);
+            const imports = importIndex < 0 ? 0 : totals.at(y, r, importIndex);
+            if (!exports && !imports) return;
+            rows.push({
+                year: year,
+                country_code: totals.labels.reporter[r],
+                country: country,
+                imports: imports,
+                exports: exports,
+                balance: exports - imports,
+                total_trade: exports + imports
+            });
+        });
+    });
+    return rows;
+}
+
+function createHistoricalTrendChart(tradeData, tradeSummaryData, tradeCube, indicatorHistory, countryIndex) {
     console.log("Creating historical trend chart...");
     const container = document.getElementById('history-chart');
     if (!container) {
@@ -1254,49 +1367,32 @@ function createHistoricalTrendChart(tradeData, tradeSummaryData) {
     
     // Process the data to get yearly trends
     // Check if we have yearly summary data or need to process raw trade flows
+    if (tradeCube) {
+        console.log("Using the year-indexed trade cube");
+        tradeData = cubeYearlyTotals(tradeCube);
+    }
     let chartData = [];
     const years = Array.from(new Set(tradeData.map(d => d.year))).sort();
     
+    // Trade openness per country and year, computed at build time (0 where GDP is unknown)
+    const openness = new Map((indicatorHistory || []).map(d => [`${d.year}:${d.country}`, d.trade_openness]));
+    const opennessOf = (year, country) => {
+        const value = openness.get(`${year}:${country}`);
+        return Number.isFinite(value) ? value : 0;
+    };
+    
     // Check if this is yearly summary data (has total_trade field)
     const isYearlySummary = tradeData.length > 0 && 'total_trade' in tradeData[0];
     
     if (isYearlySummary) {
         console.log("Using yearly summary data");
-        chartData = tradeData.map(d => {
-            // Set GDP approximations based on known data (in trillions USD)
-            const gdpEstimates = {
-                'United States': 23.0,
-                'China': 17.7, 
-                'Japan': 5.0,
-                'Germany': 4.2,
-                'United Kingdom': 3.1,
-                'India': 3.2,
-                'France': 2.9,
-                'Italy': 2.1,
-                'Canada': 1.9,
-                'Rep. of Korea': 1.8,
-                'Australia': 1.5,
-                'Brazil': 1.8,
-                'Spain': 1.4,
-                'Mexico': 1.3,
-                'Netherlands': 1.0
-            };
-            
-            // Match country names that might differ
-            const gdpCountry = Object.keys(gdpEstimates).find(c => 
-                d.country.includes(c) || c.includes(d.country)
-            );
-            
-            const gdp = (gdpCountry ? gdpEstimates[gdpCountry] : 1.0) * 1e12;
-            
-            return {
-                country: d.country,
-                year: d.year,
-                totalTradeVolume: (+d.total_trade) || (+d.imports) + (+d.exports),
-                tradeBalance: (+d.balance) || (+d.exports) - (+d.imports),
-                tradeOpenness: (((+d.total_trade) || (+d.imports) + (+d.exports)) / gdp) * 100
-            };
-        });
+        chartData = tradeData.map(d => ({
+            country: d.country,
+            year: d.year,
+            totalTradeVolume: (+d.total_trade) || (+d.imports) + (+d.exports),
+            tradeBalance: (+d.balance) || (+d.exports) - (+d.imports),
+            tradeOpenness: opennessOf(d.year, d.country)
+        }));
         
         // Filter out non-country entities and very small values
         chartData = chartData.filter(d => {
@@ -1339,36 +1435,10 @@ function createHistoricalTrendChart(tradeData, tradeSummaryData) {
             Object.keys(countryData[country]).forEach(year => {
                 const yearData = countryData[country][year];
                 
-                // GDP estimates from our existing data
-                const gdpEstimates = {
-                    'United States': 23.0,
-                    'China': 17.7, 
-                    'Japan': 5.0,
-                    'Germany': 4.2,
-                    'United Kingdom': 3.1,
-                    'India': 3.2,
-                    'France': 2.9,
-                    'Italy': 2.1,
-                    'Canada': 1.9,
-                    'Rep. of Korea': 1.8,
-                    'Australia': 1.5,
-                    'Brazil': 1.8,
-                    'Spain': 1.4,
-                    'Mexico': 1.3,
-                    'Netherlands': 1.0
-                };
-                
-                // Match country names that might differ
-                const gdpCountry = Object.keys(gdpEstimates).find(c => 
-                    country.includes(c) || c.includes(country)
-                );
-                
-                const gdp = (gdpCountry ? gdpEstimates[gdpCountry] : 1.0) * 1e12;
-                
                 // Calculate metrics
                 yearData.totalTradeVolume = yearData.imports + yearData.exports;
                 yearData.tradeBalance = yearData.exports - yearData.imports;
-                yearData.tradeOpenness = (yearData.totalTradeVolume / gdp) * 100;
+                yearData.tradeOpenness = opennessOf(year, country);
             });
         });
         
@@ -1419,23 +1489,9 @@ function createHistoricalTrendChart(tradeData, tradeSummaryData) {
     const g = svg.append('g')
         .attr('transform', `translate(${margin.left},${margin.top})`);
     
-    // Define regions for grouping
-    const regions = {
-        'North America': ['USA', 'Canada', 'Mexico'],
-        'Europe': ['Germany', 'United Kingdom', 'France', 'Italy', 'Spain', 'Netherlands'],
-        'Asia-Pacific': ['China', 'Japan', 'Rep. of Korea', 'Australia', 'India'],
-        'South America': ['Brazil']
-    };
-    
-    // Assign regions to countries
+    // Assign regions to countries (from the country index, by name)
     chartData.forEach(d => {
-        for (const [region, countries] of Object.entries(regions)) {
-            if (countries.some(c => d.country.includes(c) || c.includes(d.country))) {
-                d.region = region;
-                break;
-            }
-        }
-        d.region = d.region || 'Other';
+        d.region = countryIndex ? countryIndex.region(d.country) : 'Other';
     });
     
     // Color scale for countries
@@ -1445,9 +1501,15 @@ function createHistoricalTrendChart(tradeData, tradeSummaryData) {
     
     // Color scale for regions
     const regionColors = d3.scaleOrdinal()
-        .domain(Object.keys(regions))
+        .domain(countryIndex ? countryIndex.regionNames : ['Other'])
         .range(['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd']);
     
+    // Index the points by year and country once, so changing the metric or
+    // filter reads one slice instead of filtering every point
+    const pointsByYear = d3.group(chartData, d => +d.year);
+    const pointsByCountry = d3.group(chartData, d => d.country);
+    let regionData = null;
+    
     // Set default metric and filter
     let currentMetric = 'totalTradeVolume';
     let currentFilter = 'top5';
@@ -1458,38 +1520,40 @@ function createHistoricalTrendChart(tradeData, tradeSummaryData) {
         g.selectAll('*').remove();
         
         // Filter data based on current selection
-        let filteredData = [...chartData];
+        let filteredData = chartData;
         
         if (currentFilter === 'top5') {
             // Get top 5 countries by the currently selected metric
             const latestYear = Math.max(...years);
             const topCountries = Array.from(new Set(
-                chartData.filter(d => d.year === String(latestYear))
+                [...(pointsByYear.get(latestYear) || [])]
                     .sort((a, b) => b[currentMetric] - a[currentMetric])
                     .slice(0, 5)
                     .map(d => d.country)
             ));
             
-            filteredData = chartData.filter(d => topCountries.includes(d.country));
+            filteredData = topCountries.flatMap(country => pointsByCountry.get(country));
         } else if (currentFilter === 'regions') {
-            // Aggregate by region
-            const regionData = [];
-            
-            // Group by region and year
-            const regionGroups = d3.group(chartData, d => d.region, d => d.year);
-            
-            regionGroups.forEach((yearMap, region) => {
-                yearMap.forEach((entries, year) => {
-                    regionData.push({
-                        country: region, // Use region as country for display
-                        region: region,
-                        year: year,
-                        totalTradeVolume: d3.sum(entries, d => d.totalTradeVolume),
-                        tradeBalance: d3.sum(entries, d => d.tradeBalance),
-                        tradeOpenness: d3.mean(entries, d => d.tradeOpenness)
+            // Aggregate by region (the same for every metric, so only once)
+            if (!regionData) {
+                regionData = [];
+                
+                // Group by region and year
+                const regionGroups = d3.group(chartData, d => d.region, d => d.year);
+                
+                regionGroups.forEach((yearMap, region) => {
+                    yearMap.forEach((entries, year) => {
+                        regionData.push({
+                            country: region, // Use region as country for display
+                            region: region,
+                            year: year,
+                            totalTradeVolume: d3.sum(entries, d => d.totalTradeVolume),
+                            tradeBalance: d3.sum(entries, d => d.tradeBalance),
+                            tradeOpenness: d3.mean(entries, d => d.tradeOpenness)
+                        });
                     });
                 });
-            });
+            }
             
             filteredData = regionData;
         }
@@ -1599,7 +1663,8 @@ function createHistoricalTrendChart(tradeData, tradeSummaryData) {
                         tooltipContent += `Exports: ${formatter.format(d.totalTradeVolume / 2 + d.tradeBalance / 2)}<br>`;
                         tooltipContent += `Imports: ${formatter.format(d.totalTradeVolume / 2 - d.tradeBalance / 2)}`;
                     } else {
-                        tooltipContent += `Trade Openness: ${d.tradeOpenness.toFixed(1)}%<br>`;
+                        tooltipContent += `Trade Openness: ${d.tradeOpenness.toFixed(1)}${GDP_LABEL}<br>`;
+                        tooltipContent += `<small>${GDP_NOTE}</small><br>`;
                         tooltipContent += `Total Trade: ${formatter.format(d.totalTradeVolume)}`;
                     }
                     
@@ -1682,7 +1747,7 @@ function createHistoricalTrendChart(tradeData, tradeSummaryData) {
             case 'tradeBalance':
                 return 'Trade Balance (USD)';
             case 'tradeOpenness':
-                return 'Trade Openness (% of GDP)';
+                return `Trade Openness (${GDP_LABEL})`;
             default:
                 return metric;
         }
@@ -1719,8 +1784,9 @@ function createHistoricalTrendChart(tradeData, tradeSummaryData) {
     updateChart();
 }
 
-// Geographic Map Visualization
-function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
+// Geographic Map Visualization. `world` is the features given by
+// `loadWorldMap(zoom)`, already projected in units of the map width.
+function createGeographicMap(tradeFlowsData, tradeSummaryData, world, countryIndex, loadWorldMap) {
     console.log("Creating geographic map visualization...");
     const container = document.getElementById('map-chart');
     if (!container) {
@@ -1728,20 +1794,20 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
         return;
     }
     
+    // Remove a previous map, including its arc layer's canvases and animation
+    if (container.arcLayer) {
+        container.arcLayer.destroy();
+        container.arcLayer = null;
+    }
+    d3.select(container).selectAll('svg').remove();
+    container.style.position = 'relative';
+    
     const width = container.clientWidth;
     const height = container.clientHeight || 600;
     const margin = {top: 20, right: 20, bottom: 20, left: 20};
     const innerWidth = width - margin.left - margin.right;
     const innerHeight = height - margin.top - margin.bottom;
     
-    // Define regions for grouping
-    const regions = {
-        'North America': ['USA', 'CAN', 'MEX'],
-        'Europe': ['DEU', 'GBR', 'FRA', 'ITA', 'ESP', 'NLD'],
-        'Asia-Pacific': ['CHN', 'JPN', 'KOR', 'AUS', 'IND'],
-        'South America': ['BRA']
-    };
-    
     // Colors for regions
     const regionColors = {
         'North America': '#e74c3c',   // Bright red
@@ -1751,12 +1817,16 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
         'Other': '#9b59b6'            // Purple
     };
     
-    // Country code to ISO3 mapping based on our trade network data
-    const countryCodesISO3 = {
-        '36': 'AUS', '76': 'BRA', '124': 'CAN', '156': 'CHN', '251': 'FRA',
-        '276': 'DEU', '699': 'IND', '380': 'ITA', '392': 'JPN', '484': 'MEX',
-        '528': 'NLD', '410': 'KOR', '724': 'ESP', '826': 'GBR', '842': 'USA'
-    };
+    // Country code to ISO3 code and ISO3 code to region, from the country index
+    const countryCodesISO3 = {};
+    const countryRegions = {};
+    (countryIndex ? countryIndex.rows : []).forEach(d => {
+        if (!d.iso3) return;
+        countryCodesISO3[d.code] = d.iso3;
+        if (!(d.iso3 in countryRegions)) {
+            countryRegions[d.iso3] = d.region in regionColors ? d.region : 'Other';
+        }
+    });
     
     // Country coordinates (approximate capital or center point for better visualization)
     const countryCoordinates = {
@@ -1777,6 +1847,27 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
         'USA': [-77.03, 38.90]    // Washington DC
     };
     
+    // Map projection
+    const projection = d3.geoMercator()
+        .scale(width / 2 / Math.PI)
+        .translate([width / 2, height / 1.5]);
+    
+    // The pipeline's world topology is already in this projection (in units of
+    // the map width), so drawing it only scales and translates
+    const shapes = d3.geoIdentity().scale(width).translate([width / 2, height / 1.5]);
+    
+    // Path generator
+    const path = d3.geoPath().projection(shapes);
+    
+    // Other partners are placed at the centroid of their shape on the world map
+    const partnerPositions = {};
+    world.forEach(feature => {
+        if (feature.id && !(feature.id in countryCoordinates)) {
+            partnerPositions[feature.id] = shapes(feature.properties.centroid);
+        }
+    });
+    const positionOf = iso => iso in countryCoordinates ? projection(countryCoordinates[iso]) : partnerPositions[iso];
+    
     // Process trade flow data for the map
     const countryNames = {};
     const tradeLinks = [];
@@ -1799,43 +1890,28 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
     const years = Array.from(new Set(tradeFlowsData.map(d => d.year))).sort();
     const mostRecentYear = years[years.length - 1];
     
-    // Second pass: build trade flows between our main countries
+    // Second pass: build trade flows between countries we can place on the map
     tradeFlowsData.forEach(d => {
-        // Only use the most recent year and flows between main countries
-        if (d.year === mostRecentYear && 
-            d.reporter_code in countryCodesISO3 && 
-            d.partner_code in countryCodesISO3) {
-            
-            const sourceISO = countryCodesISO3[d.reporter_code];
-            const targetISO = countryCodesISO3[d.partner_code];
-            
-            // Skip self-trade
-            if (sourceISO === targetISO) return;
-            
-            // Get the region for each country
-            let sourceRegion = 'Other';
-            let targetRegion = 'Other';
-            
-            for (const [region, countries] of Object.entries(regions)) {
-                if (countries.includes(sourceISO)) {
-                    sourceRegion = region;
-                }
-                if (countries.includes(targetISO)) {
-                    targetRegion = region;
-                }
-            }
-            
-            tradeLinks.push({
-                source: sourceISO,
-                target: targetISO,
-                sourceName: countryNames[sourceISO],
-                targetName: countryNames[targetISO],
-                sourceRegion: sourceRegion,
-                targetRegion: targetRegion,
-                flow: d.flow,
-                value: +d.value
-            });
-        }
+        if (d.year !== mostRecentYear) return;
+        
+        const sourceISO = countryCodesISO3[d.reporter_code];
+        const targetISO = countryCodesISO3[d.partner_code];
+        if (!positionOf(sourceISO) || !positionOf(targetISO)) return;
+        
+        // Skip self-trade
+        if (sourceISO === targetISO) return;
+        
+        tradeLinks.push({
+            source: sourceISO,
+            target: targetISO,
+            sourceName: countryNames[sourceISO],
+            targetName: countryNames[targetISO],
+            sourceRegion: countryRegions[sourceISO] || 'Other',
+            targetRegion: countryRegions[targetISO] || 'Other',
+            flow: d.flow,
+            value: +d.value,
+            lod: d.lod
+        });
     });
     
     // Group by country pairs to combine import and export flows
@@ -1854,10 +1930,16 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
                 targetRegion: link.targetRegion,
                 imports: 0,
                 exports: 0,
-                total: 0
+                total: 0,
+                lod: link.lod
             };
         }
         
+        // A pair is shown as soon as either of its flows is
+        if (link.lod !== undefined) {
+            combinedLinks[pairKey].lod = Math.min(combinedLinks[pairKey].lod, link.lod);
+        }
+        
         if (link.flow === 'import') {
             // This is the target importing from source
             combinedLinks[pairKey].imports += link.value;
@@ -1869,39 +1951,146 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
         combinedLinks[pairKey].total += link.value;
     });
     
-    // Convert to array
-    const mapLinks = Object.values(combinedLinks);
+    // Convert to array, keeping the densest level of detail that fits the renderer's budget
+    const allMapLinks = Object.values(combinedLinks);
+    const renderer = mapRenderer(allMapLinks.length);
+    const linkBudget = renderer === 'svg' ? MAP_LINK_BUDGET : MAP_CANVAS_LINK_BUDGET;
+    const mapLinks = linksAtLevel(allMapLinks, detailLevel(allMapLinks, linkBudget));
     
     // Sort by total value
     mapLinks.sort((a, b) => b.total - a.total);
+    console.log(`Drawing ${mapLinks.length} of ${allMapLinks.length} map flows (${renderer})`);
     
-    // Create SVG
+    // Create SVG for the world map
     const svg = d3.select(container)
         .append('svg')
         .attr('width', width)
         .attr('height', height)
         .attr('viewBox', [0, 0, width, height]);
     
-    // Map projection
-    const projection = d3.geoMercator()
-        .scale(width / 2 / Math.PI)
-        .translate([width / 2, height / 1.5]);
+    // Draw the map background
+    const land = svg.append('g');
+    function drawLand(features) {
+        land.selectAll('path')
+            .data(features)
+            .join('path')
+            .attr('d', path)
+            .attr('fill', '#34495e')
+            .attr('stroke', '#2c3e50')
+            .attr('stroke-width', 0.5)
+            .attr('vector-effect', 'non-scaling-stroke');
+    }
+    drawLand(world);
+    let landZoom = MAP_ZOOM_LEVELS[0];
     
-    // Path generator
-    const path = d3.geoPath().projection(projection);
+    // Canvas arcs sit between the map and the country points
+    const arcLayer = renderer === 'svg' ? null : new ArcLayer(container, width, height, renderer);
+    container.arcLayer = arcLayer;
     
-    // Draw the map background
-    svg.append('g')
-        .selectAll('path')
-        .data(worldGeoData.features)
-        .join('path')
-        .attr('d', path)
-        .attr('fill', '#34495e')
-        .attr('stroke', '#2c3e50')
-        .attr('stroke-width', 0.5);
+    // Country points, labels, SVG flows and the legend go on top
+    const overlay = d3.select(container)
+        .append('svg')
+        .attr('width', width)
+        .attr('height', height)
+        .attr('viewBox', [0, 0, width, height])
+        .style('position', 'absolute')
+        .style('left', 0)
+        .style('top', 0);
     
     // Create a group for country points and trade flows
-    const g = svg.append('g');
+    const g = overlay.append('g');
+    const flowGroup = g.append('g');
+    
+    // Stroke width and animated markers of a flow, scaled by value within a reasonable range
+    const flowWidth = d => Math.max(0.5, Math.min(5, Math.log10(d.total) / 2));
+    const flowHoverWidth = d => Math.max(1, Math.min(7, Math.log10(d.total) / 2 + 2));
+    const flowDots = d => Math.min(5, Math.max(1, Math.floor(Math.log10(d.total)) - 7));
+    
+    // Format the value
+    const formatter = new Intl.NumberFormat('en-US', {
+        style: 'currency',
+        currency: 'USD',
+        notation: 'compact',
+        maximumFractionDigits: 1
+    });
+    
+    function showFlowTooltip(event, d) {
+        // Highlight the connected countries
+        d3.selectAll(`.country-point[data-country="${d.source}"], .country-point[data-country="${d.target}"]`)
+            .attr('r', 10)
+            .attr('stroke-width', 2);
+        
+        // Show tooltip
+        const tooltip = d3.select('#tooltip');
+        tooltip.transition()
+            .duration(200)
+            .style('opacity', 0.9)
+            .style('display', 'block');
+        
+        tooltip.html(`
+            <strong>${d.sourceName} ↔ ${d.targetName}</strong><br>
+            Total Trade: ${formatter.format(d.total)}<br>
+            Exports: ${formatter.format(d.exports)}<br>
+            Imports: ${formatter.format(d.imports)}
+        `)
+        .style('left', (event.pageX + 10) + 'px')
+        .style('top', (event.pageY - 28) + 'px');
+    }
+    
+    function hideFlowTooltip() {
+        // Restore country points
+        d3.selectAll('.country-point')
+            .attr('r', 7)
+            .attr('stroke-width', 1);
+        
+        // Hide tooltip
+        d3.select('#tooltip')
+            .transition()
+            .duration(500)
+            .style('opacity', 0)
+            .style('display', 'none');
+    }
+    
+    if (arcLayer) {
+        // Arc geometry is computed once per link; filters only change which arcs are drawn
+        arcLayer.setArcs(mapLinks.map(d => ({
+            source: positionOf(d.source),
+            target: positionOf(d.target),
+            color: regionColors[d.sourceRegion],
+            width: flowWidth(d),
+            hoverWidth: flowHoverWidth(d),
+            datum: d
+        })));
+        mapLinks.forEach((d, i) => d.index = i);
+        
+        // Hovered arcs come from the layer's spatial index rather than DOM events
+        overlay.on('mousemove', function(event) {
+            if (event.target.classList.contains('country-point')) return;
+            const [x, y] = d3.pointer(event);
+            const index = arcLayer.hitTest(x, y);
+            if (index === arcLayer.hovered) {
+                if (index >= 0) {
+                    d3.select('#tooltip')
+                        .style('left', (event.pageX + 10) + 'px')
+                        .style('top', (event.pageY - 28) + 'px');
+                }
+                return;
+            }
+            arcLayer.highlight(index);
+            if (index >= 0) {
+                d3.selectAll('.country-point').attr('r', 7).attr('stroke-width', 1);
+                showFlowTooltip(event, arcLayer.arcs[index].datum);
+            } else {
+                hideFlowTooltip();
+            }
+        })
+        .on('mouseleave', function() {
+            if (arcLayer.hovered >= 0) {
+                arcLayer.highlight(-1);
+                hideFlowTooltip();
+            }
+        });
+    }
     
     // Add country circles
     const countryPoints = g.selectAll('.country-point')
@@ -1911,17 +2100,7 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
         .attr('cx', d => projection(d[1])[0])
         .attr('cy', d => projection(d[1])[1])
         .attr('r', 7)
-        .attr('fill', d => {
-            // Find the region of this country
-            let region = 'Other';
-            for (const [r, countries] of Object.entries(regions)) {
-                if (countries.includes(d[0])) {
-                    region = r;
-                    break;
-                }
-            }
-            return regionColors[region];
-        })
+        .attr('fill', d => regionColors[countryRegions[d[0]] || 'Other'])
         .attr('stroke', '#000000')
         .attr('stroke-width', 1)
         .attr('data-country', d => d[0])
@@ -1974,15 +2153,15 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
     
     // Function to create trade flow paths
     function createArcPath(source, target) {
-        const sourceCoords = projection(countryCoordinates[source]);
-        const targetCoords = projection(countryCoordinates[target]);
+        const sourceCoords = positionOf(source);
+        const targetCoords = positionOf(target);
         
         const dx = targetCoords[0] - sourceCoords[0];
         const dy = targetCoords[1] - sourceCoords[1];
         const dr = Math.sqrt(dx * dx + dy * dy);
         
         // Determine if this is a major flow path
-        let arcScale = 1.5; // Default scale
+        let arcScale = ARC_RADIUS_SCALE; // Default scale
         
         // Draw a curved path between countries
         return `M${sourceCoords[0]},${sourceCoords[1]}A${dr * arcScale},${dr * arcScale} 0 0,1 ${targetCoords[0]},${targetCoords[1]}`;
@@ -1990,9 +2169,6 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
     
     // Function to draw all flows
     function drawFlows(filter) {
-        // Remove existing flows
-        g.selectAll('.trade-flow').remove();
-        
         // Filter the links based on the selected flow type
         let filteredLinks = mapLinks;
         
@@ -2011,8 +2187,18 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
             );
         }
         
+        const animate = document.getElementById('map-animate').checked;
+        if (arcLayer) {
+            arcLayer.show(filteredLinks.map(d => d.index));
+            arcLayer.animate(animate, arc => flowDots(arc.datum));
+            return;
+        }
+        
+        // Remove existing flows
+        flowGroup.selectAll('.trade-flow, .flow-dot').remove();
+        
         // Draw the links with animation path
-        const flows = g.selectAll('.trade-flow')
+        const flows = flowGroup.selectAll('.trade-flow')
             .data(filteredLinks)
             .join('path')
             .attr('class', 'trade-flow')
@@ -2022,10 +2208,7 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
                 // Use regional colors - use source region color
                 return regionColors[d.sourceRegion];
             })
-            .attr('stroke-width', d => {
-                // Scale by value, but keep a reasonable range
-                return Math.max(0.5, Math.min(5, Math.log10(d.total) / 2));
-            })
+            .attr('stroke-width', flowWidth)
             .attr('stroke-opacity', 0.6)
             .attr('data-source', d => d.source)
             .attr('data-target', d => d.target)
@@ -2033,72 +2216,31 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
                 // Highlight this flow
                 d3.select(this)
                     .attr('stroke-opacity', 1)
-                    .attr('stroke-width', d => {
-                        return Math.max(1, Math.min(7, Math.log10(d.total) / 2 + 2));
-                    });
+                    .attr('stroke-width', flowHoverWidth);
                 
-                // Highlight the connected countries
-                d3.selectAll(`.country-point[data-country="${d.source}"], .country-point[data-country="${d.target}"]`)
-                    .attr('r', 10)
-                    .attr('stroke-width', 2);
-                
-                // Format the value
-                const formatter = new Intl.NumberFormat('en-US', {
-                    style: 'currency',
-                    currency: 'USD',
-                    notation: 'compact',
-                    maximumFractionDigits: 1
-                });
-                
-                // Show tooltip
-                const tooltip = d3.select('#tooltip');
-                tooltip.transition()
-                    .duration(200)
-                    .style('opacity', 0.9)
-                    .style('display', 'block');
-                
-                tooltip.html(`
-                    <strong>${d.sourceName} ↔ ${d.targetName}</strong><br>
-                    Total Trade: ${formatter.format(d.total)}<br>
-                    Exports: ${formatter.format(d.exports)}<br>
-                    Imports: ${formatter.format(d.imports)}
-                `)
-                .style('left', (event.pageX + 10) + 'px')
-                .style('top', (event.pageY - 28) + 'px');
+                showFlowTooltip(event, d);
             })
             .on('mouseout', function() {
                 // Restore original appearance
                 d3.select(this)
                     .attr('stroke-opacity', 0.6)
-                    .attr('stroke-width', d => {
-                        return Math.max(0.5, Math.min(5, Math.log10(d.total) / 2));
-                    });
+                    .attr('stroke-width', flowWidth);
                 
-                // Restore country points
-                d3.selectAll('.country-point')
-                    .attr('r', 7)
-                    .attr('stroke-width', 1);
-                
-                // Hide tooltip
-                d3.select('#tooltip')
-                    .transition()
-                    .duration(500)
-                    .style('opacity', 0)
-                    .style('display', 'none');
+                hideFlowTooltip();
             });
         
         // If animation is checked, add moving dots along the paths
-        if (document.getElementById('map-animate').checked) {
+        if (animate) {
             // Add animated dots
             flows.each(function(d) {
                 const path = d3.select(this);
                 const pathLength = path.node().getTotalLength();
                 
                 // Add animated flow markers
-                const numDots = Math.min(5, Math.max(1, Math.floor(Math.log10(d.total)) - 7));
+                const numDots = flowDots(d);
                 
                 for (let i = 0; i < numDots; i++) {
-                    g.append('circle')
+                    flowGroup.append('circle')
                         .attr('class', 'flow-dot')
                         .attr('r', 3)
                         .attr('fill', regionColors[d.sourceRegion])
@@ -2127,8 +2269,30 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
     // Draw flows initially
     drawFlows('all');
     
+    // Pan and zoom the map, points and flows together; once a zoom ends the
+    // land is redrawn from the topology detailed enough for the new scale
+    overlay.call(d3.zoom()
+        .scaleExtent([MAP_ZOOM_LEVELS[0], MAP_ZOOM_LEVELS[MAP_ZOOM_LEVELS.length - 1]])
+        .on('zoom', function(event) {
+            land.attr('transform', event.transform);
+            g.attr('transform', event.transform);
+            if (arcLayer) {
+                arcLayer.setTransform(event.transform);
+            }
+        })
+        .on('end', function(event) {
+            const zoom = MAP_ZOOM_LEVELS.find(level => level >= event.transform.k - 1e-6);
+            if (zoom === landZoom) return;
+            landZoom = zoom;
+            loadWorldMap(zoom).then(detail => {
+                if (landZoom === zoom) {
+                    drawLand(detail);
+                }
+            });
+        }));
+    
     // Add legend
-    const legend = svg.append('g')
+    const legend = overlay.append('g')
         .attr('transform', `translate(20, 20)`);
     
     // Add title
@@ -2156,26 +2320,26 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
             .text(region);
     });
     
-    // Set up event handlers for controls
-    document.getElementById('map-show-all').addEventListener('click', function() {
+    // Set up event handlers for controls (named, so a rebuilt map replaces them)
+    d3.select('#map-show-all').on('click.map', function() {
         document.querySelectorAll('#map-panel .btn-group button').forEach(btn => btn.classList.remove('active'));
         this.classList.add('active');
         drawFlows('all');
     });
     
-    document.getElementById('map-show-exports').addEventListener('click', function() {
+    d3.select('#map-show-exports').on('click.map', function() {
         document.querySelectorAll('#map-panel .btn-group button').forEach(btn => btn.classList.remove('active'));
         this.classList.add('active');
         drawFlows('exports');
     });
     
-    document.getElementById('map-show-imports').addEventListener('click', function() {
+    d3.select('#map-show-imports').on('click.map', function() {
         document.querySelectorAll('#map-panel .btn-group button').forEach(btn => btn.classList.remove('active'));
         this.classList.add('active');
         drawFlows('imports');
     });
     
-    document.getElementById('map-country-filter').addEventListener('change', function() {
+    d3.select('#map-country-filter').on('change.map', function() {
         // Get the current flow type
         let flowType = 'all';
         if (document.getElementById('map-show-exports').classList.contains('active')) {
@@ -2187,7 +2351,7 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
         drawFlows(flowType);
     });
     
-    document.getElementById('map-animate').addEventListener('change', function() {
+    d3.select('#map-animate').on('change.map', function() {
         // Get the current flow type
         let flowType = 'all';
         if (document.getElementById('map-show-exports').classList.contains('active')) {
@@ -2202,7 +2366,7 @@ function createGeographicMap(tradeFlowsData, tradeSummaryData, worldGeoData) {
 }
 
 // Sector-Based Network Graph
-function createSectorNetworkGraph(tradeData, sectorFilter) {
+function createSectorNetworkGraph(tradeData, sectorFilter, sectorLayout, sectorCube) {
     console.log(`Creating sector network graph for ${sectorFilter}...`);
     const container = document.getElementById('sector-chart');
     if (!container) {
@@ -2214,7 +2378,8 @@ function createSectorNetworkGraph(tradeData, sectorFilter) {
     const height = container.clientHeight || 600;
     
     // Check if we have sector-specific data or need to simulate it
-    const hasSectorData = tradeData.length > 0 && 'sector' in tradeData[0];
+    const hasSectorCube = sectorCube && sectorCube.indexOf('sector', sectorFilter) >= 0;
+    const hasSectorData = hasSectorCube || (tradeData.length > 0 && 'sector' in tradeData[0]);
     
     // Process the data for the network graph
     let nodes = [];
@@ -2222,16 +2387,24 @@ function createSectorNetworkGraph(tradeData, sectorFilter) {
     const nodeMap = new Map();
     
     if (hasSectorData) {
-        console.log("Using actual sector data");
-        // Filter by sector
-        const filteredData = tradeData.filter(d => d.sector === sectorFilter);
-        
-        // Get the most recent year
-        const years = Array.from(new Set(filteredData.map(d => d.year))).sort();
-        const mostRecentYear = years[years.length - 1];
-        
-        // Further filter by most recent year
-        const yearData = filteredData.filter(d => d.year === mostRecentYear);
+        let yearData;
+        if (hasSectorCube) {
+            console.log("Using the sector cube");
+            // The most recent year's reporter x partner block of this sector, read without a row scan
+            const years = sectorCube.labels.year;
+            yearData = sectorCube.slice({sector: sectorFilter, year: years[years.length - 1]}).cells();
+        } else {
+            console.log("Using actual sector data");
+            // Filter by sector
+            const filteredData = tradeData.filter(d => d.sector === sectorFilter);
+            
+            // Get the most recent year
+            const years = Array.from(new Set(filteredData.map(d => d.year))).sort();
+            const mostRecentYear = years[years.length - 1];
+            
+            // Further filter by most recent year
+            yearData = filteredData.filter(d => d.year === mostRecentYear);
+        }
         
         // Build nodes from unique countries
         const countries = new Set();
@@ -2415,12 +2588,19 @@ function createSectorNetworkGraph(tradeData, sectorFilter) {
         .domain([minValue, maxValue])
         .range([5, 30]);
     
+    // Start from the sector's precomputed layout when there is one
+    const layout = sectorLayout && sectorLayout[sectorFilter];
+    const warmStart = layout && placeNodes(nodes, node => layout[node.id], width, height);
+    
     // Create a force simulation
     const simulation = d3.forceSimulation(nodes)
         .force('link', d3.forceLink(links).id(d => d.id).distance(150))
         .force('charge', d3.forceManyBody().strength(-800))
         .force('center', d3.forceCenter(width / 2, height / 2))
         .force('collision', d3.forceCollide().radius(d => Math.max(30, sizeScale(d.value))));
+    if (warmStart) {
+        simulation.alpha(WARM_START_ALPHA).alphaDecay(WARM_START_ALPHA_DECAY);
+    }
     
     // Create links
     const link = svg.append('g')
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Local world map asset for the geographic map.
+Converts data_sources/world.geojson (Natural Earth 1:110m admin-0 countries,
+public domain, with ISO3 ids) into quantized TopoJSON, one file per map zoom
+level, so the page loads a small local file with no remote dependency.
+Coordinates are pre-projected to the map's Mercator projection (in units of
+the map width), so the browser only scales and translates them. Shared
+borders are stored once as arcs, and each zoom level keeps only the points
+that are visible at that scale (Visvalingam simplification). Features keep
+just their ISO3 id and a label centroid.
+"""
+
+import argparse
+import heapq
+import json
+import os
+
+import numpy as np
+
+from build_cache import BuildCache, code_version, stage_key
+
+PROCESSED_DIR = 'data/processed'
+WORLD_GEOJSON_PATH = 'data_sources/world.geojson'
+
+# Zoom levels of the map (its d3.zoom scale extent is [1, 8])
+WORLD_ZOOM_LEVELS = (1, 2, 4, 8)
+
+# Points that move the outline by less than this many pixels are dropped,
+# for a map this wide at zoom 1
+WORLD_REFERENCE_WIDTH = 1200
+WORLD_TOLERANCE = 0.5
+
+# Integer grid the topology is built on
+WORLD_QUANTIZATION = 100000
+
+# Mercator is unbounded at the poles; latitudes are clamped like d3.geoMercator's clip
+MAX_LATITUDE = 85.0511287798
+
+
+def world_topology_path(zoom, processed_dir=PROCESSED_DIR):
+    """Path of the topology for one zoom level."""
+    return os.path.join(processed_dir, f'world_topology_z{zoom}.json')
+
+
+def project(coordinates):
+    """
+    Project [lon, lat] degrees to the map's Mercator in units of the map
+    width: d3.geoMercator().scale(width / 2 / Math.PI) puts a point at
+    width * project(point) + translate.
+    """
+    coordinates = np.asarray(coordinates, dtype=float)
+    lon = np.radians(coordinates[..., 0])
+    lat = np.radians(np.clip(coordinates[..., 1], -MAX_LATITUDE, MAX_LATITUDE))
+    return np.stack([lon, -np.log(np.tan(np.pi / 4 + lat / 2))], axis=-1) / (2 * np.pi)
+
+
+def read_world_geojson(path=WORLD_GEOJSON_PATH):
+    """Load the world GeoJSON."""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def feature_polygons(feature):
+    """A feature's polygons as lists of [lon, lat] rings."""
+    geometry = feature.get('geometry') or {}
+    if geometry.get('type') == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry.get('type') == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+
+def ring_area(ring):
+    """Signed shoelace area of a closed (n, 2) ring."""
+    x, y = ring[:-1, 0], ring[:-1, 1]
+    return (np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2
+
+
+def label_point(polygons):
+    """Area centroid of the largest projected outer ring."""
+    ring = max((polygon[0] for polygon in polygons), key=lambda r: abs(ring_area(r)))
+    area = ring_area(ring)
+    if area == 0:
+        return ring[:-1].mean(axis=0)
+    x, y = ring[:, 0], ring[:, 1]
+    cross = x[:-1] * y[1:] - x[1:] * y[:-1]
+    return np.array([((x[:-1] + x[1:]) * cross).sum(), ((y[:-1] + y[1:]) * cross).sum()]) / (6 * area)
+
+
+def quantize_rings(rings, origin, step):
+    """Snap rings to the integer grid, dropping repeated points and rings left with no area."""
+    quantized = []
+    for ring in rings:
+        points = np.round((ring - origin) / step).astype(np.int64)
+        keep = np.ones(len(points), dtype=bool)
+        keep[1:] = (points[1:] != points[:-1]).any(axis=1)
+        points = points[keep]
+        if len(points) >= 4:
+            quantized.append([tuple(point) for point in points.tolist()])
+    return quantized
+
+
+def find_junctions(rings):
+    """Points where rings meet or part: shared with different neighbours in different rings."""
+    neighbours = {}
+    junctions = set()
+    for ring in rings:
+        n = len(ring) - 1
+        for i in range(n):
+            pair = tuple(sorted((ring[i - 1 if i else n - 1], ring[i + 1])))
+            seen = neighbours.setdefault(ring[i], pair)
+            if seen != pair:
+                junctions.add(ring[i])
+    return junctions
+
+
+def cut_ring(ring, junctions):
+    """Split a closed ring into arcs between junctions (the whole ring if it has none)."""
+    points = ring[:-1]
+    cuts = [i for i, point in enumerate(points) if point in junctions]
+    if not cuts:
+        # Start isolated rings at their smallest point, so shared rings dedupe
+        start = points.index(min(points))
+        rotated = points[start:] + points[:start]
+        return [rotated + [rotated[0]]]
+    rotated = points[cuts[0]:] + points[:cuts[0]] + [points[cuts[0]]]
+    offsets = [i - cuts[0] for i in cuts] + [len(points)]
+    return [rotated[start:end + 1] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def effective_areas(points):
+    """
+    Visvalingam effective area of each point of an arc: the triangle it forms
+    with its neighbours when it is removed, never less than any area removed
+    before it. Endpoints get infinity.
+    """
+    n = len(points)
+    areas = np.full(n, np.inf)
+    if n < 3:
+        return areas
+    coords = np.asarray(points, dtype=float)
+    previous = list(range(-1, n - 1))
+    following = list(range(1, n + 1))
+
+    def triangle(i):
+        (ax, ay), (bx, by), (cx, cy) = coords[previous[i]], coords[i], coords[following[i]]
+        return abs((bx - ax) * (cy - ay) - (cx - ax) * (by - ay)) / 2
+
+    heap = [(triangle(i), i) for i in range(1, n - 1)]
+    current = {i: area for area, i in heap}
+    heapq.heapify(heap)
+    largest = 0.0
+    while heap:
+        area, i = heapq.heappop(heap)
+        if current.get(i) != area:
+            continue
+        del current[i]
+        largest = max(largest, area)
+        areas[i] = largest
+        before, after = previous[i], following[i]
+        following[before] = after
+        previous[after] = before
+        for j in (before, after):
+            if j in current:
+                current[j] = triangle(j)
+                heapq.heappush(heap, (current[j], j))
+    return areas
+
+
+def build_topology(geojson):
+    """
+    Project, quantize and cut the GeoJSON into shared arcs. Returns the arcs
+    (lists of integer points), each arc's effective areas, the geometries
+    (referencing arcs by index, ~index when reversed), the grid origin and step.
+    """
+    features = []
+    for feature in geojson['features']:
+        polygons = [[project(ring) for ring in polygon] for polygon in feature_polygons(feature)]
+        if polygons:
+            features.append((feature.get('id'), polygons))
+
+    all_points = np.concatenate([ring for _, polygons in features for polygon in polygons for ring in polygon])
+    origin = all_points.min(axis=0)
+    step = (all_points.max(axis=0) - origin) / (WORLD_QUANTIZATION - 1)
+
+    quantized = [(feature_id, polygons, [quantize_rings(polygon, origin, step) for polygon in polygons])
+                 for feature_id, polygons in features]
+    junctions = find_junctions([ring for _, _, rings in quantized for polygon in rings for ring in polygon])
+
+    arcs = []
+    arc_ids = {}
+
+    def arc_index(points):
+        key = tuple(points)
+        if key in arc_ids:
+            return arc_ids[key]
+        reverse = key[::-1]
+        if reverse in arc_ids:
+            return ~arc_ids[reverse]
+        arc_ids[key] = len(arcs)
+        arcs.append(points)
+        return arc_ids[key]
+
+    geometries = []
+    for feature_id, polygons, rings in quantized:
+        polygon_arcs = [[[arc_index(arc) for arc in cut_ring(ring, junctions)] for ring in polygon]
+                        for polygon in rings if polygon]
+        if not polygon_arcs:
+            continue
+        geometry = {'type': 'MultiPolygon', 'arcs': polygon_arcs} if len(polygon_arcs) > 1 else \
+            {'type': 'Polygon', 'arcs': polygon_arcs[0]}
+        if feature_id is not None:
+            geometry['id'] = feature_id
+        geometry['properties'] = {'centroid': [round(float(v), 6) for v in label_point(polygons)]}
+        geometries.append(geometry)
+
+    areas = [effective_areas(arc) for arc in arcs]
+    return arcs, areas, geometries, origin, step
+
+
+def level_topology(arcs, areas, geometries, origin, step, zoom):
+    """
+    TopoJSON for one zoom level: points whose effective area is below the
+    tolerance at that zoom are dropped, and the grid is coarsened to the
+    tolerance (arcs are delta-encoded on it).
+    """
+    tolerance = WORLD_TOLERANCE / (WORLD_REFERENCE_WIDTH * zoom)
+    # Grid cells of at most half the tolerance, in whole multiples of the base grid
+    factor = max(1, int(tolerance / 2 / step.max()))
+    threshold = (tolerance / step.max()) ** 2
+
+    encoded = []
+    for points, point_areas in zip(arcs, areas):
+        keep = point_areas >= threshold
+        if points[0] == points[-1]:
+            # Keep closed rings at least a triangle
+            keep[np.argsort(point_areas[1:-1])[-2:] + 1] = True
+        coarse = (np.asarray(points)[keep] + factor // 2) // factor
+        distinct = np.ones(len(coarse), dtype=bool)
+        distinct[1:] = (coarse[1:] != coarse[:-1]).any(axis=1)
+        distinct[-1] = True
+        coarse = coarse[distinct]
+        delta = np.vstack([coarse[:1], np.diff(coarse, axis=0)])
+        encoded.append(delta.tolist())
+
+    scale = step * factor
+    return {
+        'type': 'Topology',
+        'transform': {'scale': [float(v) for v in scale], 'translate': [float(v) for v in origin]},
+        'objects': {'countries': {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': encoded,
+    }
+
+
+def write_world_topology(processed_dir=PROCESSED_DIR, source=WORLD_GEOJSON_PATH, use_cache=False):
+    """
+    Write the topology for every zoom level and return the paths written.
+    With `use_cache` nothing is rebuilt while the source is unchanged.
+    """
+    outputs = [world_topology_path(zoom, processed_dir) for zoom in WORLD_ZOOM_LEVELS]
+    if use_cache:
+        cache = BuildCache()
+        world_key = stage_key([source], code_version(__name__),
+                              {'zoom_levels': WORLD_ZOOM_LEVELS, 'width': WORLD_REFERENCE_WIDTH,
+                               'tolerance': WORLD_TOLERANCE, 'quantization': WORLD_QUANTIZATION})
+        if cache.is_fresh('world', world_key):
+            print("World map topology is up to date")
+            return outputs
+
+    arcs, areas, geometries, origin, step = build_topology(read_world_geojson(source))
+    for zoom, path in zip(WORLD_ZOOM_LEVELS, outputs):
+        topology = level_topology(arcs, areas, geometries, origin, step, zoom)
+        with open(path, 'w') as f:
+            json.dump(topology, f, separators=(',', ':'))
+        print(f"Created {os.path.basename(path)} with {sum(len(arc) for arc in topology['arcs'])} points "
+              f"({os.path.getsize(path) / 1e3:.1f} kB)")
+
+    if use_cache:
+        cache.record('world', world_key, outputs)
+    return outputs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the pre-projected world map topology for the frontend.")
+    parser.add_argument('--source', default=WORLD_GEOJSON_PATH,
+                        help="world GeoJSON to convert (default: %(default)s)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="rebuild the topology even if the source is unchanged")
+    args = parser.parse_args()
+
+    write_world_topology(source=args.source, use_cache=not args.no_cache)